@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Storage for the raw html pages. Pages can either be stored as one file per article (the original format), or in
+append-only compressed shards.
+
+If the zstandard package is installed, shards are compressed with zstd, otherwise with zlib.
+"""
+import logging
+import os
+import struct
+import threading
+import zlib
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+FORMAT_HTML = "html"
+FORMAT_SHARDS = "shards"
+FORMATS = [FORMAT_HTML, FORMAT_SHARDS]
+
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+# id, codec, compressed length
+_RECORD_HEADER = struct.Struct("<qBI")
+# id, shard, offset of the record, compressed length, uncompressed length
+_INDEX_ENTRY = struct.Struct("<qIQII")
+
+
+def normalize_newlines(content):
+    """
+    Newlines as they are returned when reading html files in text mode, so pages give the same features regardless
+    of where they are read from
+    """
+    return content.replace("\r\n", "\n").replace("\r", "\n")
+
+
+class DirectoryStore(object):
+    """
+    One html file per article: <directory>/<id>.html
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, identifier):
+        return os.path.join(self.directory, f"{identifier}.html")
+
+    def put(self, identifier, content):
+        path = self.path(identifier)
+        logger.info(f"Saving to {path}")
+        with open(path, "w") as f:
+            f.write(str(content))
+
+    def get(self, identifier) -> str:
+        with open(self.path(identifier), "r") as f:
+            return f.read()
+
+    def exists(self, identifier) -> bool:
+        return os.path.exists(self.path(identifier))
+
+    def size(self, identifier) -> int:
+        return os.path.getsize(self.path(identifier))
+
+    def fingerprint(self, identifier) -> str:
+        """
+        Changes whenever the file is written again, without reading it
+        """
+        stat = os.stat(self.path(identifier))
+        return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+    def ids(self):
+        ids = []
+        for f in os.listdir(self.directory):
+            name, ext = os.path.splitext(f)
+            if ext == ".html" and name.isdigit():
+                ids.append(int(name))
+
+        ids.sort()
+        return ids
+
+    def close(self):
+        pass
+
+
+class ShardStore(object):
+    """
+    Append-only shards of individually compressed pages, so single articles can be read without decompressing
+    the whole shard. The index file maps each id to the position of its latest record.
+
+    Records are only ever appended, updating an article appends a new record.
+    """
+
+    def __init__(self, directory, max_shard_size=256 * 1024 * 1024, compression_level=None):
+        self.directory = directory
+        self.max_shard_size = max_shard_size
+        self.codec = CODEC_ZSTD if ZSTD_AVAILABLE else CODEC_ZLIB
+        self.compression_level = compression_level
+
+        self._lock = threading.Lock()
+        self._index = {}
+        self._read_fds = {}
+        self._shard = None
+        self._shard_file = None
+        self._index_file = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _shard_path(self, shard):
+        return os.path.join(self.directory, f"shard-{shard:05d}.dat")
+
+    def _index_path(self):
+        return os.path.join(self.directory, "index.dat")
+
+    def _load_index(self):
+        path = self._index_path()
+        if not os.path.exists(path):
+            return
+
+        with open(path, "rb") as f:
+            data = f.read()
+
+        # ignore a partially written entry at the end
+        n = len(data) // _INDEX_ENTRY.size
+        for identifier, shard, offset, length, raw_size in _INDEX_ENTRY.iter_unpack(data[:n * _INDEX_ENTRY.size]):
+            self._index[identifier] = (shard, offset, length, raw_size)
+
+        logger.info(f"Shard index contains {len(self._index)} articles")
+
+    def _compress(self, data):
+        if self.codec == CODEC_ZSTD:
+            level = self.compression_level or 9
+            return zstandard.ZstdCompressor(level=level).compress(data)
+
+        level = self.compression_level or 6
+        return zlib.compress(data, level)
+
+    @staticmethod
+    def _decompress(codec, data):
+        if codec == CODEC_ZSTD:
+            if not ZSTD_AVAILABLE:
+                raise RuntimeError("Shard was compressed with zstd. Install the zstandard package.")
+            return zstandard.ZstdDecompressor().decompress(data)
+
+        return zlib.decompress(data)
+
+    def _open_for_append(self, size):
+        if self._shard_file is None:
+            shards = [s for s, _, _, _ in self._index.values()]
+            self._shard = max(shards) if shards else 0
+            self._shard_file = open(self._shard_path(self._shard), "ab")
+            self._index_file = open(self._index_path(), "ab")
+
+        if self._shard_file.tell() > 0 and self._shard_file.tell() + size > self.max_shard_size:
+            self._shard_file.close()
+            self._shard += 1
+            logger.info(f"Starting shard {self._shard}")
+            self._shard_file = open(self._shard_path(self._shard), "ab")
+
+    def put(self, identifier, content):
+        raw = str(content).encode("utf-8")
+        data = self._compress(raw)
+
+        with self._lock:
+            self._open_for_append(_RECORD_HEADER.size + len(data))
+            offset = self._shard_file.tell()
+            self._shard_file.write(_RECORD_HEADER.pack(identifier, self.codec, len(data)))
+            self._shard_file.write(data)
+            self._shard_file.flush()
+
+            # the index entry is written after the record, so it never points to incomplete data
+            self._index_file.write(_INDEX_ENTRY.pack(identifier, self._shard, offset, len(data), len(raw)))
+            self._index_file.flush()
+            self._index[identifier] = (self._shard, offset, len(data), len(raw))
+
+        logger.info(f"Saved {identifier} to shard {self._shard}")
+
+    def _read_fd(self, shard):
+        fd = self._read_fds.get(shard)
+        if fd is None:
+            fd = os.open(self._shard_path(shard), os.O_RDONLY)
+            self._read_fds[shard] = fd
+        return fd
+
+    def get(self, identifier) -> str:
+        shard, offset, length, _ = self._index[identifier]
+        record = os.pread(self._read_fd(shard), _RECORD_HEADER.size + length, offset)
+        _, codec, _ = _RECORD_HEADER.unpack_from(record)
+        return normalize_newlines(self._decompress(codec, record[_RECORD_HEADER.size:]).decode("utf-8"))
+
+    def exists(self, identifier) -> bool:
+        return identifier in self._index
+
+    def size(self, identifier) -> int:
+        """
+        Uncompressed size of the page
+        """
+        return self._index[identifier][3]
+
+    def fingerprint(self, identifier) -> str:
+        """
+        Changes whenever the article is updated, since updates are appended as new records
+        """
+        shard, offset, _, raw_size = self._index[identifier]
+        return f"{shard}-{offset}-{raw_size}"
+
+    def ids(self):
+        """
+        Ids in storage order, so reading them one after another results in sequential io
+        """
+        return sorted(self._index, key=lambda i: self._index[i][:2])
+
+    def close(self):
+        with self._lock:
+            if self._shard_file is not None:
+                self._shard_file.close()
+                self._index_file.close()
+                self._shard_file = None
+                self._index_file = None
+
+            for fd in self._read_fds.values():
+                os.close(fd)
+            self._read_fds = {}
+
+
+# stores opened by the current process
+_stores = {}
+
+
+def open_store(store_format, path):
+    """
+    Opens the store with the given format. Stores are cached per process, so workers can pass format and path
+    instead of the store itself.
+    """
+    key = (store_format, os.path.abspath(path))
+    store = _stores.get(key)
+
+    if store is None:
+        if store_format == FORMAT_HTML:
+            store = DirectoryStore(path)
+        elif store_format == FORMAT_SHARDS:
+            store = ShardStore(path)
+        else:
+            raise ValueError(f"Unknown format: '{store_format}'")
+
+        _stores[key] = store
+
+    return store
@@ -19,9 +19,16 @@ DIR_DATA = os.path.join(DIR_ROOT, "data")
 
 DIR_RAW = os.path.join(DIR_DATA, "raw")
 DIR_RAW_HTML = os.path.join(DIR_RAW, "html")
+DIR_RAW_SHARDS = os.path.join(DIR_RAW, "shards")
 DIR_RAW_DNB = os.path.join(DIR_RAW, "dnb-cache")
+PATH_MANIFEST = os.path.join(DIR_RAW, "manifest.sqlite")
+PATH_PARSE_CACHE = os.path.join(DIR_RAW, "parse-cache.sqlite")
 
 DIR_PROCESSED = os.path.join(DIR_DATA, "processed")
+PATH_PARSE_FAILURES = os.path.join(DIR_PROCESSED, "parse-failures.csv")
+PATH_REVIEWS_CSV = os.path.join(DIR_PROCESSED, "reviews.csv")
+PATH_REVIEWS_PICKLE = os.path.join(DIR_PROCESSED, "reviews.pkl")
+PATH_REVIEWS_PARQUET = os.path.join(DIR_PROCESSED, "reviews.parquet")
 DIR_INTERIM = os.path.join(DIR_DATA, "interim")
 DIR_REPORT = os.path.join(DIR_DATA, "report")
 DIR_EXTERNAL = os.path.join(DIR_DATA, "external")
@@ -64,7 +71,8 @@ topic_clusters = {
 
 LOGGING_CONFIG = {
     'version': 1,
-    'disable_existing_loggers': True,
+    # modules apply this config when they are imported, the loggers of modules imported before stay enabled
+    'disable_existing_loggers': False,
     'formatters': {
         'standard': {
             'format': '[%(levelname)s][%(processName)s] %(asctime)s - %(name)s: %(message)s'
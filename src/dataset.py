@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar storage of the processed reviews in Parquet, with typed columns and list columns for keywords, links,
+headings etc. Rows are appended in row groups while reviews are processed, so they do not have to be held in memory.
+
+Columns with few distinct values (gender, publisher, category, ...) are dictionary encoded and loaded as pandas
+categoricals, see encode_categoricals. Academic titles are stored as small integers and loaded as an ordered
+categorical of AcademicTitleCategory, so filters like `df[Review.REVIEWER_HIGHEST_TITLE] == AcademicTitleCategory.prof`
+compare codes instead of calling __eq__ for each row.
+
+Requires the pyarrow package.
+"""
+import logging
+
+import numpy as np
+import pandas
+
+from constants import ALL_GENDERS
+from db import Review, ReviewBatch
+from utils import AcademicTitleCategory
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# academic titles are stored as the value of the enum
+_TITLE_COLUMNS = {Review.REVIEWER_HIGHEST_TITLE}
+_TITLE_LIST_COLUMNS = {Review.REVIEWER_TITLE}
+
+# columns with few distinct values
+CATEGORICAL_COLUMNS = [Review.REVIEWER_NAME, Review.REVIEWER_GENDER, Review.REVIEWER_MARKER, Review.CATEGORY,
+                       Review.PRICE_UNIT, Review.PUBLISHER]
+
+# ordered by value, so the code of each title is its value
+TITLE_DTYPE = pandas.CategoricalDtype(sorted(AcademicTitleCategory, key=lambda t: t.value), ordered=True)
+GENDER_DTYPE = pandas.CategoricalDtype(ALL_GENDERS)
+
+
+def _column_types():
+    string = pyarrow.string()
+    strings = pyarrow.list_(string)
+    categorical = pyarrow.dictionary(pyarrow.int32(), string)
+
+    return {
+        Review.ID: pyarrow.int64(),
+        Review.NOT_FOUND: pyarrow.bool_(),
+        Review.PARSED_SUCCESS: pyarrow.bool_(),
+        Review.DATE: pyarrow.timestamp("s"),
+        Review.DATE_ACCESS: pyarrow.timestamp("s"),
+        Review.TITLE: string,
+        Review.CATEGORY: categorical,
+        Review.TEXT: string,
+        Review.HEADINGS: strings,
+        Review.WORD_COUNT: pyarrow.int64(),
+        Review.LINKS: strings,
+        Review.DNB_LINK: string,
+
+        Review.REVIEWER_NAME: categorical,
+        Review.REVIEWER_GENDER: categorical,
+        Review.REVIEWER_MARKER: categorical,
+        Review.REVIEWER_TITLE: pyarrow.list_(pyarrow.int8()),
+        Review.REVIEWER_HIGHEST_TITLE: pyarrow.int8(),
+        Review.REVIEWER_DESC: string,
+        Review.REVIEWER_LOCATION: strings,
+        Review.REVIEWER_ID: pyarrow.int64(),
+
+        Review.AUTHORS_NAME: strings,
+        Review.AUTHORS_PROFESSION: strings,
+        Review.AUTHORS_COUNTRY: strings,
+        Review.AUTHORS_AFFILIATIONS: pyarrow.list_(strings),
+        Review.AUTHORS_ID: strings,
+        Review.AUTHORS_LOCATION: string,
+
+        Review.PRICE: pyarrow.float64(),
+        Review.PRICE_UNIT: categorical,
+        Review.PAGES: pyarrow.int64(),
+        Review.ISBN: string,
+        Review.PUBLISHER: categorical,
+        Review.PUBLISHED_YEAR: pyarrow.int64(),
+        Review.PUBLISHED_LOCATION: string,
+        Review.KEYWORDS: strings,
+        Review.DESC: string,
+        Review.DNB_ID: string,
+    }
+
+
+def review_schema(fields):
+    """
+    Arrow schema of the given review fields
+    """
+    types = _column_types()
+    return pyarrow.schema([(field, types[field]) for field in fields])
+
+
+def _to_array(field, values, column_type):
+    """
+    Arrow array of the values of a field. Missing values may be None or NaN
+    """
+    if field in _TITLE_COLUMNS:
+        values = [None if v is None or v != v else v.value for v in values]
+    elif field in _TITLE_LIST_COLUMNS:
+        values = [[t.value for t in v] if isinstance(v, list) else None for v in values]
+    elif pyarrow.types.is_timestamp(column_type):
+        # the extractors create dates with a precision of days
+        values = np.array([None if v is None or v != v else v for v in values], dtype="datetime64[s]")
+
+    return pyarrow.array(values, type=column_type, from_pandas=True)
+
+
+def columns_to_table(columns, schema):
+    """
+
+    Parameters
+    ----------
+    columns dictionary of review field -> values, e.g. from ReviewBatch.columns
+    schema see review_schema
+
+    Returns
+    -------
+    arrow table
+    """
+    arrays = [_to_array(field.name, columns[field.name], field.type) for field in schema]
+    return pyarrow.Table.from_arrays(arrays, schema=schema)
+
+
+def encode_categoricals(df: pandas.DataFrame):
+    """
+    Converts the columns with few distinct values to categoricals, in place. Academic titles become an ordered
+    categorical of AcademicTitleCategory, genders a categorical of ALL_GENDERS.
+    """
+    for column in CATEGORICAL_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype(GENDER_DTYPE if column == Review.REVIEWER_GENDER else "category")
+
+    for column in _TITLE_COLUMNS:
+        if column in df:
+            df[column] = pandas.Categorical(df[column], dtype=TITLE_DTYPE)
+
+
+def table_to_dataframe(table) -> pandas.DataFrame:
+    """
+    Same dataframe as created from the reviews: list columns hold lists and list of academic titles hold enums
+    again. Columns with few distinct values are categoricals, see encode_categoricals.
+    """
+    df = table.to_pandas()
+
+    for field in table.schema.names:
+        if field in _TITLE_COLUMNS:
+            codes = table.column(field).to_numpy(zero_copy_only=False)
+            codes = np.where(pandas.isna(codes), -1, codes).astype(np.int8)
+            df[field] = pandas.Categorical.from_codes(codes, dtype=TITLE_DTYPE)
+        elif field in _TITLE_LIST_COLUMNS:
+            df[field] = [None if v is None else [AcademicTitleCategory(t) for t in v]
+                         for v in table.column(field).to_pylist()]
+        elif pyarrow.types.is_list(table.schema.field(field).type):
+            df[field] = table.column(field).to_pylist()
+        elif pyarrow.types.is_timestamp(table.schema.field(field).type):
+            df[field] = df[field].astype("datetime64[s]")
+
+    encode_categoricals(df)
+
+    if Review.ID in df:
+        df.set_index(Review.ID, drop=False, inplace=True)
+
+    return df
+
+
+def dataframe_to_table(df: pandas.DataFrame):
+    types = _column_types()
+    unknown = [c for c in df.columns if c not in types]
+    if unknown:
+        logger.warning(f"Columns without type are not stored: {unknown}")
+
+    schema = review_schema([c for c in df.columns if c in types])
+    columns = [_to_array(field.name, df[field.name].tolist(), field.type) for field in schema]
+    return pyarrow.Table.from_arrays(columns, schema=schema)
+
+
+def read_reviews(path, columns=None, filters=None) -> pandas.DataFrame:
+    """
+
+    Parameters
+    ----------
+    path parquet file
+    columns columns to read, all if None. Columns that are not in the file are skipped.
+    filters row filters, see pyarrow.parquet.read_table
+
+    Returns
+    -------
+    dataframe indexed by id
+    """
+    if columns is not None:
+        # e.g. the texts, which are kept in a separate store, see ReviewWriter
+        names = pyarrow.parquet.read_schema(path).names
+        columns = [c for c in columns if c in names]
+
+    return table_to_dataframe(pyarrow.parquet.read_table(path, columns=columns, filters=filters))
+
+
+def take_rows(parquet_file, positions, columns=None):
+    """
+    Rows at the given positions of a Parquet file, in the given order. Only the row groups that contain any of the
+    rows are read, one at a time, so at most one row group and the selected rows are held in memory.
+
+    Parameters
+    ----------
+    parquet_file pyarrow.parquet.ParquetFile
+    positions positions of the rows in the file
+    columns columns to read, all if None
+
+    Returns
+    -------
+    arrow table
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    metadata = parquet_file.metadata
+
+    # first row of each row group
+    starts = np.zeros(metadata.num_row_groups + 1, dtype=np.int64)
+    np.cumsum([metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)], out=starts[1:])
+
+    groups = np.searchsorted(starts, positions, side="right") - 1
+    # rows ordered by row group, the rows of each group are taken at once
+    order = np.argsort(groups, kind="stable")
+    boundaries = np.flatnonzero(np.diff(groups[order])) + 1
+
+    pieces = []
+    for selected in np.split(order, boundaries) if len(order) else []:
+        group = int(groups[selected[0]])
+        table = parquet_file.read_row_group(group, columns=columns)
+        pieces.append(table.take(pyarrow.array(positions[selected] - starts[group], type=pyarrow.int64())))
+
+    if not pieces:
+        schema = parquet_file.schema_arrow
+        return schema.empty_table() if columns is None else schema.empty_table().select(columns)
+
+    # back to the given order
+    table = pyarrow.concat_tables(pieces)
+    return table.take(pyarrow.array(np.argsort(order), type=pyarrow.int64()))
+
+
+def take_rows_of_files(paths, files, positions, schema):
+    """
+    Rows of several Parquet files, in the given order, see take_rows
+
+    Parameters
+    ----------
+    paths Parquet files
+    files file of each row, as position in paths
+    positions position of each row in its file
+    schema columns of the result, see conform_table
+
+    Returns
+    -------
+    arrow table
+    """
+    files = np.asarray(files, dtype=np.int64)
+    positions = np.asarray(positions, dtype=np.int64)
+
+    pieces = []
+    rows = []
+    for i, path in enumerate(paths):
+        selected = np.flatnonzero(files == i)
+        if not len(selected):
+            continue
+
+        parquet_file = pyarrow.parquet.ParquetFile(path)
+        columns = [name for name in schema.names if name in parquet_file.schema_arrow.names]
+        pieces.append(conform_table(take_rows(parquet_file, positions[selected], columns), schema))
+        rows.append(selected)
+
+    if not pieces:
+        return schema.empty_table()
+
+    # back to the given order
+    table = pyarrow.concat_tables(pieces)
+    return table.take(pyarrow.array(np.argsort(np.concatenate(rows)), type=pyarrow.int64()))
+
+
+def read_rows(path, positions) -> pandas.DataFrame:
+    """
+    Rows at the given positions of a file written by ParquetRowWriter, see take_rows
+    """
+    return table_to_dataframe(take_rows(pyarrow.parquet.ParquetFile(path), positions))
+
+
+def conform_table(table, schema):
+    """
+    Table with the columns of the schema, in the same order and with the same types. Columns that are missing in the
+    table, e.g. in files written by older versions, are filled with nulls.
+    """
+    columns = [table.column(field.name).cast(field.type) if field.name in table.schema.names
+               else pyarrow.nulls(len(table), type=field.type) for field in schema]
+    return pyarrow.Table.from_arrays(columns, schema=schema)
+
+
+def write_reviews(df: pandas.DataFrame, path, row_group_size=10000):
+    """
+    Writes the reviews in row groups. The processed reviews are sorted by date, so readers can skip row groups by
+    date.
+    """
+    logger.info(f"Saving to '{path}'")
+    pyarrow.parquet.write_table(dataframe_to_table(df), path, row_group_size=row_group_size)
+
+
+class DataFrameWriter(object):
+    """
+    Appends dataframes of reviews to a Parquet file, e.g. the chunks of a dataset that does not fit into memory. Each
+    dataframe is written as one row group.
+
+    Parameters
+    ----------
+    path output file
+    fields review fields to write, other columns of the dataframes are skipped
+    """
+
+    def __init__(self, path, fields):
+        self.path = path
+        self.fields = list(fields)
+        self._writer = pyarrow.parquet.ParquetWriter(path, review_schema(self.fields))
+
+    def add(self, df: pandas.DataFrame):
+        self._writer.write_table(dataframe_to_table(df[self.fields]))
+
+    def close(self):
+        self._writer.close()
+
+
+class ParquetRowWriter(object):
+    """
+    Appends rows to a Parquet file, one row group per `row_group_size` rows. Only the rows of the current row group
+    are held in memory.
+
+    Parameters
+    ----------
+    path output file
+    fields review fields to write, the other fields of the rows are skipped
+    row_group_size number of rows per row group
+    """
+
+    def __init__(self, path, fields, row_group_size=1000):
+        self.path = path
+        self.schema = review_schema(fields)
+        self.row_group_size = row_group_size
+        self.n_rows = 0
+
+        self._pending = ReviewBatch()
+        self._writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def add(self, row):
+        """
+
+        Parameters
+        ----------
+        row row tuple of a review, see Review.to_row
+
+        Returns
+        -------
+        position of the row in the file
+        """
+        self._pending.add_row(row)
+        self.n_rows += 1
+
+        if len(self._pending) >= self.row_group_size:
+            self.flush()
+
+        return self.n_rows - 1
+
+    def flush(self):
+        if not self._pending:
+            return
+
+        self._writer.write_table(columns_to_table(self._pending.columns(self.schema.names), self.schema))
+        self._pending = ReviewBatch()
+
+    def close(self):
+        self.flush()
+        self._writer.close()
@@ -2,7 +2,9 @@
 """
 We originally intended to use an actual database as backend, that is why we have individual classes for each entity.
 """
-from db.review import Review
+from db.review import Review, ReviewBatch
 from db.reviewer import Reviewer
 from db.author import Author
 from db.city import City
+from db.manifest import CrawlManifest
+from db.parse_cache import ParseCache
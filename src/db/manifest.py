@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Crawl manifest, a small SQLite database that keeps track of the state of each article id.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+ManifestEntry = namedtuple("ManifestEntry", ["id", "state", "http_status", "content_hash", "size", "fetched_at",
+                                             "failures", "etag", "last_modified", "changed_at"])
+
+# columns added after the first version of the manifest
+_ADDED_COLUMNS = {
+    "etag": "TEXT",
+    "last_modified": "TEXT",
+    "changed_at": "REAL",
+}
+
+
+class CrawlManifest(object):
+    """
+    Records status, content hash, size, fetch time and number of failures per article id, as well as the validators
+    (ETag, Last-Modified) required for conditional requests and the time the content last changed.
+
+    All entries are additionally held in memory, so lookups do not hit the database. The manifest can be shared
+    between threads.
+    """
+
+    STATE_DONE = "done"
+    STATE_NOT_FOUND = "not_found"
+    STATE_FAILED = "failed"
+
+    # kinds of crawls, each kind is resumed and finished on its own
+    CRAWL_FULL = "full"
+    CRAWL_REDOWNLOAD = "redownload"
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+
+        self._entries = {}
+        self._max_found_id = None
+        self._crawl_id = None
+
+        for row in self._connection.execute(f"SELECT {', '.join(ManifestEntry._fields)} FROM articles"):
+            self._remember(ManifestEntry(*row))
+
+        logger.info(f"Manifest '{path}' contains {len(self._entries)} entries")
+
+    def _create_tables(self):
+        with self._connection:
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS articles (
+                    id INTEGER PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    http_status INTEGER,
+                    content_hash TEXT,
+                    size INTEGER,
+                    fetched_at REAL,
+                    failures INTEGER NOT NULL DEFAULT 0,
+                    etag TEXT,
+                    last_modified TEXT,
+                    changed_at REAL
+                )""")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS crawls (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    started_at REAL NOT NULL,
+                    finished_at REAL,
+                    kind TEXT NOT NULL DEFAULT 'full'
+                )""")
+
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(articles)")}
+            for column, column_type in _ADDED_COLUMNS.items():
+                if column not in columns:
+                    logger.info(f"Adding column '{column}' to manifest")
+                    self._connection.execute(f"ALTER TABLE articles ADD COLUMN {column} {column_type}")
+
+            # crawls recorded before redownloads had their own kind are full crawls
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(crawls)")}
+            if "kind" not in columns:
+                logger.info("Adding column 'kind' to crawls")
+                self._connection.execute("ALTER TABLE crawls ADD COLUMN kind TEXT NOT NULL DEFAULT 'full'")
+
+    def _remember(self, entry):
+        self._entries[entry.id] = entry
+
+        if entry.state == CrawlManifest.STATE_DONE:
+            if self._max_found_id is None or entry.id > self._max_found_id:
+                self._max_found_id = entry.id
+
+    def _write(self, entry):
+        with self._lock:
+            with self._connection:
+                self._connection.execute(
+                    f"INSERT OR REPLACE INTO articles ({', '.join(ManifestEntry._fields)}) "
+                    f"VALUES ({', '.join('?' * len(ManifestEntry._fields))})", entry)
+            self._remember(entry)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, identifier) -> ManifestEntry:
+        return self._entries.get(identifier)
+
+    def ids(self, state=None):
+        return [i for i, entry in self._entries.items() if state is None or entry.state == state]
+
+    def is_known_gap(self, identifier):
+        """
+        Ids below the newest downloaded article that were not found will not appear later on
+        """
+        entry = self._entries.get(identifier)
+
+        if entry is None or entry.state != CrawlManifest.STATE_NOT_FOUND:
+            return False
+
+        return self._max_found_id is not None and identifier < self._max_found_id
+
+    def seed(self, identifiers):
+        """
+        Adds ids of articles downloaded before the manifest existed
+        """
+        with self._lock:
+            with self._connection:
+                for identifier in identifiers:
+                    if identifier in self._entries:
+                        continue
+
+                    entry = ManifestEntry(identifier, CrawlManifest.STATE_DONE, None, None, None, None, 0, None, None,
+                                          None)
+                    self._connection.execute(
+                        f"INSERT INTO articles ({', '.join(ManifestEntry._fields)}) "
+                        f"VALUES ({', '.join('?' * len(ManifestEntry._fields))})", entry)
+                    self._remember(entry)
+
+    def record_success(self, identifier, http_status, content_hash, size, etag=None, last_modified=None):
+        with self._lock:
+            now = time.time()
+            old = self._entries.get(identifier)
+
+            if old is not None and old.content_hash == content_hash:
+                changed_at = old.changed_at
+            else:
+                changed_at = now
+
+            entry = ManifestEntry(identifier, CrawlManifest.STATE_DONE, http_status, content_hash, size, now, 0, etag,
+                                  last_modified, changed_at)
+            self._write(entry)
+
+    def record_unchanged(self, identifier, http_status):
+        """
+        The server confirmed that the article did not change since the last download (304)
+        """
+        with self._lock:
+            old = self._entries[identifier]
+            self._write(old._replace(http_status=http_status, fetched_at=time.time(), failures=0))
+
+    def record_not_found(self, identifier, http_status, content_hash=None, size=None):
+        now = time.time()
+        entry = ManifestEntry(identifier, CrawlManifest.STATE_NOT_FOUND, http_status, content_hash, size, now, 0, None,
+                              None, now)
+        self._write(entry)
+
+    def record_failure(self, identifier, http_status=None):
+        with self._lock:
+            old = self._entries.get(identifier)
+
+            if old is None:
+                entry = ManifestEntry(identifier, CrawlManifest.STATE_FAILED, http_status, None, None, time.time(), 1,
+                                      None, None, None)
+            else:
+                # keep the state of articles that have been downloaded before
+                state = old.state if old.state == CrawlManifest.STATE_DONE else CrawlManifest.STATE_FAILED
+                entry = old._replace(state=state, http_status=http_status, fetched_at=time.time(),
+                                     failures=old.failures + 1)
+
+            self._write(entry)
+
+    def begin_crawl(self, resume=True, kind=CRAWL_FULL):
+        """
+        Starts a new crawl, or continues the last one of the same kind if it has not been finished. A redownload does
+        not finish or replace an interrupted full crawl.
+
+        Returns
+        -------
+        start time of the crawl. Articles fetched after this time have been handled by the current crawl.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT id, started_at, finished_at FROM crawls WHERE kind = ? ORDER BY id DESC LIMIT 1",
+                (kind,)).fetchone()
+
+            if resume and row is not None and row[2] is None:
+                logger.info(f"Resuming crawl {row[0]}")
+                self._crawl_id = row[0]
+                return row[1]
+
+            with self._connection:
+                started_at = time.time()
+                cursor = self._connection.execute("INSERT INTO crawls (started_at, kind) VALUES (?, ?)",
+                                                  (started_at, kind))
+                self._crawl_id = cursor.lastrowid
+
+            return started_at
+
+    def finish_crawl(self):
+        with self._lock:
+            with self._connection:
+                self._connection.execute("UPDATE crawls SET finished_at = ? WHERE id = ?",
+                                         (time.time(), self._crawl_id))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
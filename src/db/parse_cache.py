@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Parse cache, a small SQLite database with the extracted row of each raw page. A cached row is only used if neither
+the page (see the fingerprint of the stores in archive) nor the extractor version changed since it was extracted.
+"""
+import logging
+import pickle
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+
+class ParseCache(object):
+    """
+    Maps review id to (fingerprint of the page, extractor version, row tuple).
+
+    Parameters
+    ----------
+    path path of the database
+    version extractor version, rows of other versions are ignored
+    """
+
+    def __init__(self, path, version):
+        self.path = path
+        self.version = version
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+
+        with self._connection:
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS rows (
+                    id INTEGER PRIMARY KEY,
+                    fingerprint TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    row BLOB NOT NULL
+                )""")
+
+    def lookup(self, fingerprints):
+        """
+
+        Parameters
+        ----------
+        fingerprints dictionary of review id -> current fingerprint of the page
+
+        Returns
+        -------
+        dictionary of review id -> row, for the reviews whose row is up to date
+        """
+        rows = {}
+        n_stale = 0
+
+        cursor = self._connection.execute("SELECT id, fingerprint, row FROM rows WHERE version = ?", (self.version,))
+        for review_id, fingerprint, row in cursor:
+            if review_id not in fingerprints:
+                continue
+
+            if fingerprints[review_id] == fingerprint:
+                rows[review_id] = pickle.loads(row)
+            else:
+                n_stale += 1
+
+        logger.info(f"Parse cache: {len(rows)} up to date, {n_stale} changed, "
+                    f"{len(fingerprints) - len(rows) - n_stale} new or extracted by another version")
+        return rows
+
+    def put_many(self, entries):
+        """
+
+        Parameters
+        ----------
+        entries list of (review id, fingerprint, row)
+        """
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO rows (id, fingerprint, version, row) VALUES (?, ?, ?, ?)",
+                [(review_id, fingerprint, self.version, pickle.dumps(row, protocol=pickle.HIGHEST_PROTOCOL))
+                 for review_id, fingerprint, row in entries])
+
+    def close(self):
+        self._connection.close()
@@ -5,6 +5,7 @@ Description of a review.
 We initially intended to feed the scraped data into a sql database, that's why this file contains legacy
 code for sqlalchemy bindings.
 """
+import operator
 
 
 class Review(object):
@@ -17,6 +18,8 @@ class Review(object):
     NOT_FOUND = "not_found"
     DATE_ACCESS = "date_access"
     PARSED_SUCCESS = "parsed_success"
+    PARSE_ERROR = "parse_error"
+    PARSE_ERROR_TYPE = "parse_error_type"
     TITLE = "title"
     CATEGORY = "category"
     DATE = "date"
@@ -29,6 +32,7 @@ class Review(object):
     # reviewer
     REVIEWER_NAME = "reviewer_name"
     REVIEWER_GENDER = "reviewer_gender"
+    REVIEWER_MARKER = "reviewer_marker"
     REVIEWER_TITLE = "reviewer_title"
     REVIEWER_HIGHEST_TITLE = "reviewer_highest_title"
     REVIEWER_DESC = "reviewer_description"
@@ -39,6 +43,7 @@ class Review(object):
     AUTHORS_NAME = "authors_name"
     AUTHORS_PROFESSION = "authors_profession"
     AUTHORS_COUNTRY = "authors_country"
+    AUTHORS_LOCATION = "authors_location"
     AUTHORS_AFFILIATIONS = "authors_affiliations"
     AUTHORS_TITLE = "authors_title"
     AUTHORS_ID = "authors_id"
@@ -55,6 +60,22 @@ class Review(object):
     DESC = "description"
     DNB_ID = "dnb_id"
 
+    # attributes of a review, in the order of its row tuple, see to_row
+    FIELDS = (ID, NOT_FOUND, DATE_ACCESS, PARSED_SUCCESS, PARSE_ERROR, PARSE_ERROR_TYPE,
+              TITLE, CATEGORY,
+              REVIEWER_NAME, REVIEWER_GENDER, REVIEWER_MARKER, REVIEWER_TITLE, REVIEWER_HIGHEST_TITLE, REVIEWER_DESC,
+              REVIEWER_LOCATION, REVIEWER_ID,
+              DATE, KEYWORDS, HEADINGS, DESC, TEXT, WORD_COUNT, LINKS, DNB_LINK,
+              AUTHORS_NAME, AUTHORS_PROFESSION, AUTHORS_COUNTRY, AUTHORS_LOCATION, AUTHORS_AFFILIATIONS, AUTHORS_ID,
+              DNB_ID,
+              PRICE, PRICE_UNIT, PAGES, ISBN, PUBLISHER, PUBLISHED_YEAR, PUBLISHED_LOCATION)
+
+    # position of each field in the row tuple
+    POSITIONS = {field: i for i, field in enumerate(FIELDS)}
+
+    # no __dict__ per review, only the fields can be set
+    __slots__ = FIELDS
+
     def __init__(self, identifier):
         self.id = identifier
 
@@ -62,6 +83,8 @@ class Review(object):
         self.not_found = False
         self.date_access = None
         self.parsed_success = True
+        self.parse_error = None
+        self.parse_error_type = None
 
         # data
         # self.title_short = None
@@ -70,6 +93,7 @@ class Review(object):
 
         self.reviewer_name = None
         self.reviewer_gender = None
+        self.reviewer_marker = None
         self.reviewer_title = None
         self.reviewer_highest_title = None
         self.reviewer_description = None
@@ -82,6 +106,8 @@ class Review(object):
         self.description = None
         self.text = None
         self.word_count = None
+        self.links = None
+        self.dnb_link = None
 
         # dnb
         self.authors_name = None
@@ -104,5 +130,49 @@ class Review(object):
     def __str__(self):
         return "Review: %d" % self.id
 
+    def to_row(self) -> tuple:
+        """
+        Values of the fields, in the order of FIELDS. Cheaper to create and to send between processes than a
+        dictionary.
+        """
+        return _row_getter(self)
+
     def to_dict(self):
-        return {c: getattr(self, c) for c in dir(self) if not (c.startswith("_") or c == "to_dict" or c[0].isupper())}
+        return dict(zip(Review.FIELDS, _row_getter(self)))
+
+
+_row_getter = operator.attrgetter(*Review.FIELDS)
+
+
+class ReviewBatch(object):
+    """
+    Row tuples of many reviews, see Review.to_row. Columns are taken from the rows directly, without a dictionary
+    per review.
+    """
+
+    def __init__(self, rows=None):
+        self.rows = list(rows) if rows is not None else []
+
+    def add(self, review: Review):
+        self.rows.append(review.to_row())
+
+    def add_row(self, row):
+        self.rows.append(row)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def columns(self, fields=Review.FIELDS):
+        """
+        Returns
+        -------
+        dictionary of field -> list of the values of all reviews
+        """
+        if not self.rows:
+            return {field: [] for field in fields}
+
+        columns = list(zip(*self.rows))
+        return {field: list(columns[Review.POSITIONS[field]]) for field in fields}
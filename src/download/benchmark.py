@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Download throughput benchmark. Serves synthetic review pages from a local HTTP server and crawls them with
+scrape_loop, so worker counts and rate limits can be tuned without sending requests to the real site.
+
+The stub site can delay responses, answer with 404 for a fraction of the ids and reject all requests with 429 for
+a few seconds at regular intervals.
+Needs to be run as a module from src: python3 -m download.benchmark
+"""
+import http.server
+import logging.config
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import click
+import numpy as np
+
+from . import download
+import archive
+import config
+from db import CrawlManifest
+
+logging.config.dictConfig(config.LOGGING_CONFIG)
+logger = logging.getLogger(__name__)
+
+_ARTICLE_PATH_RE = re.compile(r"/rezensionen/(\d+)\.php")
+
+# pages are titled like those of the website
+SITE_NAME = urllib.parse.urlsplit(config.URL_WEBSITE).netloc
+
+NOT_FOUND_PAGE = f"<html><head><title>Seite nicht gefunden | {SITE_NAME}</title></head><body></body></html>"
+
+
+def make_page(identifier, size):
+    """
+    Synthetic review page of roughly `size` bytes
+    """
+    rand = random.Random(identifier)
+    paragraphs = []
+    length = 0
+
+    while length < size:
+        words = " ".join(rand.choice(["Soziale", "Arbeit", "Rezension", "Buch", "Praxis", "Theorie", "Kinder",
+                                      "Jugendhilfe", "Beratung", "Forschung"]) for _ in range(50))
+        paragraphs.append(f"<p>{words}</p>")
+        length += len(paragraphs[-1])
+
+    body = "\n".join(paragraphs)
+    return f"""<!DOCTYPE html>
+<html><head><title>Rezension {identifier} | {SITE_NAME}</title>
+<meta name="citation_title" content="Buch {identifier}"></head>
+<body><div class="contentbox"><h2>Rezension</h2>
+{body}
+</div></body></html>"""
+
+
+class StubSite(object):
+    """
+    Local HTTP server that serves synthetic articles at /rezensionen/<id>.php
+
+    Parameters
+    ----------
+    n_pages ids from 0 to n_pages - 1 exist, all others are answered with 404
+    latency mean delay of each response in seconds, exponentially distributed
+    not_found_ratio fraction of ids that are answered with 404
+    burst_interval start a burst of 429 responses every burst_interval seconds, None to disable
+    burst_duration length of each burst in seconds
+    retry_after Retry-After header sent with 429 responses, None to omit it
+    page_size approximate size of the pages in bytes
+    """
+
+    def __init__(self, n_pages=1000, latency=0.05, not_found_ratio=0.05, burst_interval=None, burst_duration=1.0,
+                 retry_after=None, page_size=30000):
+        self.n_pages = n_pages
+        self.latency = latency
+        self.not_found_ratio = not_found_ratio
+        self.burst_interval = burst_interval
+        self.burst_duration = burst_duration
+        self.retry_after = retry_after
+        self.page_size = page_size
+
+        self._server = None
+        self._thread = None
+        self._t_start = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_port}/rezensionen"
+
+    def exists(self, identifier):
+        if identifier < 0 or identifier >= self.n_pages:
+            return False
+        return random.Random(-identifier - 1).random() >= self.not_found_ratio
+
+    def in_burst(self):
+        if not self.burst_interval:
+            return False
+        return (time.monotonic() - self._t_start) % self.burst_interval < self.burst_duration
+
+    def respond(self, path):
+        """
+        Returns status, headers and body for the requested path
+        """
+        if self.latency:
+            time.sleep(np.random.exponential(self.latency))
+
+        if self.in_burst():
+            headers = {} if self.retry_after is None else {"Retry-After": str(self.retry_after)}
+            return 429, headers, b""
+
+        match = _ARTICLE_PATH_RE.search(path)
+        if match is None or not self.exists(int(match.group(1))):
+            return 404, {}, NOT_FOUND_PAGE.encode("utf-8")
+
+        return 200, {}, make_page(int(match.group(1)), self.page_size).encode("utf-8")
+
+    def start(self):
+        site = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                status, headers, body = site.respond(self.path)
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._t_start = time.monotonic()
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-site", daemon=True)
+        self._thread.start()
+        logger.info(f"Serving {self.n_pages} pages at {self.base_url}")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+
+def run_benchmark(site, workers, rate, store_format, retry, breaker):
+    """
+    Crawls all pages of the stub site into a temporary store
+
+    Returns
+    -------
+    dict with the results
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        store = archive.ShardStore(directory) if store_format == archive.FORMAT_SHARDS \
+            else archive.DirectoryStore(directory)
+        manifest = CrawlManifest(os.path.join(directory, "manifest.sqlite"))
+
+        r = np.arange(site.n_pages)
+        np.random.shuffle(r)
+
+        t_start = time.perf_counter()
+        stats = download.scrape_loop(r, store, manifest, sleep=0, update=True, workers=workers, rate=rate,
+                                     resume=False, retry=retry, breaker=breaker, base_url=site.base_url)
+        seconds = time.perf_counter() - t_start
+
+        n_failed = len(manifest.ids(CrawlManifest.STATE_FAILED))
+        store.close()
+        manifest.close()
+
+    return {
+        "workers": workers,
+        "rate": rate,
+        "seconds": seconds,
+        "pages/s": site.n_pages / seconds,
+        "p50": stats.get_latency(50),
+        "p99": stats.get_latency(99),
+        "requests": stats.n_requests,
+        "retries": stats.n_retries,
+        "429": stats.status_counts[429],
+        "404": stats.status_counts[404],
+        "errors": stats.n_errors,
+        "failed": n_failed,
+    }
+
+
+@click.command()
+@click.option("--pages", "-n", "n_pages", type=int, default=500)
+@click.option("--workers", "-w", "workers", type=int, multiple=True, default=[1, 4, 8],
+              help="Number of workers, can be given multiple times")
+@click.option("--rate", "-r", "rate", type=float, default=None, help="Requests per second, unlimited by default")
+@click.option("--latency", "latency", type=float, default=0.05, help="Mean response time of the stub in seconds")
+@click.option("--not-found-ratio", "not_found_ratio", type=float, default=0.05)
+@click.option("--burst-interval", "burst_interval", type=float, default=None,
+              help="Answer with 429 for --burst-duration seconds every interval seconds")
+@click.option("--burst-duration", "burst_duration", type=float, default=1.0)
+@click.option("--retry-after", "retry_after", type=int, default=None, help="Retry-After header of 429 responses")
+@click.option("--page-size", "page_size", type=int, default=30000)
+@click.option("--format", "-f", "store_format", type=click.Choice(archive.FORMATS), default=archive.FORMAT_HTML)
+@click.option("--max-attempts", "max_attempts", type=int, default=5)
+@click.option("--base-delay", "base_delay", type=float, default=0.1, help="Base delay of the retry backoff")
+@click.option("--verbose/--no-verbose", default=False, help="Log every request")
+def main(n_pages, workers, rate, latency, not_found_ratio, burst_interval, burst_duration, retry_after, page_size,
+         store_format, max_attempts, base_delay, verbose):
+    """
+    Runs the benchmark once for each number of workers and prints one line of results per run
+    """
+    if not verbose:
+        logging.getLogger(download.__name__).setLevel(logging.ERROR)
+        logging.getLogger(archive.__name__).setLevel(logging.WARNING)
+
+    site = StubSite(n_pages=n_pages, latency=latency, not_found_ratio=not_found_ratio,
+                    burst_interval=burst_interval, burst_duration=burst_duration, retry_after=retry_after,
+                    page_size=page_size).start()
+
+    header = f"{'workers':>7} {'pages/s':>8} {'p50 ms':>7} {'p99 ms':>7} {'requests':>8} {'retries':>7} " \
+             f"{'429':>5} {'404':>5} {'errors':>6} {'failed':>6}"
+    results = []
+
+    try:
+        for n_workers in workers:
+            retry = download.RetryPolicy(max_attempts=max_attempts, base_delay=base_delay)
+            # the benchmark should measure the retries, not the pauses of the breaker
+            breaker = download.CircuitBreaker(threshold=max(100, 10 * n_workers), cooldown=1.0)
+            results.append(run_benchmark(site, n_workers, rate, store_format, retry, breaker))
+    finally:
+        site.stop()
+
+    print(header)
+    for result in results:
+        print(f"{result['workers']:>7} {result['pages/s']:>8.1f} {result['p50'] * 1000:>7.1f} "
+              f"{result['p99'] * 1000:>7.1f} {result['requests']:>8} {result['retries']:>7} {result['429']:>5} "
+              f"{result['404']:>5} {result['errors']:>6} {result['failed']:>6}")
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("Interrupted")
@@ -4,8 +4,17 @@ We added tor support and random user agents for downloading as well as socks pro
 """
 import logging.config
 import os
+import collections
+import email.utils
+import functools
+import hashlib
+import itertools
 import re
+import threading
 import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+import concurrent.futures
 
 import bs4
 import click
@@ -21,31 +30,47 @@ try:
 except:
     TOR_AVAILABLE=False
 
+import archive
 import config
 import utils
 from utils import EtaCounter
+from db import CrawlManifest
 
 logging.config.dictConfig(config.LOGGING_CONFIG)
 logger = logging.getLogger(__name__)
 
 
-def is_not_found(soup) -> bool:
+class ScrapeError(Exception):
+    """
+    Raised if an article could not be fetched, even after retrying
     """
 
-    Parameters
-    ----------
-    soup
+    def __init__(self, msg, http_status=None):
+        super().__init__(msg)
+        self.http_status = http_status
 
-    Returns
-    -------
 
+# links to articles, e.g. 'rezensionen/26413.php' or '/rezensionen/26413.php'
+ARTICLE_LINK_RE = re.compile(r"(?:^|/)rezensionen/(\d+)\.php")
+
+# links to pages listing articles: reviewer pages and category pages
+LISTING_LINK_RE = re.compile(r"/rezensionen/rezensionen\.php\?id=\d+|/index\.php\?auswahl=")
+
+
+def is_not_found_page(content) -> bool:
+    """
+    Same as features.reviews.is_not_found, without parsing the whole page
     """
-    title = soup.find("title").text.strip()
+    match = re.search(r"<title[^>]*>(.*?)</title>", content, flags=re.IGNORECASE | re.DOTALL)
+
+    if match is None:
+        return False
+
+    return "Seite nicht gefunden" in match.group(1)
 
-    if "Seite nicht gefunden" in title:
-        return True
 
-    return False
+def hash_content(content) -> str:
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
 
 
 def get_tor_session():
@@ -58,17 +83,113 @@ def get_tor_session():
     return session
 
 
-def get_user_agent():
+def load_user_agents():
     path = os.path.join(config.DIR_DATA, "user_agents.txt")
     if not os.path.exists(path):
-        return None
+        return []
     else:
-        agents = utils.load_list(path)
-        index = np.random.randint(0, len(agents))
-        return agents[index]
+        return utils.load_list(path)
 
 
-def scrape(base_url, identifier, session):
+class SessionManager:
+    """
+    Keeps one session (and thereby one keep-alive connection pool) per worker thread.
+    The user agents are loaded once and rotated in memory. Sessions are only replaced after recycle() has been
+    called, e.g. after tor built a new circuit.
+    """
+
+    def __init__(self, tor=False, user_agents=None):
+        self.tor = tor
+
+        if user_agents is None:
+            user_agents = load_user_agents()
+
+        self.user_agents = user_agents
+        self._agent_counter = itertools.count(np.random.randint(0, max(len(user_agents), 1)))
+        self._generation = 0
+        self._local = threading.local()
+        self._sessions = set()
+        self._lock = threading.Lock()
+
+    def _create_session(self):
+        if self.tor:
+            session = get_tor_session()
+        else:
+            session = requests.Session()
+
+        with self._lock:
+            self._sessions.add(session)
+
+        return session
+
+    def _discard_session(self, session):
+        with self._lock:
+            self._sessions.discard(session)
+
+        session.close()
+
+    def next_user_agent(self):
+        if not self.user_agents:
+            return None
+
+        return self.user_agents[next(self._agent_counter) % len(self.user_agents)]
+
+    def get(self):
+        """
+        Returns the session of the calling thread, with the next user agent set.
+        """
+        local = self._local
+        session = getattr(local, "session", None)
+
+        if session is None or local.generation != self._generation:
+            if session is not None:
+                self._discard_session(session)
+
+            session = self._create_session()
+            local.session = session
+            local.generation = self._generation
+
+        user_agent = self.next_user_agent()
+        if user_agent:
+            session.headers["User-Agent"] = user_agent
+
+        return session
+
+    def recycle(self):
+        """
+        Make all workers create new sessions on their next request
+        """
+        with self._lock:
+            self._generation += 1
+
+    def close(self):
+        with self._lock:
+            sessions = list(self._sessions)
+            self._sessions.clear()
+
+        for session in sessions:
+            session.close()
+
+
+def get_conditional_headers(entry):
+    """
+    Headers for a conditional request, based on the validators of the last download
+    """
+    headers = {}
+
+    if entry is None or entry.state != CrawlManifest.STATE_DONE:
+        return headers
+
+    if entry.etag:
+        headers["If-None-Match"] = entry.etag
+
+    if entry.last_modified:
+        headers["If-Modified-Since"] = entry.last_modified
+
+    return headers
+
+
+def fetch(base_url, identifier, session, headers=None) -> requests.Response:
     """
 
     Parameters
@@ -76,28 +197,20 @@ def scrape(base_url, identifier, session):
     base_url
     identifier
     session
+    headers additional headers, e.g. for conditional requests
 
     Returns
     -------
-
+    the response
     """
     url = f"{base_url}/{identifier}.php"
 
     logger.info(f"Scraping '{url}'")
-    session.headers.update({'User-Agent': get_user_agent()})
-    try:
-        page = session.get(url)
-    except Exception as e:
-        logger.exception(e)
-
-    return page.text
+    return session.get(url, headers=headers)
 
 
-def save(path, content):
-    logger.info(f"Saving to {path}")
-    f = open(path, "w")
-    f.write(str(content))
-    f.close()
+def scrape(base_url, identifier, session):
+    return fetch(base_url, identifier, session).text
 
 
 def get_newest_article_id(base_url, session):
@@ -116,13 +229,10 @@ def get_newest_article_id(base_url, session):
 
     ids = set()
 
-    session.headers.update({'User-Agent': get_user_agent()})
-
     for link in soup.findAll('a', attrs={'href': re.compile(r"^rezensionen/\d+")}):
-        ln = link.get('href')
-        ln = ln.replace("rezensionen/", "")
-        ln = ln.replace(".php", "")
-        ids.add(int(ln))
+        match = ARTICLE_LINK_RE.search(link.get('href'))
+        if match is not None:
+            ids.add(int(match.group(1)))
 
     if not ids:
         return 100000
@@ -137,89 +247,639 @@ def load_tor_controll_token():
     return dnb_token
 
 
-def scrape_loop(r, output, existing_files, sleep, controller=None, update=True):
-    eta = EtaCounter(len(r))
-    eta.start()
+class TokenBucket:
+    """
+    Thread safe token bucket. Each call to acquire() consumes one token and blocks until one is available,
+    so requests never exceed `rate` per second, no matter how many workers share the bucket.
+    """
 
-    for i in r:
-        eta.next()
-        logger.info(f"Fetching Article with id {i}")
+    def __init__(self, rate, capacity=1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._t_last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate is None:
+            return
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._t_last) * self.rate)
+                self._t_last = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait = (1 - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """
+    Shares one token bucket per host between all workers
+    """
+
+    def __init__(self, rate, capacity=1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url):
+        host = urllib.parse.urlsplit(url).netloc
+
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.capacity)
+                self._buckets[host] = bucket
+
+        bucket.acquire()
+
+
+def get_rate(sleep):
+    """
+    The sequential crawler waited 'sleep + rand * sleep' seconds between requests, that is 1.5 * sleep on average.
+    We use the same politeness budget as default request rate.
+    """
+    if sleep <= 0:
+        return None
+
+    return 1.0 / (1.5 * sleep)
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter. Requests are retried after connection errors, 429 and 5xx responses.
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, max_attempts=5, base_delay=1.0, max_delay=60.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def is_retryable(self, page) -> bool:
+        return page.status_code in RetryPolicy.RETRY_STATUS
+
+    @staticmethod
+    def get_retry_after(page):
+        """
+        Delay requested by the server in seconds, if any
+        """
+        if page is None:
+            return 0
+
+        value = page.headers.get("Retry-After")
+        if not value:
+            return 0
+
+        if value.isdigit():
+            return int(value)
 
         try:
-            filename = f"{i}.html"
-            path = os.path.join(output, filename)
+            date = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return 0
 
-            if filename in existing_files:
-                logger.info("File Exists: '%s'", str(path))
+        return max(0, date.timestamp() - time.time())
 
-                if not update:
-                    continue
-
-            if controller:
-                try:
-                    controller.signal(Signal.NEWNYM)
-                    logger.info("New socks proxy connection")
-                    session = get_tor_session()
-                except SocketClosed:
-                    logger.critical("Socket was closed.")
-                    # TODO: establish new connection
-                    return
+    def get_delay(self, attempt, page=None):
+        delay = np.random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, min(self.max_delay, RetryPolicy.get_retry_after(page)))
+
+
+class CircuitBreaker:
+    """
+    Pauses all workers for `cooldown` seconds after `threshold` consecutive failures. Afterwards, requests are
+    let through again, but the next failure opens the circuit right away.
+    """
+
+    def __init__(self, threshold=10, cooldown=60.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._half_open = False
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        while True:
+            with self._lock:
+                remaining = self._open_until - time.monotonic()
+
+            if remaining <= 0:
+                return
+
+            time.sleep(remaining)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._half_open = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+
+            if self._half_open or self._failures >= self.threshold:
+                if self._open_until <= time.monotonic():
+                    logger.warning(f"Site is failing, pausing crawl for {self.cooldown} s")
+                    self._open_until = time.monotonic() + self.cooldown
+
+                self._failures = 0
+                self._half_open = True
+
+
+class CrawlStats:
+    """
+    Thread safe counters for a crawl: latency and status of each request, and number of retries
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self.status_counts = collections.Counter()
+        self.n_retries = 0
+        self.n_errors = 0
+        self._lock = threading.Lock()
+
+    def record_request(self, seconds, status=None):
+        """
+        status is None if the request raised an exception
+        """
+        with self._lock:
+            self.latencies.append(seconds)
+            if status is None:
+                self.n_errors += 1
             else:
-                session = requests.Session()
-            content = scrape(config.URL_REVIEWS, i, session=session)
-            save(path, content)
+                self.status_counts[status] += 1
+
+    def record_retry(self):
+        with self._lock:
+            self.n_retries += 1
+
+    @property
+    def n_requests(self):
+        return len(self.latencies)
+
+    def get_latency(self, q):
+        """
+        q-th percentile of the request latency in seconds
+        """
+        if not self.latencies:
+            return float("nan")
+        return float(np.percentile(self.latencies, q))
+
+
+def request_with_retry(url, sessions, limiter, retry, breaker, headers=None, stats=None) -> requests.Response:
+    """
+    Requests the url, retrying transient failures.
+
+    Raises
+    ------
+    ScrapeError if all attempts failed
+    """
+    page = None
+    status = None
+
+    for attempt in range(retry.max_attempts):
+        breaker.wait()
+        limiter.acquire(url)
+
+        if attempt > 0 and stats is not None:
+            stats.record_retry()
+
+        t_start = time.perf_counter()
+        try:
+            page = sessions.get().get(url, headers=headers)
+        except requests.RequestException as e:
+            logger.warning(f"Request for '{url}' failed: {e}")
+            page = None
+            status = None
+
+        if stats is not None:
+            stats.record_request(time.perf_counter() - t_start, None if page is None else page.status_code)
+
+        if page is not None:
+            if not retry.is_retryable(page):
+                breaker.record_success()
+                return page
+
+            status = page.status_code
+            logger.warning(f"Request for '{url}' returned {status}")
+
+        breaker.record_failure()
+
+        if attempt + 1 < retry.max_attempts:
+            delay = retry.get_delay(attempt, page)
+            logger.info(f"Retrying '{url}' in {delay:.1f} s")
+            time.sleep(delay)
+
+    raise ScrapeError(f"Could not fetch '{url}' after {retry.max_attempts} attempts", http_status=status)
+
+
+def fetch_with_retry(base_url, identifier, sessions, limiter, retry, breaker, headers=None,
+                     stats=None) -> requests.Response:
+    url = f"{base_url}/{identifier}.php"
+    logger.info(f"Scraping '{url}'")
+    return request_with_retry(url, sessions, limiter, retry, breaker, headers=headers, stats=stats)
+
+
+def discover_article_ids(start_urls, sessions, limiter, retry, breaker, max_pages=None) -> set:
+    """
+    Crawls the listing pages (front page, reviewer pages, category pages) of the website and collects the ids of
+    all articles linked from them, so we do not have to request every id in a range.
+
+    Parameters
+    ----------
+    start_urls pages to start from
+    sessions session manager
+    limiter rate limiter
+    retry retry policy
+    breaker circuit breaker
+    max_pages maximum number of listing pages to request
 
-            # sleep some time
-            logger.info(f"ETA: {eta.get_pretty_eta()}")
-            # time.sleep(sleep)
-            time.sleep(sleep + np.random.rand() * sleep)
-        except Exception as e:
-            logger.exception(e)
+    Returns
+    -------
+    set of article ids
+    """
+    host = urllib.parse.urlsplit(config.URL_WEBSITE).netloc
+    queue = collections.deque(start_urls)
+    visited = set(start_urls)
+    ids = set()
+    n_pages = 0
+
+    while queue and (max_pages is None or n_pages < max_pages):
+        url = queue.popleft()
+        n_pages += 1
+
+        try:
+            page = request_with_retry(url, sessions, limiter, retry, breaker)
+        except ScrapeError as e:
+            logger.error(f"{e}")
+            continue
+
+        if page.status_code != 200:
+            logger.warning(f"'{url}' returned {page.status_code}")
+            continue
+
+        soup = bs4.BeautifulSoup(page.text, "html.parser")
+
+        for link in soup.find_all("a", href=True):
+            href = urllib.parse.urljoin(url, link.get("href"))
+            parts = urllib.parse.urlsplit(href)
+
+            if parts.netloc != host:
+                continue
+
+            match = ARTICLE_LINK_RE.search(parts.path)
+            if match is not None:
+                ids.add(int(match.group(1)))
+                continue
+
+            href = urllib.parse.urlunsplit(parts._replace(fragment=""))
+            if LISTING_LINK_RE.search(href) and href not in visited:
+                visited.add(href)
+                queue.append(href)
+
+        logger.info(f"Discovered {len(ids)} articles on {n_pages} pages, {len(queue)} pages queued")
+
+    return ids
+
+
+def store_article(i, page, store, manifest, on_page=None):
+    """
+    Saves the page and records the result in the manifest. Pages that did not change are not written again, so their
+    modification time stays the same.
+
+    on_page is called with id and content of each new or changed page. Responses other than 2xx, 304 and 404 are not
+    stored but recorded as failure.
+    """
+    if page.status_code == 304:
+        logger.info(f"Article {i} did not change (304)")
+        manifest.record_unchanged(i, page.status_code)
+        return
+
+    if page.status_code != 404 and not 200 <= page.status_code < 300:
+        logger.warning(f"Article {i} returned {page.status_code}, not stored")
+        manifest.record_failure(i, page.status_code)
+        return
+
+    content = page.text
+    content_hash = hash_content(content)
+
+    if page.status_code == 404 or is_not_found_page(content):
+        logger.info(f"Article {i} not found")
+        store.put(i, content)
+        manifest.record_not_found(i, page.status_code, content_hash, len(content))
+
+        if on_page is not None:
+            on_page(i, content)
+        return
+
+    entry = manifest.get(i)
+    changed = entry is None or entry.content_hash != content_hash or not store.exists(i)
+
+    if changed:
+        store.put(i, content)
+    else:
+        logger.info(f"Article {i} did not change")
+
+    manifest.record_success(i, page.status_code, content_hash, len(content), etag=page.headers.get("ETag"),
+                            last_modified=page.headers.get("Last-Modified"))
+
+    if changed and on_page is not None:
+        on_page(i, content)
+
+
+def scrape_article(i, store, manifest, limiter, sessions, eta, retry, breaker, controller=None, update=True,
+                   crawl_start=None, conditional=True, on_page=None, base_url=None, stats=None, stop=None):
+    """
+    Fetches and saves a single article. Returns False if the crawl should be aborted.
+    """
+    if stop is not None and stop.is_set():
+        return False
+
+    i = int(i)
+    logger.info(f"Fetching Article with id {i}")
+
+    try:
+        entry = manifest.get(i)
+
+        if entry is not None:
+            if crawl_start is not None and entry.fetched_at is not None and entry.fetched_at >= crawl_start:
+                logger.info(f"Article {i} already fetched in this crawl")
+                return True
+
+            if manifest.is_known_gap(i):
+                logger.info(f"Article {i} is known to not exist")
+                return True
+
+            if entry.state == CrawlManifest.STATE_DONE:
+                logger.info(f"Article {i} exists")
+
+                if not update:
+                    return True
+
+        if controller:
+            try:
+                controller.signal(Signal.NEWNYM)
+                logger.info("New socks proxy connection")
+                # connections of the old circuit can not be reused
+                sessions.recycle()
+            except SocketClosed:
+                logger.critical("Socket was closed.")
+                # TODO: establish new connection
+                return False
+
+        if conditional and store.exists(i):
+            headers = get_conditional_headers(entry)
+        else:
+            headers = None
+
+        page = fetch_with_retry(base_url or config.URL_REVIEWS, i, sessions, limiter, retry, breaker, headers=headers,
+                                stats=stats)
+        store_article(i, page, store, manifest, on_page=on_page)
+    except ScrapeError as e:
+        logger.error(f"{e}")
+        manifest.record_failure(i, e.http_status)
+    except Exception as e:
+        logger.exception(e)
+        manifest.record_failure(i)
+    finally:
+        eta.next()
+        logger.info(f"ETA: {eta.get_pretty_eta()}")
+
+    return True
+
+
+# articles queued or running per worker
+WINDOW_PER_WORKER = 2
+
+
+def submit_windowed(pool, function, items, window, stop):
+    """
+    Calls the function for each item in the pool. Items are submitted in order, but only `window` of them are queued
+    or running at a time, so the pool never holds all items. No items are submitted once stop is set.
+    """
+    pending = set()
+
+    for item in items:
+        if len(pending) >= window:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                future.result()
+
+        if stop.is_set():
+            break
+
+        pending.add(pool.submit(function, item))
+
+    for future in concurrent.futures.as_completed(pending):
+        future.result()
+
+
+def scrape_loop(r, store, manifest, sleep, controller=None, update=True, workers=1, rate=None, sessions=None,
+                resume=True, conditional=True, retry=None, breaker=None, retry_passes=1, on_page=None, base_url=None,
+                stats=None, stop=None, crawl_kind=CrawlManifest.CRAWL_FULL):
+    """
+
+    Parameters
+    ----------
+    r ids of the articles to fetch, in the order they should be fetched
+    store store for the raw pages, see archive
+    manifest crawl manifest
+    sleep average delay between requests, used to derive the rate if no rate is given
+    controller tor controller
+    update fetch articles again even if they exist
+    workers number of concurrent workers
+    rate maximum number of requests per second and host, shared by all workers
+    sessions session manager, a new one is created if None
+    resume skip articles that have already been fetched by an interrupted crawl
+    conditional send conditional requests (If-None-Match, If-Modified-Since) for articles that have been downloaded
+    retry retry policy for single requests
+    breaker circuit breaker shared by all workers
+    retry_passes number of times articles that failed during this crawl are fetched again at the end
+    on_page called with id and content of each new or changed page, from the worker threads
+    base_url url of the articles, defaults to config.URL_REVIEWS
+    stats CrawlStats to record the requests to, a new one is created if None
+    stop threading.Event, articles that have not been started when it is set are skipped and the crawl is left
+    unfinished, so it can be resumed
+    crawl_kind kind of the crawl in the manifest, only crawls of the same kind are resumed
+
+    Returns
+    -------
+    CrawlStats of the crawl
+    """
+    eta = EtaCounter(len(r))
+    eta.start()
+
+    crawl_start = manifest.begin_crawl(resume=resume, kind=crawl_kind)
+
+    if rate is None:
+        rate = get_rate(sleep)
+
+    logger.info(f"Workers: {workers}, Rate: {rate} requests/s")
+    limiter = RateLimiter(rate)
+
+    if sessions is None:
+        sessions = SessionManager(tor=controller is not None)
+
+    if retry is None:
+        retry = RetryPolicy()
+
+    if breaker is None:
+        breaker = CircuitBreaker()
+
+    if stats is None:
+        stats = CrawlStats()
+
+    if stop is None:
+        stop = threading.Event()
+
+    if controller and workers > 1:
+        # NEWNYM changes the circuit for all connections, so we can not share it between workers
+        logger.warning("Tor does not support multiple workers, falling back to a single worker.")
+        workers = 1
+
+    for n_pass in range(retry_passes + 1):
+        if n_pass > 0:
+            # fetch articles that failed during this crawl once more
+            r = [i for i in manifest.ids(CrawlManifest.STATE_FAILED) if manifest.get(i).fetched_at >= crawl_start]
+            if not r:
+                break
+
+            logger.info(f"Retrying {len(r)} failed articles")
+            crawl_start = time.time()
+            eta = EtaCounter(len(r))
+            eta.start()
+
+        if workers <= 1:
+            for i in r:
+                if not scrape_article(i, store, manifest, limiter, sessions, eta, retry, breaker,
+                                      controller=controller, update=update, crawl_start=crawl_start,
+                                      conditional=conditional, on_page=on_page, base_url=base_url, stats=stats,
+                                      stop=stop):
+                    sessions.close()
+                    return stats
+        else:
+            scrape = functools.partial(scrape_article, store=store, manifest=manifest, limiter=limiter,
+                                       sessions=sessions, eta=eta, retry=retry, breaker=breaker, update=update,
+                                       crawl_start=crawl_start, conditional=conditional, on_page=on_page,
+                                       base_url=base_url, stats=stats, stop=stop)
+
+            pool = ThreadPoolExecutor(max_workers=workers)
+            try:
+                # articles are started in the order of submission, so shuffling is preserved
+                submit_windowed(pool, scrape, r, WINDOW_PER_WORKER * workers, stop)
+            except KeyboardInterrupt:
+                # articles that have not been started are dropped, the running ones finish
+                logger.warning("Interrupted, waiting for the running requests")
+                stop.set()
+                raise
+            finally:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+            if stop.is_set():
+                sessions.close()
+                return stats
+
+    sessions.close()
+    manifest.finish_crawl()
+
+    logger.info(f"Requests: {stats.n_requests}, Retries: {stats.n_retries}, "
+                f"Latency p50: {stats.get_latency(50):.3f} s, p99: {stats.get_latency(99):.3f} s")
+    return stats
 
 
 @click.command()
 @click.option("--limit", "-ul", "upper_limit", type=int, default=27000)
 @click.option("--update/--no-update", default=True)
 @click.option("--sleep", "-s", "sleep", type=float, default=0.5)
-@click.option("--output", "-o", "output", type=click.Path(), default=config.DIR_RAW_HTML)
+@click.option("--output", "-o", "output", type=click.Path(), default=None)
+@click.option("--format", "-f", "store_format", type=click.Choice(archive.FORMATS), default=archive.FORMAT_HTML,
+              help="Store pages as individual html files or in compressed shards")
 @click.option("--lower-limit", "-ll", "lower_limit", type=int, default=26413)
 @click.option("--tor/--no-tor", default=False)
 @click.option("--random/--no-random", default=True)
-def main(upper_limit, update, sleep, output, lower_limit, tor, random):
+@click.option("--workers", "-w", "workers", type=int, default=1)
+@click.option("--rate", "-r", "rate", type=float, default=None, help="Requests per second, defaults to 1/(1.5*sleep)")
+@click.option("--manifest", "-m", "manifest_path", type=click.Path(), default=config.PATH_MANIFEST)
+@click.option("--resume/--no-resume", default=True, help="Continue an interrupted crawl")
+@click.option("--conditional/--no-conditional", default=True, help="Only download articles that changed")
+@click.option("--max-attempts", "max_attempts", type=int, default=5, help="Attempts per article")
+@click.option("--breaker-threshold", "breaker_threshold", type=int, default=10,
+              help="Consecutive failures after which the crawl is paused")
+@click.option("--breaker-cooldown", "breaker_cooldown", type=float, default=60.0, help="Pause in seconds")
+@click.option("--discover/--no-discover", default=False,
+              help="Collect article ids from reviewer and category pages instead of requesting the id range")
+@click.option("--max-pages", "max_pages", type=int, default=None, help="Maximum number of pages to crawl for discovery")
+def main(upper_limit, update, sleep, output, store_format, lower_limit, tor, random, workers, rate, manifest_path,
+         resume, conditional, max_attempts, breaker_threshold, breaker_cooldown, discover, max_pages):
     logger.info(f"Sleep: {sleep}")
 
     if tor and not TOR_AVAILABLE:
         logger.warning("Tor not available. Install the stem package.")
         tor = False
 
-    existing_files = os.listdir(output)
+    if output is None:
+        output = config.DIR_RAW_SHARDS if store_format == archive.FORMAT_SHARDS else config.DIR_RAW_HTML
 
-    if upper_limit is None:
-        if tor:
-            # we need the controller to change the ip after each request
-            with Controller.from_port(port=9051) as controller:
-                controller.authenticate(password=load_tor_controll_token())
-                session = get_tor_session()
-                upper_limit = get_newest_article_id(config.URL_REVIEWS, session)
-        else:
-            session = requests.session()
-            upper_limit = get_newest_article_id(config.URL_REVIEWS, session)
+    store = archive.open_store(store_format, output)
+    manifest = CrawlManifest(manifest_path)
+
+    if len(manifest) == 0:
+        # pages downloaded before the manifest existed
+        manifest.seed(store.ids())
+
+    retry = RetryPolicy(max_attempts=max_attempts)
+    breaker = CircuitBreaker(threshold=breaker_threshold, cooldown=breaker_cooldown)
+
+    if discover:
+        # the id limits are ignored, we only request articles that exist
+        sessions = SessionManager(tor=tor)
+        limiter = RateLimiter(rate if rate is not None else get_rate(sleep))
+        ids = discover_article_ids([config.URL_REVIEWS, config.URL_WEBSITE], sessions, limiter, retry, breaker,
+                                   max_pages=max_pages)
+        sessions.close()
+
+        r = np.array(sorted(ids), dtype=int)
+        logger.info(f"Scraping {len(r)} discovered articles")
+    else:
+        if upper_limit is None:
+            if tor:
+                # we need the controller to change the ip after each request
+                with Controller.from_port(port=9051) as controller:
+                    controller.authenticate(password=load_tor_controll_token())
+                    upper_limit = get_newest_article_id(config.URL_REVIEWS, SessionManager(tor=True).get())
+            else:
+                upper_limit = get_newest_article_id(config.URL_REVIEWS, SessionManager().get())
 
-        logger.info(f"Newest article has id: {upper_limit}")
+            logger.info(f"Newest article has id: {upper_limit}")
 
-    r = np.arange(lower_limit, upper_limit)
+        r = np.arange(lower_limit, upper_limit)
+        logger.info(f"Scraping {lower_limit} -> {upper_limit}")
 
-    logger.info(f"Scraping {lower_limit} -> {upper_limit}")
     if random:
         np.random.shuffle(r)
 
     if tor:
         with Controller.from_port(port=9051) as controller:
             controller.authenticate(password=load_tor_controll_token())
-            scrape_loop(r, output, existing_files, sleep, controller, update=update)
+            scrape_loop(r, store, manifest, sleep, controller, update=update, rate=rate, resume=resume,
+                        conditional=conditional, retry=retry, breaker=breaker)
     else:
-        scrape_loop(r, output, existing_files, sleep, update=update)
+        scrape_loop(r, store, manifest, sleep, update=update, workers=workers, rate=rate, resume=resume,
+                    conditional=conditional, retry=retry, breaker=breaker)
 
+    store.close()
+    manifest.close()
     logger.info("Done.")
 
 
@@ -1,48 +1,137 @@
 # -*- coding: utf-8 -*-
 """
-Redownload all articles that could not be processed
+Redownload the articles that could not be processed, and process them again.
+
+Articles are selected by the reasons recorded by features/reviews.py, so pages affected by e.g. a temporary layout
+glitch of the site can be fetched again without touching the rest of the dataset.
+Needs to be run as a module from src: python3 -m download.redownload
 """
 
-import pandas as pd
 import logging.config
-import os
-import time
+import re
 
-from .download import scrape, save
-import config
-from db import Review
 import click
+import numpy as np
+
+from .download import scrape_loop
+import archive
+import config
+from db import Review, CrawlManifest
+from features import reviews
 
 logging.config.dictConfig(config.LOGGING_CONFIG)
 logger = logging.getLogger(__name__)
 
 
+def select_failed_ids(failures, reason=None, error_type=None):
+    """
+    Selects the ids of reviews that could not be parsed
+
+    Parameters
+    ----------
+    failures dataframe with the parse failures, see features.reviews.load_parse_failures
+    reason regular expression the error message has to match
+    error_type name of the exception, e.g. MyException
+
+    Returns
+    -------
+    list of ids
+    """
+    mask = np.ones(len(failures), dtype=bool)
+
+    if reason is not None:
+        pattern = re.compile(reason)
+        mask &= failures[Review.PARSE_ERROR].fillna("").map(lambda s: pattern.search(s) is not None).values
+
+    if error_type is not None:
+        mask &= (failures[Review.PARSE_ERROR_TYPE] == error_type).values
+
+    return [int(i) for i in failures[Review.ID][mask]]
+
+
 @click.command()
 @click.option("--sleep", "-s", "sleep", type=float, default=1.0)
-@click.option("--output", "-o", "output", type=click.Path(), default=config.DIR_RAW_HTML)
-def main(sleep, output):
+@click.option("--workers", "-w", "workers", type=int, default=4)
+@click.option("--rate", "-r", "rate", type=float, default=None, help="Requests per second, defaults to 1/(1.5*sleep)")
+@click.option("--reason", "reason", type=str, default=None, help="Regular expression for the failure reason")
+@click.option("--error-type", "error_type", type=str, default=None, help="Exception type, e.g. MyException")
+@click.option("--download-failures/--no-download-failures", "download_failures", default=True,
+              help="Also fetch articles whose download failed")
+@click.option("--output", "-o", "output", type=click.Path(), default=None)
+@click.option("--format", "-f", "store_format", type=click.Choice(archive.FORMATS), default=archive.FORMAT_HTML)
+@click.option("--manifest", "-m", "manifest_path", type=click.Path(), default=config.PATH_MANIFEST)
+@click.option("--failures", "failures_path", type=click.Path(), default=config.PATH_PARSE_FAILURES)
+@click.option("--csv", "csv_path", type=click.Path(), default=config.PATH_REVIEWS_CSV)
+@click.option("--pickle", "pickle_path", type=click.Path(), default=reviews.DEFAULT_PICKLE_PATH)
+@click.option("--parquet", "parquet_path", type=click.Path(), default=reviews.DEFAULT_PARQUET_PATH)
+@click.option("--processes", "-p", "n_processes", type=int, default=None)
+@click.option("--parser", "parser", type=click.Choice(reviews.PARSERS), default=reviews.PARSER_BS4)
+def main(sleep, workers, rate, reason, error_type, download_failures, output, store_format, manifest_path,
+         failures_path, csv_path, pickle_path, parquet_path, n_processes, parser):
     """
-    redownload all reviews for wich the parsing failed.
-    :param sleep: 
-    :param output: 
-    :return: 
+    Redownload the reviews for which the parsing (or the download) failed and process them again. Recovered
+    reviews are merged into the processed dataset.
+
+    Parameters
+    ----------
+    sleep see download.scrape_loop
+    workers number of download workers
+    rate requests per second, over all workers
+    reason only redownload reviews whose failure reason matches
+    error_type only redownload reviews that failed with this exception
+    download_failures also redownload articles whose download failed
+    output directory of the raw pages
+    store_format format of the raw pages
+    manifest_path crawl manifest
+    failures_path parse failures written by features/reviews.py
+    csv_path processed csv
+    pickle_path processed pickle
+    parquet_path processed parquet
+    n_processes number of parser processes
+    parser html parser backend, see features.reviews
+
+    Returns
+    -------
+
     """
-    logger.info("Sleep: %f", sleep)
-
-    reviews_path = os.path.join(config.DIR_PROCESSED, "reviews.csv")
-    df = pd.read_csv(reviews_path, encoding="utf-16")
-
-    df = df[[Review.ID, Review.PARSED_SUCCESS]]
-    df = df[~df[Review.PARSED_SUCCESS]]
-    logger.info(len(df))
-
-    for index, row in df.sample(frac=1).iterrows():
-        identifier = row[Review.ID]
-        logger.info("Scraping %d", identifier)
-        content = scrape(config.URL_WEBSITE, identifier)
-        path = os.path.join(output, f"{identifier}.html")
-        save(path, content)
-        time.sleep(sleep)
+    if output is None:
+        output = config.DIR_RAW_SHARDS if store_format == archive.FORMAT_SHARDS else config.DIR_RAW_HTML
+
+    failures = reviews.load_parse_failures(failures_path)
+    identifiers = set(select_failed_ids(failures, reason=reason, error_type=error_type))
+    logger.info(f"Selected {len(identifiers)}/{len(failures)} parse failures")
+
+    manifest = CrawlManifest(manifest_path)
+
+    if download_failures:
+        identifiers |= set(manifest.ids(CrawlManifest.STATE_FAILED))
+
+    identifiers = [i for i in identifiers if not manifest.is_known_gap(i)]
+    logger.info(f"Redownloading {len(identifiers)} articles")
+
+    if not identifiers:
+        manifest.close()
+        return
+
+    r = np.array(identifiers)
+    np.random.shuffle(r)
+
+    store = archive.open_store(store_format, output)
+    # failed pages may not have changed on the server, so they are downloaded completely. The redownload is recorded
+    # as a crawl of its own kind, so an interrupted full crawl can still be resumed.
+    scrape_loop(r, store, manifest, sleep, update=True, workers=workers, rate=rate, resume=False, conditional=False,
+                crawl_kind=CrawlManifest.CRAWL_REDOWNLOAD)
+    manifest.close()
+
+    # only process the pages that are available now
+    identifiers = [i for i in identifiers if store.exists(i)]
+    logger.info(f"Processing {len(identifiers)} articles")
+
+    writer = reviews.ReviewWriter(csv_path, pickle_path, merge=True, failures_path=failures_path,
+                                  parquet_path=parquet_path)
+    reviews.process_reviews(identifiers, store_format, output, writer, n_processes=n_processes, parser=parser)
+    writer.close()
+    store.close()
 
     logger.info("Done.")
 
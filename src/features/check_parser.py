@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Compares a parser backend (lxml by default) with the BeautifulSoup backend on the raw pages. Each page is processed
+with both parsers, all extracted fields have to be equal. Also reports the time per page for both parsers.
+"""
+import logging.config
+import time
+from concurrent.futures import ProcessPoolExecutor
+import concurrent.futures
+
+import click
+import numpy as np
+
+import archive
+import config
+from db import Review
+from features import reviews
+
+logging.config.dictConfig(config.LOGGING_CONFIG)
+logger = logging.getLogger(__name__)
+
+# fields whose order is not defined
+_UNORDERED = {Review.KEYWORDS}
+
+
+def compare_reviews(expected: Review, actual: Review):
+    """
+    Returns
+    -------
+    names of the fields that differ
+    """
+    expected = expected.to_dict()
+    actual = actual.to_dict()
+    differences = []
+
+    for key, value in expected.items():
+        other = actual.get(key)
+
+        if key in _UNORDERED and value is not None and other is not None:
+            value, other = sorted(value), sorted(other)
+
+        if type(value) != type(other) or not np.all(value == other):
+            differences.append(key)
+
+    return differences
+
+
+def check_review(review_id, store_format, store_path, parser):
+    """
+    Processes the page with bs4 and the given parser
+
+    Returns
+    -------
+    id, differing fields, seconds for bs4, seconds for the parser
+    """
+    content = archive.open_store(store_format, store_path).get(review_id)
+
+    t_start = time.perf_counter()
+    expected = reviews.process_document(review_id, content, parser=reviews.PARSER_BS4)
+    t_bs4 = time.perf_counter() - t_start
+
+    t_start = time.perf_counter()
+    actual = reviews.process_document(review_id, content, parser=parser)
+    t_parser = time.perf_counter() - t_start
+
+    return review_id, compare_reviews(expected, actual), t_bs4, t_parser
+
+
+@click.command()
+@click.option("--input", "-i", "input_path", type=click.Path(), default=None,
+              help="Raw pages, defaults to the html or shards directory")
+@click.option("--format", "-f", "store_format", type=click.Choice(archive.FORMATS), default=archive.FORMAT_HTML)
+@click.option("--limit", "-n", "limit", type=int, default=None, help="Check a random sample of pages")
+@click.option("--processes", "-p", "n_processes", type=int, default=None)
+@click.option("--parser", "parser", type=click.Choice(reviews.PARSERS + [reviews.PARSER_LXML]),
+              default=reviews.PARSER_LXML,
+              help="Parser to compare with bs4")
+def main(input_path, store_format, limit, n_processes, parser):
+    """
+    Exits with status 1 if any page gives different results
+
+    Parameters
+    ----------
+    input_path directory of the raw pages
+    store_format format of the raw pages
+    limit number of pages to check, all if None
+    n_processes number of workers to use
+    parser parser to compare with bs4
+
+    Returns
+    -------
+
+    """
+    if input_path is None:
+        input_path = config.DIR_RAW_SHARDS if store_format == archive.FORMAT_SHARDS else config.DIR_RAW_HTML
+
+    ids = archive.open_store(store_format, input_path).ids()
+    if limit is not None and limit < len(ids):
+        ids = sorted(np.random.choice(ids, limit, replace=False).tolist())
+
+    logger.info(f"Checking {len(ids)} pages")
+
+    # the extractors log every field
+    logging.getLogger(reviews.__name__).setLevel(logging.ERROR)
+
+    mismatches = {}
+    t_bs4 = 0.0
+    t_parser = 0.0
+
+    with ProcessPoolExecutor(max_workers=n_processes, initializer=reviews.init_worker) as pool:
+        jobs = [pool.submit(check_review, i, store_format, input_path, parser) for i in ids]
+
+        for future in concurrent.futures.as_completed(jobs):
+            review_id, differences, t_a, t_b = future.result()
+            t_bs4 += t_a
+            t_parser += t_b
+
+            if differences:
+                logger.error(f"Review {review_id} differs: {', '.join(differences)}")
+                mismatches[review_id] = differences
+
+    n = max(len(ids), 1)
+    logger.info(f"bs4: {1000 * t_bs4 / n:.2f} ms/page, {parser}: {1000 * t_parser / n:.2f} ms/page "
+                f"(speedup {t_bs4 / max(t_parser, 1e-9):.1f}x)")
+
+    if mismatches:
+        logger.error(f"{len(mismatches)}/{len(ids)} pages differ")
+        raise SystemExit(1)
+
+    logger.info(f"All {len(ids)} pages are equal")
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("Interrupted")
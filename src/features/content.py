@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Index of the content of a contentbox, collected in a single pass over the tree. The extractors in
+features/reviews.py read strings, paragraphs, headings and link targets from the index instead of searching the tree
+again and again.
+
+The parser backends walk their trees and report strings and elements to the index, see
+features.reviews.build_content_index and features.reviews_lxml.build_content_index.
+"""
+
+# strings of these elements are not part of the text, same as in BeautifulSoup
+IGNORED_STRINGS = frozenset(["script", "style", "template"])
+
+
+class ContentIndex(object):
+    """
+    Paragraphs (p) and headings (h2) are stored as spans [start, end) of the strings inside of them, in the order
+    in which they start, i.e. in the same order as find_all() returns them.
+    """
+
+    __slots__ = ["strings", "paragraphs", "headings", "hrefs", "_open", "_stripped"]
+
+    def __init__(self):
+        self.strings = []
+        self.paragraphs = []
+        self.headings = []
+        self.hrefs = []
+        self._open = []
+        self._stripped = None
+
+    def add_string(self, s):
+        self.strings.append(s)
+
+    def start_element(self, name, href=None):
+        """
+        Called when an element starts. href is the link target of anchors, if any
+        """
+        if name == "p":
+            span = [len(self.strings), None]
+            self.paragraphs.append(span)
+        elif name == "h2":
+            span = [len(self.strings), None]
+            self.headings.append(span)
+        else:
+            span = None
+            if name == "a" and href is not None:
+                self.hrefs.append(href)
+
+        self._open.append(span)
+
+    def end_element(self):
+        span = self._open.pop()
+        if span is not None:
+            span[1] = len(self.strings)
+
+    def text(self, span=None):
+        """
+        Same as the text of the element in BeautifulSoup
+        """
+        strings = self.strings if span is None else self.strings[span[0]:span[1]]
+        return "".join(strings)
+
+    def stripped_strings(self, span=None):
+        """
+        Same as stripped_strings of the element in BeautifulSoup
+        """
+        if span is not None:
+            return [s for s in (s.strip() for s in self.strings[span[0]:span[1]]) if s]
+
+        if self._stripped is None:
+            self._stripped = [s for s in (s.strip() for s in self.strings) if s]
+
+        return self._stripped
+
+    def links(self, prefix):
+        """
+        Link targets starting with prefix, in document order
+        """
+        return [href for href in self.hrefs if href.startswith(prefix)]
@@ -1,10 +1,10 @@
 # -*- coding: utf-8 -*-
 """
-Scrapes information from the dnb and adds it to the reviews.pkl file. Using this is optional, however it will most
+Scrapes information from the dnb and adds it to the processed reviews. Using this is optional, however it will most
 likely improve the obtained results as it fills missing values.
 """
 import logging.config
-import os
+import re
 import pandas as pd
 import config
 import utils
@@ -15,12 +15,26 @@ from dnb import DNBConnector
 logging.config.dictConfig(config.LOGGING_CONFIG)
 logger = logging.getLogger(__name__)
 
+# e.g. '2010', 'c 2010', '2010-2012'
+YEAR_RE = re.compile(r"\d{4}")
+
+
+def parse_year(year):
+    """
+    Publishing year of the DNB as integer, as in the processed reviews. None if there is no year.
+    """
+    if not year:
+        return None
+
+    match = YEAR_RE.search(year)
+    return int(match.group(0)) if match else None
+
 
 def main():
     dnb = DNBConnector(load_secret_dnb())
 
-    path = os.path.join(config.DIR_PROCESSED, "reviews.pkl")
-    df = pd.read_pickle(path)
+    # all columns are written back
+    df = utils.load_reviews(date_range=utils.DEFAULT_DATE_RANGE)
 
     df = utils.default_df_filter(df)
     df = df[~df[Review.ISBN].isna()]
@@ -53,7 +67,7 @@ def main():
         else:
             book = books[0]
             publisher = book.publisher()
-            year = book.publishing_year()
+            year = parse_year(book.publishing_year())
             dnb_id = book.identifier()
 
             ids = []
@@ -101,11 +115,7 @@ def main():
     result.reset_index(inplace=True)
 
     # Override
-    path_out = os.path.join(config.DIR_PROCESSED, "reviews.csv")
-    utils.save_gephi_csv(result, path_out)
-
-    path_out = os.path.join(config.DIR_PROCESSED, "reviews.pkl")
-    result.to_pickle(path_out)
+    utils.save_reviews(result)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Finds city names in reviewer descriptions.
+
+A city is found if it occurs in the description as ' <city> ', ' <city>.', ' <city>,', ' <city>;', ' <city>/',
+'/<city>' or at the end as ' <city>'. Every occurrence starts after a space or a slash, so the city names are
+compiled into a trie, and the trie is only walked from these positions.
+"""
+
+# right boundaries after ' <city>', each one that occurs counts as a match
+_RIGHT_BOUNDARIES = (".", ",", ";", "/")
+
+# key of the positions of a city in the list of a trie node
+_END = None
+
+
+class Gazetteer(object):
+    """
+    Parameters
+    ----------
+    cities list of city names. Cities that are listed multiple times are also found multiple times.
+    """
+
+    def __init__(self, cities):
+        self.cities = list(cities)
+        self._trie = {}
+
+        for position, city in enumerate(self.cities):
+            node = self._trie
+            for c in city:
+                node = node.setdefault(c, {})
+            node.setdefault(_END, []).append(position)
+
+    def _occurrences(self, text):
+        """
+        Yields (positions in the city list, character before, character after) of every city that starts after
+        a space or a slash. The character after is None at the end of the text.
+        """
+        n = len(text)
+
+        for start in range(1, n + 1):
+            left = text[start - 1]
+            if left != " " and left != "/":
+                continue
+
+            node = self._trie
+            i = start
+
+            while True:
+                positions = node.get(_END)
+                if positions is not None:
+                    yield positions, left, text[i] if i < n else None
+
+                if i >= n:
+                    break
+
+                node = node.get(text[i])
+                if node is None:
+                    break
+
+                i += 1
+
+    def find(self, text):
+        """
+        Cities found in the text, in the order of the city list.
+
+        As before, a city is returned once if it is surrounded by spaces, otherwise once for every other pattern
+        that occurs.
+
+        Returns
+        -------
+        list of city names
+        """
+        # patterns found per city name, the key is its first position in the city list
+        patterns = {}
+
+        for positions, left, right in self._occurrences(text):
+            found = patterns.get(positions[0])
+            if found is None:
+                found = patterns[positions[0]] = (positions, set())
+
+            if left == "/":
+                found[1].add("/c")
+            elif right is None:
+                found[1].add("$")
+            elif right in _RIGHT_BOUNDARIES or right == " ":
+                found[1].add(right)
+
+        result = []
+        for positions, found in patterns.values():
+            if not found:
+                continue
+
+            # ' c ' is only counted once and ends the search for that city
+            count = 1 if " " in found else len(found)
+            for position in positions:
+                result.append((position, count))
+
+        result.sort()
+        return [self.cities[position] for position, count in result for _ in range(count)]
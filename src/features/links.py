@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Classification of the links found in reviews.
+
+A link is ignored if it contains one of the ignore rules. The rules are compiled into a trie, which is walked from
+each position of the link, so the cost per link does not depend on the number of ignore rules. DNB, category and
+reviewer links are recognized by their prefix, independent of the ignore rules.
+"""
+
+# key of the end of a rule in a trie node
+_END = None
+
+# links to the catalogue of the DNB, the isbn follows the prefix
+DNB_PREFIX = "http://portal.d-nb.de/opac.htm?query="
+
+
+class LinkClassifier(object):
+    """
+    Parameters
+    ----------
+    website url of the website, e.g. config.URL_WEBSITE
+    ignore_urls ignore rules, a link is ignored if it contains one of them
+    """
+
+    DNB = "dnb"
+    CATEGORY = "category"
+    REVIEWER = "reviewer"
+
+    def __init__(self, website, ignore_urls=()):
+        self.website = website
+        self._prefixes = [(DNB_PREFIX, LinkClassifier.DNB),
+                          (website + "/stellenmarkt/index.php?auswahl=", LinkClassifier.CATEGORY),
+                          # reviewer links are relative
+                          ("/rezensionen/rezensionen.php", LinkClassifier.REVIEWER)]
+
+        self._trie = {}
+        for rule in ignore_urls:
+            node = self._trie
+            for c in rule:
+                node = node.setdefault(c, {})
+            node[_END] = True
+
+    def known_class(self, link):
+        """
+        DNB, CATEGORY or REVIEWER, None for all other links
+        """
+        for prefix, link_class in self._prefixes:
+            if link.startswith(prefix):
+                return link_class
+        return None
+
+    def is_ignored(self, link):
+        """
+        True if one of the ignore rules is a substring of the link
+        """
+        if _END in self._trie:
+            # an empty rule is contained in every link
+            return True
+
+        for start in range(len(link)):
+            node = self._trie
+            for c in link[start:]:
+                node = node.get(c)
+                if node is None:
+                    break
+                if _END in node:
+                    return True
+
+        return False
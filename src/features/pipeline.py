@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Downloads articles and extracts their features at the same time. Fetched pages are handed through a bounded queue
+to a pool of parser processes while they are still in memory, and parsed reviews are appended to the processed
+dataset as they arrive. Reviews of pages that did not change are kept from the existing dataset.
+"""
+import logging.config
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import concurrent.futures
+
+import click
+import numpy as np
+
+import archive
+import config
+from db import CrawlManifest
+from download import download
+from features import reviews
+
+logging.config.dictConfig(config.LOGGING_CONFIG)
+logger = logging.getLogger(__name__)
+
+_STOP = None
+
+# seconds between checks whether the parser is still alive while the queue is full
+PUT_TIMEOUT = 1.0
+
+
+def parse_pages(pages, writer, n_processes, parser=reviews.PARSER_BS4):
+    """
+    Takes pages from the queue until _STOP is received and parses them in a process pool.
+    At most 2 pages per process are in flight, the queue blocks the downloaders if parsing falls behind.
+    """
+    max_pending = 2 * (n_processes or os.cpu_count() or 1)
+
+    with ProcessPoolExecutor(max_workers=n_processes, initializer=reviews.init_worker) as pool:
+        pending = set()
+
+        while True:
+            item = pages.get()
+            if item is _STOP:
+                break
+
+            identifier, content = item
+
+            if len(pending) >= max_pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    writer.add(future.result())
+
+            pending.add(pool.submit(reviews.process_document, identifier, content, parser=parser))
+
+        for future in concurrent.futures.as_completed(pending):
+            writer.add(future.result())
+
+
+def run_pipeline(r, store, manifest, writer, sleep, workers=1, rate=None, n_processes=None, queue_size=64,
+                 update=True, parser=reviews.PARSER_BS4):
+    """
+
+    Parameters
+    ----------
+    r ids of the articles to fetch
+    store store for the raw pages
+    manifest crawl manifest
+    writer ReviewWriter for the parsed reviews
+    sleep see download.scrape_loop
+    workers number of download workers
+    rate requests per second
+    n_processes number of parser processes
+    queue_size maximum number of downloaded pages waiting to be parsed
+    update fetch articles again even if they exist
+    parser html parser backend, see features.reviews
+
+    Returns
+    -------
+
+    """
+    pages = queue.Queue(maxsize=queue_size)
+
+    # set when the parser thread fails, the downloaders then stop instead of waiting for the full queue forever
+    stop = threading.Event()
+    errors = []
+
+    def consume():
+        try:
+            parse_pages(pages, writer, n_processes, parser)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    consumer = threading.Thread(target=consume, name="parser")
+    consumer.start()
+
+    def put(item):
+        """
+        Returns False if the item could not be handed over because the parser failed.
+        """
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def on_page(identifier, content):
+        if not put((identifier, archive.normalize_newlines(content))):
+            # the article is recorded as failed, so it is fetched again by the next crawl
+            raise RuntimeError(f"Article {identifier} was not parsed, the parser failed")
+
+    try:
+        download.scrape_loop(r, store, manifest, sleep, update=update, workers=workers, rate=rate, on_page=on_page,
+                             stop=stop)
+    finally:
+        put(_STOP)
+        consumer.join()
+
+    if errors:
+        raise errors[0]
+
+
+@click.command()
+@click.option("--limit", "-ul", "upper_limit", type=int, default=27000)
+@click.option("--lower-limit", "-ll", "lower_limit", type=int, default=26413)
+@click.option("--update/--no-update", default=True)
+@click.option("--sleep", "-s", "sleep", type=float, default=0.5)
+@click.option("--workers", "-w", "workers", type=int, default=1)
+@click.option("--rate", "-r", "rate", type=float, default=None)
+@click.option("--processes", "-p", "n_processes", type=int, default=None)
+@click.option("--queue-size", "queue_size", type=int, default=64)
+@click.option("--parser", "parser", type=click.Choice(reviews.PARSERS), default=reviews.PARSER_BS4)
+@click.option("--format", "-f", "store_format", type=click.Choice(archive.FORMATS), default=archive.FORMAT_HTML)
+@click.option("--output", "-o", "output", type=click.Path(), default=None)
+@click.option("--manifest", "-m", "manifest_path", type=click.Path(), default=config.PATH_MANIFEST)
+@click.option("--csv", "csv_path", type=click.Path(), default=config.PATH_REVIEWS_CSV)
+@click.option("--pickle", "pickle_path", type=click.Path(), default=reviews.DEFAULT_PICKLE_PATH)
+@click.option("--parquet", "parquet_path", type=click.Path(), default=reviews.DEFAULT_PARQUET_PATH)
+@click.option("--failures", "failures_path", type=click.Path(), default=config.PATH_PARSE_FAILURES)
+def main(upper_limit, lower_limit, update, sleep, workers, rate, n_processes, queue_size, parser, store_format,
+         output, manifest_path, csv_path, pickle_path, parquet_path, failures_path):
+    if output is None:
+        output = config.DIR_RAW_SHARDS if store_format == archive.FORMAT_SHARDS else config.DIR_RAW_HTML
+
+    store = archive.open_store(store_format, output)
+    manifest = CrawlManifest(manifest_path)
+
+    if len(manifest) == 0:
+        manifest.seed(store.ids())
+
+    r = np.arange(lower_limit, upper_limit)
+    np.random.shuffle(r)
+
+    writer = reviews.ReviewWriter(csv_path, pickle_path, merge=True, append_every=100, failures_path=failures_path,
+                                  parquet_path=parquet_path)
+    run_pipeline(r, store, manifest, writer, sleep, workers=workers, rate=rate, n_processes=n_processes,
+                 queue_size=queue_size, update=update, parser=parser)
+    writer.close()
+
+    store.close()
+    manifest.close()
+    logger.info("Done.")
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("Interrupted")
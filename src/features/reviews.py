@@ -3,32 +3,124 @@
 This script extracts information from the raw downloaded html files.
 All other scripts build on top of the information extracted from this script.
 """
+import csv
+import hashlib
 import logging.config
 import os
 import re
-from os.path import isfile, join
 
 import bs4
+import click
 import numpy as np
 import pandas
 
+import archive
 import config
+import dataset
+import keyword_index
+import text_store
 import utils
 from utils import AcademicTitleCategory
 from constants import *
-from db import Review
+from db import Review, ReviewBatch, ParseCache
+from features.content import ContentIndex, IGNORED_STRINGS
+from features.gazetteer import Gazetteer
+from features.links import DNB_PREFIX, LinkClassifier
 from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import concurrent.futures
 
+try:
+    from features import reviews_lxml
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 logging.config.dictConfig(config.LOGGING_CONFIG)
 
+PARSER_BS4 = "bs4"
+# only builds the elements used by the extractors, see ContentStrainer
+PARSER_BS4_RESTRICTED = "bs4-restricted"
+# libxml2 repairs broken markup (e.g. unclosed or misnested paragraphs) differently than html.parser, so the
+# extracted rows may differ. It is only used to compare the parsers, see check_parser
+PARSER_LXML = "lxml"
+# parsers that give the same rows, and can be used to build the dataset
+PARSERS = [PARSER_BS4, PARSER_BS4_RESTRICTED]
+
+# the processed dataset is written as Parquet if pyarrow is installed, otherwise as pickle, see ReviewWriter and
+# utils.load_reviews
+DEFAULT_PARQUET_PATH = config.PATH_REVIEWS_PARQUET if dataset.PARQUET_AVAILABLE else None
+DEFAULT_PICKLE_PATH = None if dataset.PARQUET_AVAILABLE else config.PATH_REVIEWS_PICKLE
+
+# increase whenever the extractors change, so cached rows are extracted again, see ParseCache
+EXTRACTOR_VERSION = 2
+
+# strings that are part of the text, same as get_text() of a Tag
+_TEXT_TYPES = (bs4.NavigableString, bs4.CData)
+
 
 class MyException(Exception):
     pass
 
 
-reviewer_gender_map = dict()
+# headings of the reviewer section. The gender of reviewers introduced with MARKER_UNKNOWN is resolved after parsing,
+# see resolve_reviewer_genders
+MARKER_FEMALE = "Rezensentin"
+MARKER_MALE = "Rezensent"
+MARKER_UNKNOWN = "Rezension von"
+MARKER_GENDERS = {MARKER_FEMALE: GENDER_FEMALE, MARKER_MALE: GENDER_MALE}
+
+
+class ExtractionRules(object):
+    """
+    Everything the extractors need besides the page itself: known academic titles, compiled regular expressions,
+    the link classifier and the city gazetteer. Built once per worker process, see init_worker.
+    """
+
+    def __init__(self, known_titles, ignore_urls, cities):
+        self.known_titles = frozenset(known_titles)
+        self.ignore_urls = list(ignore_urls)
+        self.cities = list(cities)
+        self.gazetteer = Gazetteer(self.cities)
+        self.links = LinkClassifier(config.URL_WEBSITE, self.ignore_urls)
+
+        self.date_re = re.compile(r'[0-3][0-9]\.[0-1][0-9]\.[1-2][0-9][0-9][0-9]')
+        self.all_reviews_re = re.compile(r'Alle \d+ Rezensionen von')
+        # matches 3 groups: [publisher] ([location]) [year]
+        self.publisher_re = re.compile(r"(.+)\s+\((.+)\)\s+(\d+)")
+        self.page_re = re.compile(r"(\d+) Seiten")
+
+    @classmethod
+    def load(cls):
+        return cls(utils.load_list(config.PATH_TITLES), utils.get_ignore_urls(), utils.get_german_cities())
+
+    def fingerprint(self):
+        """
+        Hash of the resources the rules were built from
+        """
+        h = hashlib.sha1()
+        for values in (sorted(self.known_titles), self.ignore_urls, self.cities):
+            h.update("\n".join(values).encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+
+# rules of the current process
+_rules = None
+
+
+def init_worker(rules=None):
+    """
+    Initializer for worker processes. Loads the extraction rules, unless they are given.
+    """
+    global _rules
+    _rules = rules if rules is not None else ExtractionRules.load()
+
+
+def get_rules() -> ExtractionRules:
+    if _rules is None:
+        init_worker()
+    return _rules
 
 
 def get_id_from_file_name(file):
@@ -37,7 +129,7 @@ def get_id_from_file_name(file):
     return int(str_id)
 
 
-def extract_category(current_review: Review, soup):
+def extract_category(current_review: Review, index: ContentIndex, rules: ExtractionRules):
     """
     Not all articles are assigned to a category. Additionally, some articles are assigned to multiple categories.
     ATM, we are unable to handle this.
@@ -45,31 +137,31 @@ def extract_category(current_review: Review, soup):
     Parameters
     ----------
     current_review
-    soup
+    index content of the contentbox
+    rules
 
     Returns
     -------
 
     """
-    links = []
-    for link in soup.findAll('a', attrs={'href': re.compile("^https://")}):
-        links.append(link.get('href'))
+    links = index.links("https://")
 
     # find category
 
-    url = config.URL_WEBSITE + "/stellenmarkt/index.php?auswahl="
     for link in links:
-        if link.startswith(url):
+        if rules.links.known_class(link) == LinkClassifier.CATEGORY:
             category = link.split("=")[1]
             current_review.category = category
             logger.info("Category: %s", category)
             return
 
 
-def extract_reviewer_id(current_review, contentbox):
+def extract_reviewer_id(current_review, index: ContentIndex, rules: ExtractionRules):
     # find reviewer id
-    for link in contentbox.findAll('a', attrs={'href': re.compile(r"^/rezensionen/rezensionen\.php")}):
-        href = link.get('href')
+    for href in index.hrefs:
+        if rules.links.known_class(href) != LinkClassifier.REVIEWER:
+            continue
+
         reviewer_id = int(href.split("=")[1])
         logger.info("Reviewer-ID: %d", reviewer_id)
         current_review.reviewer_id = reviewer_id
@@ -79,36 +171,29 @@ def extract_reviewer_id(current_review, contentbox):
     raise MyException(msg)
 
 
-def process_links(current_review: Review, contentbox, ignore=None):
+def process_links(current_review: Review, index: ContentIndex, rules: ExtractionRules):
     """
     Processes all links in the contentbox. Finds the DNB link (with the isbn) and the reviewer id
 
     Parameters
     ----------
     current_review
-    contentbox
-    ignore
+    index content of the contentbox
+    rules
 
     Returns
     -------
 
     """
-    links = []
-
-    for link in contentbox.findAll('a', attrs={'href': re.compile("^http://")}):
-        links.append(link.get('href'))
-
-    for link in contentbox.findAll('a', attrs={'href': re.compile("^https://")}):
-        links.append(link.get('href'))
+    links = index.links("http://") + index.links("https://")
 
     # find dnb link and isbn
-    url = "http://portal.d-nb.de/opac.htm?query="
     for link in links:
-        if link.startswith(url):
+        if rules.links.known_class(link) == LinkClassifier.DNB:
             logger.debug("DNB-Link: %s", link)
             current_review.dnb_link = link
 
-            isbn = link[len(url):].split("&")[0]
+            isbn = link[len(DNB_PREFIX):].split("&")[0]
             current_review.isbn = isbn
             break
 
@@ -116,14 +201,7 @@ def process_links(current_review: Review, contentbox, ignore=None):
     filtered_links = []
 
     for link in links:
-        flag = False
-
-        for url in ignore:
-            if url in link:
-                flag = True
-                break
-
-        if not flag:
+        if not rules.links.is_ignored(link):
             logger.debug("Found link '%s'", link)
             filtered_links.append(link)
 
@@ -131,18 +209,18 @@ def process_links(current_review: Review, contentbox, ignore=None):
     return True
 
 
-def extract_review_headings(current_review, contentbox):
+def extract_review_headings(current_review, index: ContentIndex):
     """
     Extract headings from text
 
     :param current_review:
-    :param contentbox:
+    :param index: content of the contentbox
     :return:
     """
     headings = list()
 
-    for heading in contentbox.find_all('h2'):
-        head = heading.text
+    for heading in index.headings:
+        head = index.text(heading)
 
         if head is None or len(head) == 0:
             continue
@@ -155,15 +233,15 @@ def extract_review_headings(current_review, contentbox):
     return True
 
 
-def extract_review_text(current_review, contentbox):
+def extract_review_text(current_review, index: ContentIndex):
     text_fragments = list()
 
     logger.debug("Extracting text...")
 
-    for s in contentbox.find_all(["p"])[3:-7]:
+    for s in index.paragraphs[3:-7]:
 
-        # t = " ".join(s.stripped_strings)
-        t = s.text
+        # t = " ".join(index.stripped_strings(s))
+        t = index.text(s)
 
         if t is None or len(t) == 0:
             continue
@@ -193,16 +271,17 @@ def extract_review_text(current_review, contentbox):
     return True
 
 
-def extract_reviewer_title(current_review: Review, reviewer_name):
+def extract_reviewer_title(current_review: Review, reviewer_name, rules: ExtractionRules):
     """
     Extracts the reviewers title (e.g. Prof. Dr. phil) from the given name
 
     :param current_review:
     :param reviewer_name:
+    :param rules:
     :return:
     """
 
-    known_titles = utils.load_list(config.PATH_TITLES)
+    known_titles = rules.known_titles
     nameparts = reviewer_name.split(" ")
 
     if len(nameparts) == 0:
@@ -262,41 +341,30 @@ def extract_reviewer_title(current_review: Review, reviewer_name):
     return True
 
 
-def extract_reviewer(current_review: Review, soup):
+def extract_reviewer(current_review: Review, index: ContentIndex, rules: ExtractionRules):
     """
-    Look for Name, Gender and Description of reviewer in article
+    Look for Name, Marker and Description of reviewer in article. The gender is only known if the marker is
+    MARKER_FEMALE or MARKER_MALE
 
     :param current_review:
-    :param soup:
+    :param index: content of the contentbox
+    :param rules:
 
     :return:
     """
     reviewer_name = None
     reviewer_desc = None
-    reviewer_gender = None
+    reviewer_marker = None
 
-    iterator = soup.stripped_strings
+    iterator = iter(index.stripped_strings())
     for s in iterator:
-        if s == "Rezensentin":
+        if s in (MARKER_FEMALE, MARKER_MALE, MARKER_UNKNOWN):
+            reviewer_marker = s
             reviewer_name = next(iterator)
             reviewer_desc = next(iterator)
-            reviewer_gender = GENDER_FEMALE
-            reviewer_gender_map[reviewer_name] = reviewer_gender
-            break
-        elif s == "Rezensent":
-            reviewer_name = next(iterator)
-            reviewer_desc = next(iterator)
-            reviewer_gender = GENDER_MALE
-            reviewer_gender_map[reviewer_name] = reviewer_gender
-            break
-        elif s == "Rezension von":
-            reviewer_name = next(iterator)
-            reviewer_desc = next(iterator)
-            # actually, we should match using ids. however we assume that an equal name implies an equal gender
-            reviewer_gender = reviewer_gender_map.get(reviewer_name, GENDER_ELSE)
             break
 
-    if reviewer_name is None or reviewer_desc is None or reviewer_gender is None:
+    if reviewer_name is None or reviewer_desc is None:
         msg = f"No Reviewer found ({current_review})"
         raise MyException(msg)
 
@@ -304,25 +372,27 @@ def extract_reviewer(current_review: Review, soup):
         reviewer_desc = utils.clean_html_text(reviewer_desc)
 
         # filter missing descriptions
-        ex = re.findall(r'Alle \d+ Rezensionen von', reviewer_desc)
+        ex = rules.all_reviews_re.findall(reviewer_desc)
         if len(ex) != 0 or reviewer_desc == "E-Mail" or reviewer_desc == "Homepage":
             reviewer_desc = None
 
         current_review.reviewer_name = utils.clean_html_text(reviewer_name)
         current_review.reviewer_description = reviewer_desc
-        current_review.reviewer_gender = reviewer_gender
+        current_review.reviewer_marker = reviewer_marker
+        # None for MARKER_UNKNOWN, resolved once all reviews are parsed
+        current_review.reviewer_gender = MARKER_GENDERS.get(reviewer_marker)
 
-    logger.info("Reviewer: '%s' (Gender: %s)", reviewer_name, current_review.reviewer_gender)
+    logger.info("Reviewer: '%s' (%s)", reviewer_name, reviewer_marker)
     logger.info("Reviewer Description: '%s'", reviewer_desc)
-    extract_reviewer_title(current_review, current_review.reviewer_name)
+    extract_reviewer_title(current_review, current_review.reviewer_name, rules)
 
     return True
 
 
-def extract_dates(current_review: Review, soup):
-    for s in soup.stripped_strings:
+def extract_dates(current_review: Review, index: ContentIndex, rules: ExtractionRules):
+    for s in index.stripped_strings():
         if "Rezension vom" in s:
-            date = re.findall(r'[0-3][0-9]\.[0-1][0-9]\.[1-2][0-9][0-9][0-9]', s)
+            date = rules.date_re.findall(s)
 
             if len(date) == 0:
                 msg = "No Date found (%s)" % current_review
@@ -398,13 +468,14 @@ def extract_meta_keywords(current_review: Review, soup, filter_annotation_keywor
     return True
 
 
-def process_review_header(current_review: Review, header) -> None:
+def process_review_header(current_review: Review, header, rules: ExtractionRules) -> None:
     """
 
     Parameters
     ----------
     current_review
     header
+    rules
 
     Returns
     -------
@@ -420,9 +491,8 @@ def process_review_header(current_review: Review, header) -> None:
 
     title_segments = []
 
-    # matches 3 groups: [publisher] ([location]) [year]
-    publisher_re = re.compile(r"(.+)\s+\((.+)\)\s+(\d+)")
-    page_re = re.compile(r"(\d+) Seiten")
+    publisher_re = rules.publisher_re
+    page_re = rules.page_re
 
     for i, segment in enumerate(segments):
         segment = segment.strip()
@@ -490,22 +560,22 @@ def process_review_header(current_review: Review, header) -> None:
         logger.warning(f"No Publisher Segment found ({current_review})")
 
 
-def extract_from_article_heading(current_review: Review, soup):
+def extract_from_article_heading(current_review: Review, index: ContentIndex, rules: ExtractionRules):
     """
 
     Parameters
     ----------
     current_review
-    soup
+    index content of the contentbox
+    rules
 
     Returns
     -------
 
     """
-    first_paragraph = list(soup.find_all("p"))[0]
+    first_paragraph = index.paragraphs[0]
 
-    strings = []
-    strings.extend(first_paragraph.stripped_strings)
+    strings = index.stripped_strings(first_paragraph)
 
     heading = []
     for s in strings[:3]:
@@ -520,48 +590,15 @@ def extract_from_article_heading(current_review: Review, soup):
         # heading does not contain ':'
         raise MyException(f"Malformed Article Heading: '{heading}'")
     else:
-        process_review_header(current_review, heading)
+        process_review_header(current_review, heading, rules)
 
 
-def guess_city(current_review: Review, cities):
+def guess_city(current_review: Review, gazetteer: Gazetteer):
     found_cities = []
 
     if current_review.reviewer_description:
-        for city in cities:
-            n_city = " " + city + " "
-            if n_city in current_review.reviewer_description:
-                logger.debug("Found City: %s", city)
-                found_cities.append(city)
-                continue
-            n_city = " " + city + "."
-            if n_city in current_review.reviewer_description:
-                logger.debug("Found City: %s", city)
-                found_cities.append(city)
-
-            n_city = " " + city + ","
-            if n_city in current_review.reviewer_description:
-                logger.debug("Found City: %s", city)
-                found_cities.append(city)
-
-            n_city = " " + city + ";"
-            if n_city in current_review.reviewer_description:
-                logger.debug("Found City: %s", city)
-                found_cities.append(city)
-
-            n_city = " " + city + "/"
-            if n_city in current_review.reviewer_description:
-                logger.debug("Found City: %s", city)
-                found_cities.append(city)
-
-            n_city = "/" + city
-            if n_city in current_review.reviewer_description:
-                logger.debug("Found City: %s", city)
-                found_cities.append(city)
-
-            n_city = " " + city
-            if current_review.reviewer_description.endswith(n_city):
-                logger.debug("Found City: %s", city)
-                found_cities.append(city)
+        found_cities = gazetteer.find(current_review.reviewer_description)
+        logger.debug("Found Cities: %s", found_cities)
 
     current_review.reviewer_location = found_cities
 
@@ -579,122 +616,639 @@ def is_not_found(soup) -> bool:
     return False
 
 
-def process_single_file(path, filter_urls, cities) -> Review:
-    logger.info(f"Processing file: '{path}'")
-    review_id = get_id_from_file_name(path)
+class ContentStrainer(bs4.SoupStrainer):
+    """
+    Only the title, the meta tags and the contentbox divs (with everything inside) are turned into tags. Navigation,
+    ads and footer are skipped by the parser.
+    """
+
+    def __init__(self):
+        super().__init__()
+
+    @staticmethod
+    def is_content(name, attrs):
+        if name == "title" or name == "meta":
+            return True
+
+        if name != "div" or not attrs:
+            return False
+
+        classes = attrs.get("class") or ""
+        if isinstance(classes, str):
+            classes = classes.split()
+
+        return "contentbox" in classes
+
+    # beautifulsoup >= 4.13
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        return ContentStrainer.is_content(name, attrs)
+
+    def allow_string_creation(self, string):
+        # strings outside of the elements above
+        return False
+
+    # beautifulsoup < 4.13
+    def search_tag(self, markup_name=None, markup_attrs={}):
+        return ContentStrainer.is_content(markup_name, markup_attrs)
+
+
+def _visit(tag, index, ignore_strings):
+    for child in tag.contents:
+        if isinstance(child, bs4.Tag):
+            index.start_element(child.name, child.get("href") if child.name == "a" else None)
+            _visit(child, index, ignore_strings or child.name in IGNORED_STRINGS)
+            index.end_element()
+        elif not ignore_strings and type(child) in _TEXT_TYPES:
+            # comments, doctype etc. are not part of the text
+            index.add_string(child)
+
+
+def build_content_index(contentbox) -> ContentIndex:
+    """
+    Collects strings, paragraphs, headings and links of the contentbox in a single pass
+    """
+    if LXML_AVAILABLE and isinstance(contentbox, reviews_lxml.LxmlTag):
+        return reviews_lxml.build_content_index(contentbox)
+
+    index = ContentIndex()
+    _visit(contentbox, index, contentbox.name in IGNORED_STRINGS)
+    return index
+
+
+def parse_document(content, parser=PARSER_BS4):
+    """
+    Parses the page with the given backend. The lxml backend returns a tag that behaves like the BeautifulSoup one
+    for all the extractors.
+    """
+    if parser == PARSER_LXML:
+        if not LXML_AVAILABLE:
+            raise RuntimeError("lxml not available. Install the lxml package.")
+        return reviews_lxml.parse(content)
+
+    if parser == PARSER_BS4:
+        return bs4.BeautifulSoup(content, features="html.parser")
+
+    if parser == PARSER_BS4_RESTRICTED:
+        return bs4.BeautifulSoup(content, features="html.parser", parse_only=ContentStrainer())
+
+    raise ValueError(f"Unknown parser: '{parser}'")
+
+
+def process_document(review_id, content, rules=None, parser=PARSER_BS4) -> Review:
+    """
+    Extracts the review from the page. Uses the rules of the current process if no rules are given.
+    """
+    if rules is None:
+        rules = get_rules()
 
     current_review = Review(identifier=review_id)
+    soup = parse_document(content, parser)
+
+    # filter 404
+    if is_not_found(soup):
+        logger.info(f"Review {current_review} not found (404)")
+        current_review.not_found = True
+    else:
+        try:
+            extract_meta_keywords(current_review, soup)
+            extract_description(current_review, soup)
+
+            contentboxes = soup.find_all("div", attrs={"class": "contentbox"})
+            main_content = build_content_index(contentboxes[0])
+            extract_from_article_heading(current_review, main_content, rules)
+
+            # from text
+            extract_dates(current_review, main_content, rules)
+            extract_reviewer(current_review, main_content, rules)
+            extract_review_text(current_review, main_content)
+            extract_review_headings(current_review, main_content)
+            process_links(current_review, main_content, rules)
+            extract_reviewer_id(current_review, main_content, rules)
+
+            # extract category from other contentbox
+            extract_category(current_review, build_content_index(contentboxes[2]), rules)
+
+            # from reviewer description
+            guess_city(current_review, rules.gazetteer)
+
+        except KeyboardInterrupt as e:
+            # reraise keboard interrupt
+            raise e
+        except MyException as e:
+            logger.warning(f"{e}")
+            current_review.parsed_success = False
+            current_review.parse_error_type = type(e).__name__
+            current_review.parse_error = str(e)
+        except Exception as e:
+            logger.exception(e)
+            current_review.parsed_success = False
+            current_review.parse_error_type = type(e).__name__
+            current_review.parse_error = str(e)
+        else:
+            logger.info(f"Review Processed: '{current_review}'")
+
+    return current_review
+
+
+def process_single_file(path, rules=None, parser=PARSER_BS4) -> Review:
+    logger.info(f"Processing file: '{path}'")
+    review_id = get_id_from_file_name(path)
 
     with open(path, "r") as f:
         content = f.read()
-        soup = bs4.BeautifulSoup(content, features="html.parser")
 
-        # filter 404
-        if is_not_found(soup):
-            logger.info(f"Review {current_review} not found (404)")
-            current_review.not_found = True
+    return process_document(review_id, content, rules=rules, parser=parser)
+
+
+def process_stored_review(review_id, store_format, store_path, parser=PARSER_BS4) -> Review:
+    """
+    Processes a review from the raw page store. The store is opened once per worker process.
+    """
+    logger.info(f"Processing review: '{review_id}'")
+    content = archive.open_store(store_format, store_path).get(review_id)
+    return process_document(review_id, content, parser=parser)
+
+
+# positions in the row tuples, see Review.to_row
+_ROW_ID = Review.POSITIONS[Review.ID]
+_ROW_NOT_FOUND = Review.POSITIONS[Review.NOT_FOUND]
+_ROW_PARSED_SUCCESS = Review.POSITIONS[Review.PARSED_SUCCESS]
+_ROW_PARSE_ERROR = Review.POSITIONS[Review.PARSE_ERROR]
+_ROW_PARSE_ERROR_TYPE = Review.POSITIONS[Review.PARSE_ERROR_TYPE]
+
+# fields of the processed dataset, failure reasons are kept in the separate failures csv
+DATASET_FIELDS = tuple(field for field in Review.FIELDS if field not in (Review.PARSE_ERROR, Review.PARSE_ERROR_TYPE))
+
+# rows per chunk when the streamed dataset is written, see ReviewWriter
+CLOSE_CHUNK_SIZE = 10000
+# columns read for all reviews when the streamed dataset is written: the order, the genders and the integer columns,
+# which are floats if any review lacks them
+_CLOSE_KEY_FIELDS = (Review.ID, Review.DATE, Review.REVIEWER_ID, Review.REVIEWER_MARKER, Review.REVIEWER_GENDER,
+                     Review.WORD_COUNT, Review.PAGES, Review.PUBLISHED_YEAR)
+
+
+def extractor_version(rules: ExtractionRules, parser=PARSER_BS4):
+    """
+    Version of the cached rows. Besides EXTRACTOR_VERSION, rows depend on the resources of the rules, on the fields of
+    a review and on the parser backend, which do not build exactly the same trees for malformed pages.
+    """
+    h = hashlib.sha1(rules.fingerprint().encode("ascii"))
+    h.update(",".join(Review.FIELDS).encode("ascii"))
+    return f"{EXTRACTOR_VERSION}-{parser}-{h.hexdigest()}"
+
+
+def resolve_reviewer_genders(df: pandas.DataFrame):
+    """
+    Second pass of the gender extraction. Reviews that only say "Rezension von" get the gender of the same reviewer
+    (by reviewer id) from the latest review with an explicit marker, or GENDER_ELSE if there is none. The result only
+    depends on the reviews, not on the order in which they were parsed.
+
+    Reviews without marker (datasets written before markers were extracted) keep their gender.
+
+    Parameters
+    ----------
+    df processed reviews, modified in place
+
+    Returns
+    -------
+
+    """
+    if Review.REVIEWER_MARKER not in df:
+        return
+
+    explicit = df[Review.REVIEWER_MARKER].astype(object).map(MARKER_GENDERS)
+    known = df.loc[explicit.notna(), [Review.REVIEWER_ID, Review.DATE, Review.ID]].assign(gender=explicit)
+    known.reset_index(drop=True, inplace=True)
+    known = known.sort_values(by=[Review.DATE, Review.ID], na_position="first", kind="stable")
+    genders = known.drop_duplicates(subset=Review.REVIEWER_ID, keep="last").set_index(Review.REVIEWER_ID)["gender"]
+
+    unknown = df[Review.REVIEWER_MARKER] == MARKER_UNKNOWN
+    resolved = df.loc[unknown, Review.REVIEWER_ID].map(genders).fillna(GENDER_ELSE)
+
+    # columns read from Parquet may be read-only views of the arrow buffers
+    reviewer_genders = df[Review.REVIEWER_GENDER].copy()
+    reviewer_genders.loc[unknown] = resolved
+    df[Review.REVIEWER_GENDER] = reviewer_genders
+
+    n_resolved = resolved.ne(GENDER_ELSE).sum()
+    logger.info(f"Resolved gender of {n_resolved}/{unknown.sum()} reviews without explicit marker")
+
+
+class ReviewWriter(object):
+    """
+    Collects parsed reviews and writes the processed dataset (csv and, unless its path is None, pickle) when closed.
+    Reviews that could not be parsed are written to a separate csv, together with the reason.
+
+    With `parquet_path`, rows are not held in memory but streamed to a temporary Parquet file in row groups, and the
+    dataset is additionally written as Parquet. Only the positions of the rows are kept until the writer is closed.
+    close first reads the dates, reviewer ids and markers of all reviews to sort them and resolve the genders, then
+    writes the outputs in chunks of CLOSE_CHUNK_SIZE rows. Only a pickle, if requested, needs memory for all reviews.
+    The texts are written to a text store next to the Parquet file, see text_store. The keywords are additionally
+    written as keyword index next to the dataset, see keyword_index.
+
+    If `append_every` is set, rows are additionally appended to a temporary csv (<csv>.tmp) as they arrive, so the
+    dataset grows while reviews are still being processed. On close, the genders are resolved over all reviews (see
+    resolve_reviewer_genders), and the temporary csv is rewritten sorted by date and replaces the csv. The csv of an
+    existing dataset is kept if the writer is not closed.
+    With `merge`, reviews (and failures) of an existing dataset are kept unless they are processed again.
+    """
+
+    def __init__(self, csv_path, pickle_path, merge=False, append_every=None, failures_path=None, parquet_path=None):
+        self.csv_path = csv_path
+        self.pickle_path = pickle_path
+        self.parquet_path = parquet_path
+        self.failures_path = failures_path
+        self.append_every = append_every
+        self.merge = merge
+
+        self.n_total = 0
+        self.n_notfound = 0
+        self.n_parse_failed = 0
+
+        self._rows = {}
+        self._failures = {}
+        self._pending = []
+        self._csv_started = False
+
+        # review id -> position in the temporary file, None if the review has been removed again
+        self._positions = {}
+        self._parts = None
+
+        if parquet_path is not None:
+            self._parts = dataset.ParquetRowWriter(parquet_path + ".parts", DATASET_FIELDS)
+        elif merge and pickle_path and os.path.exists(pickle_path):
+            df = pandas.read_pickle(pickle_path)
+            logger.info(f"Merging with {len(df)} existing reviews")
+            rows = df.reindex(columns=list(Review.FIELDS)).itertuples(index=False, name=None)
+            self._rows = {row[_ROW_ID]: row for row in rows}
+
+        if merge and failures_path and os.path.exists(failures_path):
+            df = load_parse_failures(failures_path)
+            self._failures = {row[Review.ID]: row for row in df.to_dict("records")}
+
+    def add(self, review: Review):
+        self.add_row(review.to_row())
+
+    def add_batch(self, batch: ReviewBatch):
+        for row in batch.rows:
+            self.add_row(row)
+
+    def _store(self, review_id, row):
+        if self._parts is not None:
+            self._positions[review_id] = self._parts.add(row)
         else:
-            try:
-                extract_meta_keywords(current_review, soup)
-                extract_description(current_review, soup)
-
-                contentboxes = soup.find_all("div", attrs={"class": "contentbox"})
-                main_content = contentboxes[0]
-                extract_from_article_heading(current_review, main_content)
-
-                # from text
-                extract_dates(current_review, main_content)
-                extract_reviewer(current_review, main_content)
-                extract_review_text(current_review, main_content)
-                extract_review_headings(current_review, main_content)
-                process_links(current_review, main_content, ignore=filter_urls)
-                extract_reviewer_id(current_review, main_content)
-
-                # extract category from other contentbox
-                extract_category(current_review, contentboxes[2])
-
-                # from reviewer description
-                guess_city(current_review, cities=cities)
-
-            except KeyboardInterrupt as e:
-                # reraise keboard interrupt
-                raise e
-            except MyException as e:
-                logger.warning(f"{e}")
-                current_review.parsed_success = False
-            except Exception as e:
-                logger.exception(e)
-                current_review.parsed_success = False
-            else:
-                logger.info(f"File Processed: '{path}'")
+            self._rows[review_id] = row
 
-    return current_review
+    def _remove(self, review_id):
+        if self._parts is not None:
+            # the row stays in the temporary file, but is skipped
+            self._positions[review_id] = None
+        else:
+            self._rows.pop(review_id, None)
+
+    def add_row(self, row):
+        """
+        Adds a review given as row tuple, see Review.to_row
+        """
+        self.n_total += 1
+        review_id = row[_ROW_ID]
 
+        self._failures.pop(review_id, None)
 
-def main(csv_path=os.path.join(config.DIR_PROCESSED, "reviews.csv"),
-         pickle_path=os.path.join(config.DIR_PROCESSED, "reviews.pkl"),
-         n_processes=None):
+        if row[_ROW_NOT_FOUND]:
+            self.n_notfound += 1
+            self._remove(review_id)
+            return
+
+        if not row[_ROW_PARSED_SUCCESS]:
+            self.n_parse_failed += 1
+            self._remove(review_id)
+            self._failures[review_id] = {Review.ID: review_id,
+                                         Review.PARSE_ERROR_TYPE: row[_ROW_PARSE_ERROR_TYPE],
+                                         Review.PARSE_ERROR: row[_ROW_PARSE_ERROR]}
+            return
+
+        self._store(review_id, row)
+
+        if self.append_every:
+            self._pending.append(row)
+
+            if len(self._pending) >= self.append_every:
+                self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+
+        # failure reasons are kept in the separate failures csv
+        df = pandas.DataFrame(ReviewBatch(self._pending).columns(DATASET_FIELDS))
+        df.set_index(Review.ID, drop=False, inplace=True)
+        df.to_csv(self.csv_path + ".tmp", sep=";", quoting=csv.QUOTE_ALL, mode="a" if self._csv_started else "w",
+                  header=not self._csv_started)
+        self._csv_started = True
+        self._pending = []
+
+    def log_stats(self):
+        n_found = self.n_total - self.n_notfound
+        unfound_ratio = self.n_notfound / max(self.n_total, 1)
+        unparsed_ratio = self.n_parse_failed / max(n_found, 1)
+
+        logger.warning(f"Not found: {self.n_notfound}/{self.n_total} {unfound_ratio:.2%}")
+        logger.warning(f"Not parsable: {self.n_parse_failed}/{n_found} ({unparsed_ratio:.2%})")
+        logger.warning(f"Parsable: {n_found - self.n_parse_failed}")
+
+    def _existing_source(self):
+        """
+        Parquet file and text store of the existing dataset, (None, None) if there is none
+        """
+        # datasets written before Parquet was available only exist as pickle
+        pickle_path = self.pickle_path or config.PATH_REVIEWS_PICKLE
+
+        if os.path.exists(self.parquet_path):
+            texts_path = text_store.path_for(self.parquet_path)
+            return self.parquet_path, text_store.TextStore(texts_path) if os.path.exists(texts_path) else None
+
+        if os.path.exists(pickle_path):
+            # converted once, the texts stay in the converted file
+            existing = pandas.read_pickle(pickle_path)
+            dataset.write_reviews(existing.reindex(columns=list(DATASET_FIELDS)), self.parquet_path + ".merge")
+            return self.parquet_path + ".merge", None
+
+        return None, None
+
+    def _close_streamed(self):
+        """
+        Writes the outputs from the temporary file and the existing dataset in chunks of CLOSE_CHUNK_SIZE rows, so only
+        the columns needed for the order and the genders are held for all reviews
+        """
+        self._parts.close()
+        paths = [self._parts.path]
+        positions = [np.array(sorted(p for p in self._positions.values() if p is not None), dtype=np.int64)]
+        stores = [None]
+
+        if self.merge:
+            path, store = self._existing_source()
+            if path is not None:
+                ids = dataset.read_reviews(path, columns=[Review.ID])[Review.ID].to_numpy()
+                logger.info(f"Merging with {len(ids)} existing reviews")
+                # existing reviews go first, like in the in-memory writer
+                paths.insert(0, path)
+                positions.insert(0, np.flatnonzero(~np.isin(ids, list(self._positions))))
+                stores.insert(0, store)
+
+        files = np.repeat(np.arange(len(paths)), [len(p) for p in positions])
+        positions = np.concatenate(positions)
+
+        # first pass: order and genders
+        keys = dataset.table_to_dataframe(dataset.take_rows_of_files(
+            paths, files, positions, dataset.review_schema(_CLOSE_KEY_FIELDS)))
+        order = np.argsort(keys[Review.DATE].to_numpy(), kind="stable")
+        keys = keys.iloc[order]
+        resolve_reviewer_genders(keys)
+        files = files[order]
+        positions = positions[order]
+
+        # integer columns with missing values are floats in a dataframe of all reviews, also in the csv
+        float_columns = [c for c in _CLOSE_KEY_FIELDS if keys[c].dtype.kind == "f"]
+
+        self.log_stats()
+
+        # second pass: the outputs are written chunk by chunk
+        schema = dataset.review_schema(DATASET_FIELDS)
+        parquet_fields = [field for field in DATASET_FIELDS if field != Review.TEXT]
+        parquet = dataset.DataFrameWriter(self.parquet_path + ".tmp", parquet_fields)
+        texts = text_store.TextStoreWriter(text_store.path_for(self.parquet_path))
+        keywords = keyword_index.KeywordIndexBuilder()
+        pickled = []
+
+        logger.info(f"Saving to '{self.csv_path}'")
+        for start in range(0, max(len(keys), 1), CLOSE_CHUNK_SIZE):
+            chunk = slice(start, start + CLOSE_CHUNK_SIZE)
+            df = dataset.table_to_dataframe(dataset.take_rows_of_files(paths, files[chunk], positions[chunk], schema))
+            df[Review.REVIEWER_GENDER] = keys[Review.REVIEWER_GENDER].to_numpy()[chunk]
+            df[Review.REVIEWER_GENDER] = df[Review.REVIEWER_GENDER].astype(dataset.GENDER_DTYPE)
+            for column in float_columns:
+                df[column] = df[column].astype(float)
+
+            for i, store in enumerate(stores):
+                selected = files[chunk] == i
+                if store is not None and selected.any():
+                    df.loc[selected, Review.TEXT] = [store.get(review_id) for review_id in df[Review.ID][selected]]
+
+            df.to_csv(self.csv_path + ".tmp", sep=";", quoting=csv.QUOTE_ALL, mode="a" if start else "w",
+                      header=not start)
+            parquet.add(df)
+            texts.add(df[Review.ID], df[Review.TEXT])
+            keywords.add(df[Review.ID], df[Review.KEYWORDS])
+            if self.pickle_path is not None:
+                pickled.append(df)
+
+        for store in stores:
+            if store is not None:
+                store.close()
+
+        parquet.close()
+        texts.close()
+        keywords.build().save(keyword_index.path_for(self.parquet_path))
+        os.replace(self.parquet_path + ".tmp", self.parquet_path)
+        os.replace(self.csv_path + ".tmp", self.csv_path)
+
+        if self.pickle_path is not None:
+            # the pickle can only be written as a whole
+            logger.info(f"Saving to '{self.pickle_path}'")
+            pandas.concat(pickled).to_pickle(self.pickle_path)
+
+        os.remove(self._parts.path)
+        if os.path.exists(self.parquet_path + ".merge"):
+            os.remove(self.parquet_path + ".merge")
+
+    def _close_in_memory(self):
+        logger.info("Creating dataframe ...")
+        df = pandas.DataFrame(ReviewBatch(self._rows.values()).columns(DATASET_FIELDS))
+        df.set_index(Review.ID, drop=False, inplace=True)
+
+        df.sort_values(by=Review.DATE, inplace=True, ascending=True, kind="stable")
+        resolve_reviewer_genders(df)
+        dataset.encode_categoricals(df)
+
+        self.log_stats()
+
+        # the csv is replaced when complete, like the other outputs
+        utils.save_gephi_csv(df, self.csv_path + ".tmp")
+        os.replace(self.csv_path + ".tmp", self.csv_path)
+
+        if self.pickle_path is not None:
+            logger.info(f"Saving to '{self.pickle_path}'")
+            df.to_pickle(self.pickle_path)
+            keyword_index.KeywordIndex.build(df[Review.ID], df[Review.KEYWORDS]).save(
+                keyword_index.path_for(self.pickle_path))
+
+    def close(self):
+        self.flush()
+
+        if self._parts is not None:
+            self._close_streamed()
+        else:
+            self._close_in_memory()
+
+        if self.failures_path:
+            columns = [Review.ID, Review.PARSE_ERROR_TYPE, Review.PARSE_ERROR]
+            df = pandas.DataFrame(list(self._failures.values()), columns=columns)
+            df.sort_values(by=Review.ID, inplace=True)
+            logger.info(f"Saving {len(df)} parse failures to '{self.failures_path}'")
+            df.to_csv(self.failures_path, index=False, encoding="utf-8")
+
+
+def load_parse_failures(path=config.PATH_PARSE_FAILURES) -> pandas.DataFrame:
     """
+    Loads ids, error types and error messages of the reviews that could not be parsed
+    """
+    return pandas.read_csv(path, encoding="utf-8", dtype={Review.PARSE_ERROR_TYPE: str, Review.PARSE_ERROR: str})
+
+
+def make_chunks(review_ids, sizes, n_workers, max_chunk_size=64):
+    """
+    Splits the reviews into chunks, largest pages first. Chunks hold roughly the same number of bytes, so the large
+    pages are spread over many small chunks at the beginning and no worker is left with a large page at the end.
 
     Parameters
     ----------
-    csv_path csv output
-    pickle_path pickled dataframe output
-    n_processes number of workers to use
+    review_ids ids of the reviews
+    sizes sizes of the pages in bytes, in the same order
+    n_workers number of worker processes
+    max_chunk_size maximum number of reviews per chunk
+
     Returns
     -------
+    list of lists of ids
+    """
+    order = np.argsort(-np.asarray(sizes, dtype=np.int64), kind="stable")
+    # about 8 chunks per worker
+    budget = max(1, int(np.sum(sizes)) // (8 * n_workers))
 
+    chunks = []
+    chunk = []
+    chunk_bytes = 0
+
+    for i in order:
+        chunk.append(int(review_ids[i]))
+        chunk_bytes += int(sizes[i])
+
+        if chunk_bytes >= budget or len(chunk) >= max_chunk_size:
+            chunks.append(chunk)
+            chunk = []
+            chunk_bytes = 0
+
+    if chunk:
+        chunks.append(chunk)
+
+    return chunks
+
+
+def process_chunk(review_ids, store_format, store_path, parser=PARSER_BS4):
     """
-    allfiles = [f for f in os.listdir(config.DIR_RAW_HTML) if isfile(join(config.DIR_RAW_HTML, f)) and str(f)[0] != "."]
-    allfiles = [os.path.join(config.DIR_RAW_HTML, f) for f in allfiles]
+    Processes a chunk of reviews in a worker process
 
-    logger.info(f"Data dir contains {len(allfiles)} files")
-    allfiles.sort(key=get_id_from_file_name)
+    Returns
+    -------
+    ReviewBatch
+    """
+    batch = ReviewBatch()
+    for review_id in review_ids:
+        batch.add(process_stored_review(review_id, store_format, store_path, parser=parser))
+    return batch
 
-    n_notfound = 0
-    n_parse_failed = 0
 
-    df_rows = []
+def process_reviews(review_ids, store_format, store_path, writer, n_processes=None, parser=PARSER_BS4, cache=None):
+    """
+    Processes the reviews from the raw page store in a process pool and passes the results to the writer.
+    Workers get chunks of ids and load the extraction rules once, see init_worker.
+
+    With a cache, only new and changed pages are processed, the rows of all other pages are taken from the cache.
+    """
+    store = archive.open_store(store_format, store_path)
+    review_ids = list(review_ids)
+
+    fingerprints = None
+    if cache is not None:
+        fingerprints = {review_id: store.fingerprint(review_id) for review_id in review_ids}
+        cached = cache.lookup(fingerprints)
+
+        writer.add_batch(ReviewBatch(cached.values()))
 
-    filter_urls = utils.get_ignore_urls()
-    german_cities = utils.get_german_cities()
+        review_ids = [review_id for review_id in review_ids if review_id not in cached]
 
-    with ProcessPoolExecutor(max_workers=n_processes) as pool:
+    sizes = [store.size(review_id) for review_id in review_ids]
 
-        jobs = {}
-        for file in allfiles:
-            future = pool.submit(process_single_file, file, filter_urls=filter_urls, cities=german_cities)
-            jobs[future] = file
+    n_workers = n_processes or os.cpu_count() or 1
+    chunks = make_chunks(review_ids, sizes, n_workers)
+    logger.info(f"Processing {len(review_ids)} reviews in {len(chunks)} chunks")
+
+    with ProcessPoolExecutor(max_workers=n_processes, initializer=init_worker) as pool:
+        # chunks are started in the order of submission
+        jobs = [pool.submit(process_chunk, chunk, store_format, store_path, parser=parser) for chunk in chunks]
 
         for future in concurrent.futures.as_completed(jobs):
-            res = future.result()
-            if res.not_found:
-                n_notfound += 1
-                continue
+            batch = future.result()
+            writer.add_batch(batch)
+
+            if cache is not None:
+                cache.put_many([(row[_ROW_ID], fingerprints[row[_ROW_ID]], row) for row in batch.rows])
+
+
+@click.command()
+@click.option("--input", "-i", "input_path", type=click.Path(), default=None,
+              help="Raw pages, defaults to the html or shards directory")
+@click.option("--format", "-f", "store_format", type=click.Choice(archive.FORMATS), default=archive.FORMAT_HTML)
+@click.option("--csv", "csv_path", type=click.Path(), default=config.PATH_REVIEWS_CSV)
+@click.option("--pickle", "pickle_path", type=click.Path(), default=DEFAULT_PICKLE_PATH,
+              help="Also writes a pickle, which is only written by default if pyarrow is not installed")
+@click.option("--parquet", "parquet_path", type=click.Path(), default=DEFAULT_PARQUET_PATH,
+              help="Streams the rows to Parquet instead of holding them in memory, requires pyarrow")
+@click.option("--failures", "failures_path", type=click.Path(), default=config.PATH_PARSE_FAILURES)
+@click.option("--processes", "-p", "n_processes", type=int, default=None)
+@click.option("--parser", "parser", type=click.Choice(PARSERS), default=PARSER_BS4,
+              help="bs4-restricted is faster, bs4 is the reference implementation")
+@click.option("--cache/--no-cache", "use_cache", default=True, help="Only process new and changed pages")
+@click.option("--cache-path", "cache_path", type=click.Path(), default=config.PATH_PARSE_CACHE)
+def main(input_path, store_format, csv_path, pickle_path, parquet_path, failures_path, n_processes, parser, use_cache,
+         cache_path):
+    """
 
-            if not res.parsed_success:
-                n_parse_failed += 1
-                continue
+    Parameters
+    ----------
+    input_path directory of the raw pages
+    store_format format of the raw pages, see archive
+    csv_path csv output
+    pickle_path pickled dataframe output, None to skip it
+    parquet_path parquet output, None to hold all rows in memory
+    failures_path csv output for the reviews that could not be parsed
+    n_processes number of workers to use
+    parser html parser backend
+    use_cache use the rows of unchanged pages from the parse cache
+    cache_path path of the parse cache
+    Returns
+    -------
 
-            df_rows.append(res.to_dict())
+    """
+    if input_path is None:
+        input_path = config.DIR_RAW_SHARDS if store_format == archive.FORMAT_SHARDS else config.DIR_RAW_HTML
 
-    logger.info("All files processed.")
-    logger.info("Creating dataframe ...")
-    df = pandas.DataFrame(df_rows)
-    df.set_index(Review.ID, drop=False, inplace=True)
-    df.sort_values(by=Review.DATE, inplace=True, ascending=True)
+    store = archive.open_store(store_format, input_path)
+    allfiles = store.ids()
 
-    unfound_ratio = n_notfound / len(allfiles)
-    unparsed_ratio = n_parse_failed / (len(allfiles) - n_notfound)
+    logger.info(f"Data dir contains {len(allfiles)} files")
 
-    logger.warning(f"Not found: {n_notfound}/{len(allfiles)} {unfound_ratio:.2%}")
-    logger.warning(f"Not parsable: {n_parse_failed}/{len(allfiles) - n_notfound} ({unparsed_ratio:.2%})")
-    logger.warning(f"Parsable: {len(allfiles) - n_notfound - n_parse_failed}")
+    cache = ParseCache(cache_path, extractor_version(ExtractionRules.load(), parser)) if use_cache else None
 
-    utils.save_gephi_csv(df, csv_path)
+    writer = ReviewWriter(csv_path, pickle_path, failures_path=failures_path, parquet_path=parquet_path)
+    process_reviews(allfiles, store_format, input_path, writer, n_processes=n_processes, parser=parser, cache=cache)
+
+    logger.info("All files processed.")
+    writer.close()
 
-    logger.info(f"Saving to '{pickle_path}'")
-    df.to_pickle(pickle_path)
+    if cache is not None:
+        cache.close()
     logger.info("Done")
     return
 
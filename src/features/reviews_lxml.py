@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+lxml backend for the extraction of reviews. Parsing with libxml2 is several times faster than with the pure python
+html.parser of BeautifulSoup.
+
+The extractors in features/reviews.py only use a small part of the BeautifulSoup API. LxmlTag implements this part
+on top of lxml elements, with the same semantics (e.g. the strings of script and style elements are ignored), so the
+extractors can be used for both backends without changes.
+"""
+import lxml.html
+
+from features.content import ContentIndex, IGNORED_STRINGS
+
+_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+
+
+def _iter_strings(element):
+    """
+    Text of the element and all its descendants, in document order
+    """
+    if element.tag in IGNORED_STRINGS:
+        return
+
+    if element.text:
+        yield element.text
+
+    for child in element:
+        # comments and processing instructions do not have a string tag
+        if isinstance(child.tag, str):
+            yield from _iter_strings(child)
+
+        if child.tail:
+            yield child.tail
+
+
+def _matches(element, attrs):
+    for key, expected in attrs.items():
+        value = element.get(key)
+
+        if value is None:
+            return False
+
+        # class is a multi valued attribute, BeautifulSoup matches single classes as well as the whole value
+        values = [value] + value.split() if key == "class" else [value]
+
+        if isinstance(expected, str):
+            if expected not in values:
+                return False
+        elif not any(expected.search(v) for v in values):
+            return False
+
+    return True
+
+
+class LxmlTag(object):
+    """
+    Wraps an lxml element and provides the parts of the BeautifulSoup Tag API used by the extractors
+    """
+
+    __slots__ = ["element"]
+
+    def __init__(self, element):
+        self.element = element
+
+    def find_all(self, name=None, attrs=None):
+        """
+
+        Parameters
+        ----------
+        name tag name or list of tag names
+        attrs attribute values, either strings or compiled regular expressions
+
+        Returns
+        -------
+        descendants that match, in document order
+        """
+        if name is None:
+            tags = ()
+        elif isinstance(name, str):
+            tags = (name,)
+        else:
+            tags = tuple(name)
+
+        result = []
+        for element in self.element.iterdescendants(*tags):
+            if not isinstance(element.tag, str):
+                continue
+
+            if attrs and not _matches(element, attrs):
+                continue
+
+            result.append(LxmlTag(element))
+
+        return result
+
+    findAll = find_all
+
+    def find(self, name=None, attrs=None):
+        result = self.find_all(name, attrs)
+        return result[0] if result else None
+
+    def get(self, key, default=None):
+        return self.element.get(key, default)
+
+    def __getitem__(self, key):
+        return self.element.attrib[key]
+
+    @property
+    def stripped_strings(self):
+        for s in _iter_strings(self.element):
+            s = s.strip()
+            if s:
+                yield s
+
+    @property
+    def text(self):
+        return "".join(_iter_strings(self.element))
+
+
+def _visit(element, index, ignore_strings):
+    if element.text and not ignore_strings:
+        index.add_string(element.text)
+
+    for child in element:
+        if isinstance(child.tag, str):
+            index.start_element(child.tag, child.get("href") if child.tag == "a" else None)
+            _visit(child, index, ignore_strings or child.tag in IGNORED_STRINGS)
+            index.end_element()
+
+        if child.tail and not ignore_strings:
+            index.add_string(child.tail)
+
+
+def build_content_index(tag: LxmlTag) -> ContentIndex:
+    index = ContentIndex()
+    _visit(tag.element, index, tag.element.tag in IGNORED_STRINGS)
+    return index
+
+
+def parse(content) -> LxmlTag:
+    """
+    Parses the page and returns the root element
+    """
+    root = lxml.html.document_fromstring(content.encode("utf-8"), parser=_PARSER)
+    return LxmlTag(root)
@@ -7,8 +7,8 @@ import os
 import pandas as pd
 import config
 from db import Author, Review
-from collections import Counter
 
+import keyword_index
 import utils
 import constants
 from dnb import DNBConnector
@@ -18,13 +18,24 @@ logger = logging.getLogger(__name__)
 
 
 def main(min_keyword_mentions=2):
-    path = os.path.join(config.DIR_PROCESSED, "reviews-extended.pkl")
-    df = pd.read_pickle(path)
+    # the reviews are extended by features/extend_by_dnb.py
+    df = utils.load_reviews([Review.AUTHORS_ID, Review.DNB_ID, Review.REVIEWER_NAME, Review.PAGES])
+    index = utils.load_keyword_index()
 
     df = df.explode(Review.AUTHORS_ID)
     grouper = pd.Grouper(key=Review.AUTHORS_ID)
     groups = df.groupby(grouper)
 
+    # count keywords of all authors at once, one row per author
+    codes, identifiers = pd.factorize(df[Review.AUTHORS_ID])
+    keyword_counts = index.counts_by(df[Review.ID].values, codes, len(identifiers))
+    author_rows = {identifier: row for row, identifier in enumerate(identifiers)}
+
+    # as before the keyword index, only keywords with less than 'min_keyword_mentions' mentions are kept
+    keyword_counts.data[keyword_counts.data >= min_keyword_mentions] = 0
+    keyword_counts.eliminate_zeros()
+    rows = []
+
     dnb = DNBConnector(config.load_secret_dnb())
 
     data = []
@@ -39,18 +50,10 @@ def main(min_keyword_mentions=2):
 
         person = persons[0]
 
-        counter = Counter()
-
-        for keywords in group[Review.KEYWORDS]:
-            for keyword in keywords:
-                counter[keyword] += 1
-
-        # filter reviewers with less than 'min_keyword_mentions' keyword mentions
-        filtered_counter = counter.copy()
-
-        for keyword, count in counter.items():
-            if count >= min_keyword_mentions:
-                del filtered_counter[keyword]
+        row = author_rows[identifier]
+        author_keywords = keyword_counts[row]
+        filtered_counter = dict(zip(index.vocabulary[author_keywords.indices].tolist(),
+                                    author_keywords.data.tolist()))
 
         if len(filtered_counter) == 0:
             continue
@@ -72,6 +75,7 @@ def main(min_keyword_mentions=2):
         logger.info(f"{entry[Author.NAME]}, {entry[Author.REVIEWS_COUNT]}")
 
         data.append(entry)
+        rows.append(row)
 
     df2 = pd.DataFrame(data)
     df2.set_index(keys=constants.GEPHI_ID, inplace=True)
@@ -84,7 +88,9 @@ def main(min_keyword_mentions=2):
     out_path = os.path.join(config.DIR_PROCESSED, "authors.csv")
     utils.save_gephi_csv(df2, out_path)
 
-    cooc_matrix = utils.dict_create_co_occurence_matrix(data, self_loops=False)
+    occurrences = keyword_index.shared_keywords(keyword_counts[rows], self_loops=False)
+    author_ids = [entry[constants.GEPHI_ID] for entry in data]
+    cooc_matrix = pd.DataFrame(occurrences.toarray(), index=author_ids, columns=author_ids)
     path = os.path.join(config.DIR_PROCESSED, "authors-cooc.csv")
     utils.save_gephi_csv(cooc_matrix, path)
 
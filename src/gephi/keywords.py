@@ -11,13 +11,15 @@ from collections import OrderedDict
 from itertools import permutations
 
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
-from collections import Counter
 
 from db import Review
 from utils import AcademicTitleCategory
 import config
 from constants import *
+import dataset
+import keyword_index
 import utils
 
 import click
@@ -26,179 +28,145 @@ logging.config.dictConfig(config.LOGGING_CONFIG)
 logger = logging.getLogger(__name__)
 
 
-def create_co_occurrence_matrix(df, keywords) -> pd.DataFrame:
+def create_co_occurrence_matrix(df, index) -> pd.DataFrame:
     """
-    Calculates the co-occurence-matrix for the given keywords
-    """
-    # a dic of dicts, one dic per keyword, containing co-occurences with other dicts
-    occurrences = OrderedDict((key, OrderedDict((key, 0) for key in keywords)) for key in keywords)
-
-    documents = [keywords for keywords in df[Review.KEYWORDS]]
-
-    # Find the co-occurrences:
-    for index, lis in enumerate(documents):
-        # logger.info(index)
-        for i in range(len(lis)):
-            for item in lis[:i] + lis[i + 1:]:
-                if item == "Inklusive_Pädagogik":
-                    print(f"Inklusive_Pädagogik -> {lis[i]}")
-                elif item == "Kindertagesstätte":
-                    print(f"Kindertagesstätte -> {lis[i]}")
-
-                occurrences[lis[i]][item] += 1
+    Calculates the co-occurence-matrix of the keywords of the given reviews
 
-    return occurrences
+    Parameters
+    ----------
+    df reviews
+    index keyword index, see utils.load_keyword_index
 
-
-def extract_nodelist(df, previous=None):
-    """
-    TODO: this can probably done much simpler in pandas ...
-    :return:
+    Returns
+    -------
+    keyword x keyword dataframe, only keywords of the given reviews are included
     """
-    logger.info("Extracting keywords ...")
+    matrix = index.matrix(df[Review.ID].values)
+    used = np.flatnonzero(matrix.getnnz(axis=0))
+    keywords = index.vocabulary[used]
 
-    # count keywords, genders, titles in reviews
-    keyword_counter = Counter()
-    gender_counter = Counter()
-    title_counter = Counter()
+    occurrences = keyword_index.co_occurrences(matrix[:, used])
+    return pd.DataFrame(occurrences.toarray(), index=keywords, columns=keywords)
 
-    # Count by academic title and gender
-    group_keyword_counter = {}
-    for g in ALL_GENDERS:
-        group_keyword_counter[g] = {}
-        for t in AcademicTitleCategory:
-            group_keyword_counter[g][t] = Counter()
 
-    # count keywords title-wise
-    title_keyword_counters = {title: Counter() for title in AcademicTitleCategory}
+def extract_nodelist(df, index, previous=None):
+    """
+    Counts the keywords of the reviews, in total, by gender and by academic title of the reviewer
 
-    # count keywords gender-wise
-    gender_keyword_counter = {gender: Counter() for gender in ALL_GENDERS}
+    Parameters
+    ----------
+    df reviews
+    index keyword index, see utils.load_keyword_index
+    previous nodelist of the previous time slice, to compute the growth
 
-    # loop through all reviews and count
-    for index, review in df.iterrows():
-        keywords = review[Review.KEYWORDS]
-        gender = review[Review.REVIEWER_GENDER]
-        highest_title = review[Review.REVIEWER_HIGHEST_TITLE]
+    Returns
+    -------
+    dataframe with one row per keyword, ordered by count
+    """
+    logger.info("Extracting keywords ...")
 
-        if highest_title is None:
-            logger.error(f"Highest title is None: {index}")
+    review_ids = df[Review.ID].values
+    genders = pd.Categorical(df[Review.REVIEWER_GENDER], categories=ALL_GENDERS).codes.astype(np.int64)
+    titles = pd.Categorical(df[Review.REVIEWER_HIGHEST_TITLE], dtype=dataset.TITLE_DTYPE).codes.astype(np.int64)
+    title_codes = {t: i for i, t in enumerate(dataset.TITLE_DTYPE.categories)}
+    n_titles = len(title_codes)
 
-        gender_counter[gender] += 1
-        title_counter[highest_title] += 1
+    if (titles < 0).any():
+        logger.error(f"Highest title is None: {list(df.index[titles < 0])}")
 
-        for keyword in keywords:
-            if keyword == "":
-                continue
+    # count keywords by gender and academic title, in one gender x title x keyword array
+    groups = np.where((genders >= 0) & (titles >= 0), genders * n_titles + titles, -1)
+    group_counts = index.counts_by(review_ids, groups, len(ALL_GENDERS) * n_titles).toarray()
+    group_counts = group_counts.reshape(len(ALL_GENDERS), n_titles, -1)
 
-            title_keyword_counters[highest_title][keyword] += 1
-            gender_keyword_counter[gender][keyword] += 1
-            keyword_counter[keyword] += 1
+    keyword_counts = index.counts(review_ids)
+    used = (keyword_counts > 0) & (index.vocabulary != "")
 
-            group_keyword_counter[gender][highest_title][keyword] += 1
+    keywords = index.vocabulary[used]
+    counts = keyword_counts[used]
+    group_counts = group_counts[:, :, used]
+    gender_keyword_counts = dict(zip(ALL_GENDERS, group_counts.sum(axis=1)))
+    tkc = {t: group_counts[:, code].sum(axis=0) for t, code in title_codes.items()}
 
-    n_keywords = len(keyword_counter.keys())
-    logger.info(f"Keywords: {n_keywords}")
+    logger.info(f"Keywords: {len(keywords)}")
 
-    group_f_ratio = max(gender_counter[GENDER_MALE] / sum(gender_counter.values()), 0.0001)
+    gender_counter = np.bincount(genders[genders >= 0], minlength=len(ALL_GENDERS))
+    group_f_ratio = max(gender_counter[ALL_GENDERS.index(GENDER_MALE)] / gender_counter.sum(), 0.0001)
 
     logger.info(f"Group Female Ratio: {group_f_ratio}")
-    # create dataframe
-    nodes = []
-
-    tkc = title_keyword_counters
 
     # total number of keywords
-    total_keywords = sum(keyword_counter.values())
+    total_keywords = counts.sum()
     logger.info(f"Total occurences: {total_keywords}")
 
     # find ratio of articles per keyword that have been written by females
-    for keyword, count in keyword_counter.items():
-
-        count_gender_f = gender_keyword_counter[GENDER_FEMALE][keyword]
-        count_gender_m = gender_keyword_counter[GENDER_MALE][keyword]
-        count_gender_u = gender_keyword_counter[GENDER_ELSE][keyword]
+    count_gender_f = gender_keyword_counts[GENDER_FEMALE]
+    count_gender_m = gender_keyword_counts[GENDER_MALE]
+    count_gender_u = gender_keyword_counts[GENDER_ELSE]
 
-        count_title_p = tkc[AcademicTitleCategory.prof][keyword]
-        count_title_d = tkc[AcademicTitleCategory.phd][keyword]
-        count_title_m = tkc[AcademicTitleCategory.bachelor][keyword] + tkc[AcademicTitleCategory.master][keyword] + \
-                        tkc[AcademicTitleCategory.diploma][keyword] + tkc[AcademicTitleCategory.magister][keyword]
+    count_title_p = tkc[AcademicTitleCategory.prof]
+    count_title_d = tkc[AcademicTitleCategory.phd]
+    count_title_m = tkc[AcademicTitleCategory.bachelor] + tkc[AcademicTitleCategory.master] + \
+                    tkc[AcademicTitleCategory.diploma] + tkc[AcademicTitleCategory.magister]
+    count_title_o = tkc[AcademicTitleCategory.none] + tkc[AcademicTitleCategory.unknown]
 
-        # bmdm_counter[keyword]
-        count_title_o = tkc[AcademicTitleCategory.none][keyword] + tkc[AcademicTitleCategory.unknown][keyword]
-
-        if count_gender_m + count_gender_f == 0:
-            ratio = 0.5
-            relative_ratio = 0
-        else:
-            ratio = count_gender_f / (count_gender_m + count_gender_f)
-            relative_ratio = ratio / group_f_ratio  # pos if ratio is higher than usual
+    count_gender_fm = count_gender_f + count_gender_m
+    ratio = np.divide(count_gender_f, count_gender_fm, out=np.full(len(keywords), 0.5), where=count_gender_fm > 0)
+    relative_ratio = np.where(count_gender_fm > 0, ratio / group_f_ratio, 0)  # pos if ratio is higher than usual
 
-        node = dict()
-        node[GEPHI_ID] = keyword
-        node[GEPHI_LABEL] = keyword
-        node["occurrences"] = count
+    nodes = OrderedDict()
+    nodes[GEPHI_LABEL] = keywords
+    nodes["occurrences"] = counts
 
-        if previous is not None:
-            previous_total_keywords = previous["occurrences"].sum()
-
-            try:
-                previous_count = previous.at[keyword, "occurrences"]
-            except KeyError:
-                previous_count = 1  # TODO: should be 0 ...
+    if previous is not None:
+        previous_total_keywords = previous["occurrences"].sum()
+        # TODO: missing keywords should count 0 ...
+        previous_count = previous["occurrences"].reindex(keywords).fillna(1).astype(np.int64).values
 
-            node["growth"] = count - previous_count
+        nodes["growth"] = counts - previous_count
 
-            occurence_ratio = count / total_keywords
-            previous_occurence_ratio = previous_count / previous_total_keywords
+        occurence_ratio = counts / total_keywords
+        previous_occurence_ratio = previous_count / previous_total_keywords
 
-            # relative
-            node["occurence_ratio"] = occurence_ratio
-            node["growth_relative"] = occurence_ratio - previous_occurence_ratio
+        # relative
+        nodes["occurence_ratio"] = occurence_ratio
+        nodes["growth_relative"] = occurence_ratio - previous_occurence_ratio
 
-        node["female_count"] = count_gender_f
-        node["male_count"] = count_gender_m
-        node["unknown_count"] = count_gender_u
-        node["female_ratio"] = ratio
-        node["relative_female_ratio"] = relative_ratio
+    nodes["female_count"] = count_gender_f
+    nodes["male_count"] = count_gender_m
+    nodes["unknown_count"] = count_gender_u
+    nodes["female_ratio"] = ratio
+    nodes["relative_female_ratio"] = relative_ratio
 
-        # academic title stuff
-        s = count_title_p + count_title_d + count_title_m + count_title_o
-        node["prof_ratio"] = count_title_p / s
-        node["phd_ratio"] = count_title_d / s
-        node["master_ratio"] = count_title_m / s
-        node["notitle_ratio"] = count_title_o / s
+    # academic title stuff
+    s = count_title_p + count_title_d + count_title_m + count_title_o
+    nodes["prof_ratio"] = count_title_p / s
+    nodes["phd_ratio"] = count_title_d / s
+    nodes["master_ratio"] = count_title_m / s
+    nodes["notitle_ratio"] = count_title_o / s
 
-        for g in ALL_GENDERS:
-            exclusive = [AcademicTitleCategory.master, AcademicTitleCategory.bachelor, AcademicTitleCategory.diploma,
-                         AcademicTitleCategory.magister]
-            exclusive_sum = 0
+    exclusive = [AcademicTitleCategory.master, AcademicTitleCategory.bachelor, AcademicTitleCategory.diploma,
+                 AcademicTitleCategory.magister]
 
-            for t in AcademicTitleCategory:
-                group_keyword_count = group_keyword_counter[g][t][keyword] / keyword_counter[keyword]
+    for g, gender_counts in zip(ALL_GENDERS, group_counts):
+        exclusive_sum = 0
 
-                if t in exclusive:
-                    exclusive_sum += group_keyword_count
-                    continue
-                key = f"{g}+{t}"
+        for t in AcademicTitleCategory:
+            group_keyword_count = gender_counts[title_codes[t]] / counts
 
-                node[key] = group_keyword_count
+            if t in exclusive:
+                exclusive_sum = exclusive_sum + group_keyword_count
+                continue
 
-            key = f"{g}+Master"
-            node[key] = exclusive_sum
+            nodes[f"{g}+{t}"] = group_keyword_count
 
-        nodes.append(node)
+        nodes[f"{g}+Master"] = exclusive_sum
 
-    node_df = pd.DataFrame(nodes)
-    node_df.set_index(GEPHI_ID, inplace=True)
+    node_df = pd.DataFrame(nodes, index=pd.Index(keywords, name=GEPHI_ID))
     node_df.sort_values("occurrences", ascending=False, inplace=True)
     return node_df
 
 
-def get_unique_keywords(df):
-    return df[Review.KEYWORDS].explode().dropna().unique()
-
-
 #def repl(x):
 #    return [w.replace(" ", "_") for w in x]
 
@@ -211,12 +179,10 @@ def main(path, time_slice, group_slice):
     Creates the keyword co occurence matrix and a list of keywords, ordered by count
     :return:
     """
-    if not path:
-        path = os.path.join(config.DIR_PROCESSED, "reviews.pkl")
-
-    logger.info(f"Reading '{path}'")
-    df = pd.read_pickle(path)
+    columns = [Review.REVIEWER_GENDER, Review.REVIEWER_HIGHEST_TITLE] + utils.FILTER_COLUMNS
+    df = utils.load_reviews(columns, date_range=utils.DEFAULT_DATE_RANGE, path=path)
     df = utils.default_df_filter(df)
+    index = utils.load_keyword_index(path)
 
     # df[Review.KEYWORDS] = df[Review.KEYWORDS].apply(repl)
     df.set_index(keys=Review.DATE, inplace=True)
@@ -255,7 +221,7 @@ def main(path, time_slice, group_slice):
             cooc_path = os.path.join(config.DIR_PROCESSED, f"keywords-cooc-matrix.csv")
 
         # create nodelist df
-        node_df = extract_nodelist(group, previous)
+        node_df = extract_nodelist(group, index, previous)
         previous = node_df.copy()
 
         # evaluate topics over time
@@ -286,12 +252,8 @@ def main(path, time_slice, group_slice):
 
         # create co-occurrence matrix
         logger.info("Creating co occurence matrix...")
-        keywords = get_unique_keywords(group)
-        logger.info(f"Number of unique keywords {len(keywords)}")
-        occurrences = create_co_occurrence_matrix(group, keywords)
-
-        logger.info("Creating dataframe ...")
-        co_occur = pd.DataFrame.from_dict(occurrences)
+        co_occur = create_co_occurrence_matrix(group, index)
+        logger.info(f"Number of unique keywords {len(co_occur)}")
 
         # we want to watc hseveral co occurecnes
         words = ["Schule", "Inklusion", "Kindertagesstätte", "Jugendhilfe", "Inklusive Pädagogik"]
@@ -6,11 +6,11 @@ import logging.config
 
 import pandas as pd
 import os
-from collections import Counter
 
 import click
 import csv
 import config
+import keyword_index
 import utils
 from db import Review, Reviewer
 import constants
@@ -19,26 +19,40 @@ logging.config.dictConfig(config.LOGGING_CONFIG)
 logger = logging.getLogger(__name__)
 
 
-def create_nodelist(groups, min_keyword_mentions):
+def create_nodelist(df, index, min_keyword_mentions):
+    """
+
+    Parameters
+    ----------
+    df reviews
+    index keyword index, see utils.load_keyword_index
+    min_keyword_mentions keywords a reviewer mentions less often are not counted
+
+    Returns
+    -------
+    list of nodes, reviewer x keyword count matrix with a row per node
+    """
     node_list = []
+    rows = []
 
-    # loop through reviewers (with unique id)
-    for reviewer_id, group in groups:
+    # count keywords of all reviewers at once, one row per reviewer
+    codes, reviewer_ids = pd.factorize(df[Review.REVIEWER_ID])
+    keyword_counts = index.counts_by(df[Review.ID].values, codes, len(reviewer_ids))
+    reviewer_rows = {reviewer_id: row for row, reviewer_id in enumerate(reviewer_ids)}
 
-        node = {}
+    # filter keywords with less than 'min_keyword_mentions' mentions
+    keyword_counts.data[keyword_counts.data < min_keyword_mentions] = 0
+    keyword_counts.eliminate_zeros()
 
-        # count keywords
-        reviewer_keywords = Counter()
-        for keywords in group[Review.KEYWORDS]:
-            for keyword in keywords:
-                reviewer_keywords[keyword] += 1
+    # loop through reviewers (with unique id)
+    for reviewer_id, group in df.groupby(pd.Grouper(key=Review.REVIEWER_ID)):
 
-        # filter reviewers with less than 'min_keyword_mentions' keyword mentions
-        reviewer_keywords_filtered = {}
+        node = {}
 
-        for keyword, count in reviewer_keywords.items():
-            if count >= min_keyword_mentions:
-                reviewer_keywords_filtered[keyword] = count
+        row = reviewer_rows[reviewer_id]
+        reviewer_keywords = keyword_counts[row]
+        reviewer_keywords_filtered = dict(zip(index.vocabulary[reviewer_keywords.indices].tolist(),
+                                              reviewer_keywords.data.tolist()))
 
         if len(reviewer_keywords_filtered) == 0:
             continue
@@ -84,8 +98,9 @@ def create_nodelist(groups, min_keyword_mentions):
             f"Keywords: ({reviewer_keywords_filtered})")
 
         node_list.append(node)
+        rows.append(row)
 
-    return node_list
+    return node_list, keyword_counts[rows]
 
 
 @click.command()
@@ -94,10 +109,11 @@ def create_nodelist(groups, min_keyword_mentions):
 def main(time_slice,
          min_keyword_mentions=1,
          ):
-    path = os.path.join(config.DIR_PROCESSED, "reviews.pkl")
-    logger.info(f"Reading '{path}'")
-    df = pd.read_pickle(path)
+    columns = [Review.REVIEWER_LOCATION, Review.REVIEWER_NAME, Review.REVIEWER_TITLE,
+               Review.REVIEWER_GENDER, Review.PAGES, Review.WORD_COUNT] + utils.FILTER_COLUMNS
+    df = utils.load_reviews(columns, date_range=utils.DEFAULT_DATE_RANGE)
     df = utils.default_df_filter(df)
+    index = utils.load_keyword_index()
 
     # copy date column
     date_tmp = df[Review.DATE].rename(f"{Review.DATE}_tmp")
@@ -115,10 +131,7 @@ def main(time_slice,
 
     for date, time_group in groups:
         logger.info(f"Date Interval: {date}")
-        grouper = pd.Grouper(key=Review.REVIEWER_ID)
-        id_groups = time_group.groupby(grouper)
-
-        node_list = create_nodelist(id_groups, min_keyword_mentions)
+        node_list, keyword_counts = create_nodelist(time_group, index, min_keyword_mentions)
 
         df_out = pd.DataFrame(node_list)
         df_out.set_index(keys=constants.GEPHI_ID, inplace=True)
@@ -141,9 +154,10 @@ def main(time_slice,
         df_out.to_pickle(nodelist_path_pkl)
 
         logger.info("Creating co-occurence matrix ... ")
-        occurrences = utils.dict_create_co_occurence_matrix(node_list)
+        occurrences = keyword_index.shared_keywords(keyword_counts)
         logger.info("Creating dataframe...")
-        co_occur = pd.DataFrame.from_dict(occurrences)
+        reviewer_ids = [node[constants.GEPHI_ID] for node in node_list]
+        co_occur = pd.DataFrame(occurrences.toarray(), index=reviewer_ids, columns=reviewer_ids)
         utils.save_gephi_csv(co_occur, cooc_path)
 
 
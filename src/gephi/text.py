@@ -176,18 +176,16 @@ def main(min_review_words=100, n_keywords=5, max_keywords=5000):
     """
     global stemming_progress
 
-    path = os.path.join(config.DIR_PROCESSED, "reviews.pkl")
-    logger.info(f"Reading: '{os.path.abspath(path)}'")
-
-    df = pd.read_pickle(path)
+    columns = [Review.WORD_COUNT] + utils.FILTER_COLUMNS
+    df = utils.load_reviews(columns, date_range=utils.DEFAULT_DATE_RANGE)
     df = utils.default_df_filter(df)
     logger.info(f"Successfully parsed reviews: {len(df)}")
 
     # filter reviews without text
     df_filtered = df[df[Review.WORD_COUNT] >= min_review_words]
-    corpus = [text for text in df_filtered[Review.TEXT]]
-    # corpus = corpus[:2000]
-    n_reviews = len(corpus)
+    # texts are read one by one while vectorizing
+    corpus = utils.review_texts(df_filtered[Review.ID])
+    n_reviews = len(df_filtered)
     logger.info(f"Filtered reviews: {len(df_filtered)}")
 
     logger.info("Vectorizing ...")
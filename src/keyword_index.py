@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Integer coded index of the keywords of the reviews, built once when the dataset is written. The keywords are mapped
+to codes of a sorted vocabulary and stored as one flat int32 array, together with the offsets of the keywords of each
+review (CSR layout). Counting, grouping and co-occurrences then run on sparse matrices instead of lists of strings.
+
+The index is stored as <base>-keywords.npz next to the dataset, see path_for.
+"""
+import logging
+import os
+
+import numpy as np
+import scipy.sparse
+
+logger = logging.getLogger(__name__)
+
+
+def path_for(dataset_path):
+    """
+    Path of the keyword index that belongs to a dataset, e.g. reviews-keywords.npz for reviews.parquet
+    """
+    return os.path.splitext(dataset_path)[0] + "-keywords.npz"
+
+
+def co_occurrences(matrix) -> scipy.sparse.csr_matrix:
+    """
+    Keyword co-occurrences of a review x keyword count matrix: how often two keywords are listed by the same review,
+    counted over all pairs of positions. A keyword only co-occurs with itself if a review lists it twice.
+    """
+    counts = np.asarray(matrix.sum(axis=0)).ravel()
+    product = matrix.T @ matrix
+    result = (product - scipy.sparse.diags(counts, dtype=product.dtype)).tocsr()
+    result.eliminate_zeros()
+    return result
+
+
+def shared_keywords(matrix, self_loops=False) -> scipy.sparse.csr_matrix:
+    """
+    Number of distinct keywords two rows of a group x keyword count matrix have in common, e.g. two reviewers
+    """
+    present = (matrix > 0).astype(np.int32)
+    result = present @ present.T
+
+    if not self_loops:
+        result = result - scipy.sparse.diags(result.diagonal(), dtype=result.dtype)
+        result.eliminate_zeros()
+    return result.tocsr()
+
+
+class KeywordIndex(object):
+    """
+    Parameters
+    ----------
+    vocabulary sorted array of keywords
+    review_ids sorted array of review ids
+    offsets keywords of the review at position i are codes[offsets[i]:offsets[i + 1]]
+    codes positions of the keywords in the vocabulary
+    """
+
+    def __init__(self, vocabulary, review_ids, offsets, codes):
+        self.vocabulary = vocabulary
+        self.review_ids = review_ids
+        self.offsets = offsets
+        self.codes = codes
+
+    @classmethod
+    def build(cls, review_ids, keywords):
+        """
+
+        Parameters
+        ----------
+        review_ids ids of the reviews
+        keywords lists of keywords, in the same order. Missing lists count as empty.
+
+        Returns
+        -------
+        KeywordIndex
+        """
+        builder = KeywordIndexBuilder()
+        builder.add(review_ids, keywords)
+        return builder.build()
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["vocabulary"], data["review_ids"], data["offsets"], data["codes"])
+
+    def save(self, path):
+        logger.info(f"Saving keyword index to '{path}'")
+
+        # the file is replaced when complete, like the text store
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, vocabulary=self.vocabulary, review_ids=self.review_ids, offsets=self.offsets, codes=self.codes)
+        os.replace(path + ".tmp", path)
+
+    def __len__(self):
+        return len(self.review_ids)
+
+    def code(self, keyword):
+        """
+        Position of the keyword in the vocabulary, None if it is unknown
+        """
+        i = int(np.searchsorted(self.vocabulary, keyword))
+        if i < len(self.vocabulary) and self.vocabulary[i] == keyword:
+            return i
+        return None
+
+    def positions(self, review_ids):
+        """
+        Positions of the given reviews in the index. Raises a KeyError for reviews that are not indexed.
+        """
+        review_ids = np.asarray(review_ids, dtype=np.int64)
+        positions = np.searchsorted(self.review_ids, review_ids)
+
+        found = positions < len(self.review_ids)
+        found[found] = self.review_ids[positions[found]] == review_ids[found]
+        if not found.all():
+            raise KeyError(review_ids[~found][:10].tolist())
+        return positions
+
+    def keywords(self, review_id):
+        i = self.positions([review_id])[0]
+        return self.vocabulary[self.codes[self.offsets[i]:self.offsets[i + 1]]].tolist()
+
+    def matrix(self, review_ids=None) -> scipy.sparse.csr_matrix:
+        """
+        Sparse review x keyword matrix with the number of times each review lists each keyword.
+
+        Parameters
+        ----------
+        review_ids rows of the matrix, all reviews of the index if None. Reviews may be listed repeatedly.
+        """
+        if review_ids is None:
+            positions = np.arange(len(self.review_ids))
+        else:
+            positions = self.positions(review_ids)
+
+        starts = self.offsets[positions]
+        lengths = self.offsets[positions + 1] - starts
+
+        # the codes of row r are codes[starts[r]:starts[r] + lengths[r]]
+        rows = np.repeat(np.arange(len(positions)), lengths)
+        row_offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=row_offsets[1:])
+        columns = self.codes[np.repeat(starts - row_offsets[:-1], lengths) + np.arange(row_offsets[-1])]
+
+        # duplicates are summed
+        return scipy.sparse.csr_matrix((np.ones(len(columns), dtype=np.int32), (rows, columns)),
+                                       shape=(len(positions), len(self.vocabulary)))
+
+    def counts(self, review_ids=None):
+        """
+        Number of occurrences of each keyword in the given reviews, all reviews if None
+        """
+        if review_ids is None:
+            return np.bincount(self.codes, minlength=len(self.vocabulary))
+
+        return np.asarray(self.matrix(review_ids).sum(axis=0)).ravel()
+
+    def counts_by(self, review_ids, groups, n_groups=None) -> scipy.sparse.csr_matrix:
+        """
+        Keyword counts per group of reviews.
+
+        Parameters
+        ----------
+        review_ids reviews
+        groups group of each review as integer code, e.g. the codes of a categorical. Reviews with negative codes are
+        skipped.
+        n_groups number of groups, max code + 1 if None
+
+        Returns
+        -------
+        sparse group x keyword matrix
+        """
+        groups = np.asarray(groups, dtype=np.int64)
+        if n_groups is None:
+            n_groups = int(groups.max()) + 1 if len(groups) else 0
+
+        valid = groups >= 0
+        membership = scipy.sparse.csr_matrix(
+            (np.ones(valid.sum(), dtype=np.int32), (groups[valid], np.flatnonzero(valid))),
+            shape=(n_groups, len(groups)))
+        return (membership @ self.matrix(review_ids)).tocsr()
+
+
+class KeywordIndexBuilder(object):
+    """
+    Builds a KeywordIndex from batches of reviews. Each batch is coded with its own vocabulary when it is added, the
+    vocabularies are merged and the reviews sorted by id in build, so the keywords are never held as strings at once.
+    """
+
+    def __init__(self):
+        self._review_ids = []
+        self._lengths = []
+        self._vocabularies = []
+        self._codes = []
+
+    def add(self, review_ids, keywords):
+        """
+
+        Parameters
+        ----------
+        review_ids ids of the reviews
+        keywords lists of keywords, in the same order. Missing lists count as empty.
+        """
+        keywords = [k if isinstance(k, (list, tuple, np.ndarray)) else [] for k in keywords]
+
+        flat = np.array([keyword for k in keywords for keyword in k], dtype=str)
+        vocabulary, codes = np.unique(flat, return_inverse=True)
+
+        self._review_ids.append(np.asarray(review_ids, dtype=np.int64))
+        self._lengths.append(np.array([len(k) for k in keywords], dtype=np.int64))
+        self._vocabularies.append(vocabulary)
+        self._codes.append(codes.astype(np.int32))
+
+    def build(self) -> KeywordIndex:
+        vocabulary = np.unique(np.concatenate(self._vocabularies or [np.array([], dtype=str)]))
+
+        # codes of the batch vocabularies in the merged vocabulary
+        codes = [np.searchsorted(vocabulary, v).astype(np.int32)[c] for v, c in zip(self._vocabularies, self._codes)]
+        codes = np.concatenate(codes or [np.array([], dtype=np.int32)])
+
+        review_ids = np.concatenate(self._review_ids or [np.array([], dtype=np.int64)])
+        lengths = np.concatenate(self._lengths or [np.array([], dtype=np.int64)])
+        starts = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=starts[1:])
+
+        order = np.argsort(review_ids, kind="stable")
+        lengths = lengths[order]
+        offsets = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # the keywords of the review at position i are moved from codes[starts[order[i]]:...] to codes[offsets[i]:...]
+        codes = codes[np.repeat(starts[order] - offsets[:-1], lengths) + np.arange(offsets[-1])]
+
+        review_ids = review_ids[order]
+        logger.info(f"Keyword index of {len(review_ids)} reviews, {len(codes)} keywords, {len(vocabulary)} unique")
+        return KeywordIndex(vocabulary, review_ids, offsets, codes.astype(np.int32))
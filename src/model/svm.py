@@ -6,6 +6,7 @@ import pickle
 import pandas as pd
 import os
 import config
+import utils
 import logging.config
 from sklearn import svm
 import numpy as np
@@ -19,7 +20,7 @@ logger = logging.getLogger(__name__)
 
 def main():
     df_tfidf = pd.read_pickle(os.path.join(config.DIR_PROCESSED, "tfidf-dataframe.pkl"))
-    df_reviews = pd.read_pickle(os.path.join(config.DIR_PROCESSED, "reviews.pkl"))
+    df_reviews = utils.load_reviews([Review.TITLE])
 
     liked = range(100)  # fake liked articles
 
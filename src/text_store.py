@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Store for the texts of the reviews, kept apart from the other columns so the dataset stays small. All texts are
+concatenated into one UTF-8 file, which is memory mapped. A small index (<path>.idx.npy) maps each review id to the
+byte range of its text, so single texts are read without loading the others.
+"""
+import logging
+import mmap
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# sorted by id, texts are bytes [start, end) of the data file
+_INDEX_DTYPE = np.dtype([("id", "<i8"), ("start", "<i8"), ("end", "<i8")])
+
+
+def path_for(dataset_path):
+    """
+    Path of the text store that belongs to a dataset, e.g. reviews-text.bin for reviews.parquet
+    """
+    return os.path.splitext(dataset_path)[0] + "-text.bin"
+
+
+def _index_path(path):
+    return path + ".idx.npy"
+
+
+def write(path, review_ids, texts):
+    """
+    Writes a new text store. Reviews without text are left out.
+
+    Parameters
+    ----------
+    path data file
+    review_ids ids of the reviews
+    texts texts of the reviews, in the same order
+    """
+    writer = TextStoreWriter(path)
+    writer.add(review_ids, texts)
+    writer.close()
+
+
+class TextStoreWriter(object):
+    """
+    Writes a new text store in batches. Texts are appended to the data file in the order they are added, only the
+    index is held in memory and sorted by id when the writer is closed. The files replace the store when the writer is
+    closed, so readers never see a partially written store.
+
+    Parameters
+    ----------
+    path data file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path + ".tmp", "wb")
+        self._offset = 0
+        self._entries = []
+
+    def add(self, review_ids, texts):
+        """
+        Adds the texts of the reviews, in the same order as the ids. Reviews without text are left out.
+        """
+        for review_id, text in zip(review_ids, texts):
+            if not isinstance(text, str):
+                continue
+
+            data = text.encode("utf-8")
+            self._file.write(data)
+            self._entries.append((int(review_id), self._offset, self._offset + len(data)))
+            self._offset += len(data)
+
+    def close(self):
+        self._file.close()
+
+        index = np.array(self._entries, dtype=_INDEX_DTYPE)
+        index.sort(order="id", kind="stable")
+        logger.info(f"Saving {len(index)} texts to '{self.path}'")
+
+        with open(_index_path(self.path) + ".tmp", "wb") as f:
+            np.save(f, index)
+
+        os.replace(self.path + ".tmp", self.path)
+        os.replace(_index_path(self.path) + ".tmp", _index_path(self.path))
+
+
+class TextStore(object):
+    """
+    Read access to a text store. Texts are decoded when they are requested, get_bytes returns the raw text without
+    copying it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._index = np.load(_index_path(path))
+        self._ids = self._index["id"]
+
+        self._file = open(path, "rb")
+        # empty files can not be mapped
+        if os.fstat(self._file.fileno()).st_size > 0:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._data = b""
+
+    def _position(self, review_id):
+        i = int(np.searchsorted(self._ids, review_id))
+        if i < len(self._ids) and self._ids[i] == review_id:
+            return i
+        return None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, review_id):
+        return self._position(review_id) is not None
+
+    def ids(self):
+        return self._ids
+
+    def get_bytes(self, review_id) -> memoryview:
+        """
+        UTF-8 encoded text, a view into the mapped file
+        """
+        i = self._position(review_id)
+        if i is None:
+            raise KeyError(review_id)
+
+        _, start, end = self._index[i]
+        return memoryview(self._data)[start:end]
+
+    def get(self, review_id, default=None) -> str:
+        i = self._position(review_id)
+        if i is None:
+            return default
+
+        _, start, end = self._index[i]
+        return self._data[start:end].decode("utf-8")
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
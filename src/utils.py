@@ -2,6 +2,7 @@
 """
 
 """
+import os
 import time
 import multiprocessing as mp
 import config
@@ -25,6 +26,149 @@ def save_gephi_csv(df, path):
     df.to_csv(path, sep=";", quoting=csv.QUOTE_ALL)
 
 
+# columns and date range used by default_df_filter
+FILTER_COLUMNS = [Review.PARSED_SUCCESS, Review.DATE, Review.REVIEWER_ID]
+DEFAULT_DATE_RANGE = (config.startdate, config.enddate)
+
+
+def load_reviews(columns=None, date_range=None, path=None) -> pd.DataFrame:
+    """
+    Loads the processed reviews. From Parquet, only the given columns are read, and row groups outside of the date
+    range are skipped. Falls back to the pickle if there is no Parquet file or pyarrow is not installed.
+
+    Parameters
+    ----------
+    columns columns to load, all if None. The id is always loaded. Texts are read from the text store, see
+    review_texts to read them one by one.
+    date_range (start, end), only reviews with start < date < end are loaded, e.g. DEFAULT_DATE_RANGE
+    path parquet or pickle file, defaults to the processed reviews
+
+    Returns
+    -------
+    dataframe indexed by id
+    """
+    # dataset imports utils
+    import dataset
+    import text_store
+
+    if path is None:
+        use_parquet = dataset.PARQUET_AVAILABLE and os.path.exists(config.PATH_REVIEWS_PARQUET)
+        path = config.PATH_REVIEWS_PARQUET if use_parquet else config.PATH_REVIEWS_PICKLE
+
+    if columns is not None:
+        columns = list(OrderedDict.fromkeys([Review.ID] + list(columns)))
+
+    logger.info(f"Reading '{path}'")
+
+    if path.endswith(".parquet"):
+        filters = None
+        if date_range is not None:
+            start, end = date_range
+            filters = [(Review.DATE, ">", pd.Timestamp(start)), (Review.DATE, "<", pd.Timestamp(end))]
+
+        df = dataset.read_reviews(path, columns=columns, filters=filters)
+
+        texts_path = text_store.path_for(path)
+        if (columns is None or Review.TEXT in columns) and Review.TEXT not in df and os.path.exists(texts_path):
+            store = text_store.TextStore(texts_path)
+            df[Review.TEXT] = [store.get(review_id) for review_id in df[Review.ID]]
+            store.close()
+
+        return df
+
+    df = pd.read_pickle(path)
+
+    if date_range is not None:
+        start, end = date_range
+        df = df[(df[Review.DATE] > start) & (df[Review.DATE] < end)]
+
+    if columns is not None:
+        df = df[columns]
+
+    return df
+
+
+def review_texts(review_ids):
+    """
+    Texts of the given reviews, in the same order. Texts are read lazily from the text store if there is one,
+    otherwise all texts are loaded at once.
+    """
+    import text_store
+
+    path = text_store.path_for(config.PATH_REVIEWS_PARQUET)
+    if os.path.exists(path):
+        store = text_store.TextStore(path)
+        try:
+            for review_id in review_ids:
+                yield store.get(review_id)
+        finally:
+            store.close()
+    else:
+        df = load_reviews([Review.TEXT])
+        for review_id in review_ids:
+            yield df.at[review_id, Review.TEXT]
+
+
+def load_keyword_index(path=None):
+    """
+    Integer coded keywords of the processed reviews, see keyword_index. The index is built from the keywords of the
+    reviews if there is none next to the dataset.
+
+    Parameters
+    ----------
+    path parquet or pickle file of the reviews, defaults to the processed reviews
+
+    Returns
+    -------
+    KeywordIndex
+    """
+    import keyword_index
+
+    index_path = keyword_index.path_for(path or config.PATH_REVIEWS_PARQUET)
+    if os.path.exists(index_path):
+        logger.info(f"Reading '{index_path}'")
+        return keyword_index.KeywordIndex.load(index_path)
+
+    df = load_reviews([Review.KEYWORDS], path=path)
+    return keyword_index.KeywordIndex.build(df[Review.ID], df[Review.KEYWORDS])
+
+
+def save_reviews(df):
+    """
+    Overwrites the processed reviews (csv, Parquet with the text store and pickle) and the keyword index.
+
+    The Parquet file is written first, so columns that do not match the schema of the dataset fail before any output
+    is changed. csv, Parquet and pickle are written to temporary files, which replace the outputs at the end.
+    """
+    import dataset
+    import keyword_index
+    import text_store
+
+    # (temporary file, output)
+    outputs = []
+
+    if dataset.PARQUET_AVAILABLE:
+        outputs.append((config.PATH_REVIEWS_PARQUET + ".tmp", config.PATH_REVIEWS_PARQUET))
+        dataset.write_reviews(df.drop(columns=Review.TEXT, errors="ignore"), outputs[-1][0])
+
+    if not dataset.PARQUET_AVAILABLE or os.path.exists(config.PATH_REVIEWS_PICKLE):
+        outputs.append((config.PATH_REVIEWS_PICKLE + ".tmp", config.PATH_REVIEWS_PICKLE))
+        logger.info(f"Saving to '{outputs[-1][0]}'")
+        df.to_pickle(outputs[-1][0])
+
+    outputs.append((config.PATH_REVIEWS_CSV + ".tmp", config.PATH_REVIEWS_CSV))
+    save_gephi_csv(df, outputs[-1][0])
+
+    # both are replaced atomically when complete
+    if dataset.PARQUET_AVAILABLE and Review.TEXT in df:
+        text_store.write(text_store.path_for(config.PATH_REVIEWS_PARQUET), df[Review.ID], df[Review.TEXT])
+    keyword_index.KeywordIndex.build(df[Review.ID], df[Review.KEYWORDS]).save(
+        keyword_index.path_for(config.PATH_REVIEWS_PARQUET))
+
+    for temporary_path, path in outputs:
+        os.replace(temporary_path, path)
+
+
 def default_df_filter(df):
     print(f"Datafram initial len: {len(df)}")
     df: pd.DataFrame = df[df[Review.PARSED_SUCCESS]]
@@ -274,31 +418,3 @@ def df_create_co_occurence_matrix(df, keywords) -> pd.DataFrame:
     co_occur = pd.DataFrame.from_dict(occurrences)
 
     return co_occur
-
-
-def dict_create_co_occurence_matrix(data, self_loops=False) -> pd.DataFrame:
-    """
-    Calculates the co-occurence-matrix for the given keywords, given as a list of dicts
-    """
-    reviewers = [reviewer[GEPHI_ID] for reviewer in data]
-    keywords = [reviewer[Review.KEYWORDS] for reviewer in data]
-
-    # a dic of dicts, one dic per keyword, containing co-occurences with other dicts
-    occurrences = OrderedDict(
-        (reviewer, OrderedDict((reviewer, 0) for reviewer in reviewers)) for reviewer in reviewers)
-
-    for r, reviewer in enumerate(reviewers):
-        for c, reviewer2 in enumerate(reviewers):
-
-            if not self_loops and c == r:
-                continue
-
-            keys = keywords[r]
-            keys2 = keywords[c]
-
-            # logger.info(reviewer)
-            for key in keys:
-                if key in keys2:
-                    occurrences[reviewer][reviewer2] += 1
-
-    return occurrences
\ No newline at end of file
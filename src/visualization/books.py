@@ -169,9 +169,8 @@ def eval_page_ranking(df: pd.DataFrame, top_n=20):
 
 def main():
     sb.set()
-    path = os.path.join(config.DIR_PROCESSED, "reviews.pkl")
-
-    df = pd.read_pickle(path)
+    columns = [Review.PAGES, Review.PRICE, Review.PRICE_UNIT, Review.PUBLISHED_YEAR, Review.PUBLISHER]
+    df = utils.load_reviews(columns + utils.FILTER_COLUMNS, date_range=utils.DEFAULT_DATE_RANGE)
     df = utils.default_df_filter(df)
     logger.info(f"Reviews: {len(df)}")
 
@@ -6,9 +6,9 @@ import logging.config
 import os
 
 import matplotlib.pyplot as plt
+import numpy as np
 import seaborn as sb
 
-import pandas as pd
 import config
 from db import Review
 import utils
@@ -22,35 +22,19 @@ n_keywords = 20
 def main():
     sb.set()
 
-    path = os.path.join(config.DIR_PROCESSED, "reviews.pkl")
-    df = pd.read_pickle(path)
+    df = utils.load_reviews(utils.FILTER_COLUMNS)
     logger.info("Reviews: %s", len(df))
     utils.default_df_filter(df)
 
-    keywords = {}
+    index = utils.load_keyword_index()
+    counts = index.counts(df[Review.ID].values)
+    used = np.flatnonzero((counts > 0) & (index.vocabulary != ""))
 
-    for keys in df[Review.KEYWORDS]:
-        # keys = value.replace("\n", ";").split(";")
-
-        for key in keys:
-            if key != "":
-                if keywords.get(key) is not None:
-                    count = keywords.get(key)
-                    keywords[key] = count + 1
-                else:
-                    keywords[key] = 1
-                # keywords.append(key)
-
-    # logger.info(keywords)
-    logger.info("Keywords: %d", len(keywords.keys()))
+    logger.info("Keywords: %d", len(used))
 
     # create ranking list
-    keyword_list = []
-
-    for key, count in keywords.items():
-        keyword_list.append((key, count))
-
-    keyword_list.sort(key=lambda e: e[1], reverse=True)
+    ranking = used[np.argsort(-counts[used], kind="stable")]
+    keyword_list = list(zip(index.vocabulary[ranking].tolist(), counts[ranking].tolist()))
 
     # print top 10 keywords
     logger.info(keyword_list[:n_keywords])
@@ -272,7 +272,8 @@ def main(n_reviewers=20):
         gender_bar_plot(df, output_path=p2.replace(".pgf", ".png"))
 
     # the following will be based on the reviews
-    df = pd.read_pickle(os.path.join(config.DIR_PROCESSED, "reviews.pkl"))
+    columns = [Review.REVIEWER_NAME, Review.REVIEWER_GENDER, Review.REVIEWER_TITLE] + utils.FILTER_COLUMNS
+    df = utils.load_reviews(columns, date_range=utils.DEFAULT_DATE_RANGE)
     df = utils.default_df_filter(df)
     logger.info(df.columns.values)
     df.set_index("date", inplace=True)
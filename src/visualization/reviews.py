@@ -142,8 +142,7 @@ def gender_bar_plot(df, out):
 
 def main():
     sb.set()
-    path = os.path.join(config.DIR_PROCESSED, "reviews.pkl")
-    df = pd.read_pickle(path)
+    df = utils.load_reviews([Review.REVIEWER_GENDER] + utils.FILTER_COLUMNS, date_range=utils.DEFAULT_DATE_RANGE)
     df = utils.default_df_filter(df)
 
     logger.info(df.columns.values)
@@ -18,10 +18,10 @@ logging.config.dictConfig(config.LOGGING_CONFIG)
 logger = logging.getLogger(__name__)
 
 
-def main(path=os.path.join(config.DIR_PROCESSED, "reviews.pkl"), timeslice="Y"):
+def main(path=None, timeslice="Y"):
     sb.set()
 
-    df = pd.read_pickle(path)
+    df = utils.load_reviews([Review.WORD_COUNT] + utils.FILTER_COLUMNS, path=path)
     utils.default_df_filter(df)
     df.set_index(Review.DATE, inplace=True)
 
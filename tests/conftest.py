@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""
+The modules in src import each other by their top level names, as when the scripts are run from src
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import os
+
+import archive
+
+PAGES = {3: "<html><body><p>Köln &amp; Bonn</p></body></html>",
+         1: "<html>\r\n<body>Zeilen\r\nende\r</body></html>",
+         7: "<html><body>" + "Rezension " * 2000 + "</body></html>",
+         2: ""}
+
+
+def fill(store):
+    for identifier, content in PAGES.items():
+        store.put(identifier, content)
+
+
+def test_shards_give_the_same_pages_as_html_files(tmp_path):
+    html = archive.DirectoryStore(str(tmp_path / "html"))
+    os.makedirs(html.directory)
+    shards = archive.ShardStore(str(tmp_path / "shards"), max_shard_size=64)
+    fill(html)
+    fill(shards)
+
+    assert sorted(shards.ids()) == html.ids()
+    for identifier in PAGES:
+        assert shards.get(identifier) == html.get(identifier)
+        assert shards.size(identifier) == len(PAGES[identifier].encode("utf-8"))
+
+    # a new shard is started when a record does not fit
+    assert len([f for f in os.listdir(shards.directory) if f.startswith("shard-")]) > 1
+    shards.close()
+
+
+def test_updates_are_read_after_reopening(tmp_path):
+    directory = str(tmp_path / "shards")
+    store = archive.ShardStore(directory)
+    fill(store)
+    fingerprint = store.fingerprint(3)
+    store.put(3, "<html>neu</html>")
+    assert store.fingerprint(3) != fingerprint
+    store.close()
+
+    store = archive.ShardStore(directory)
+    assert store.get(3) == "<html>neu</html>"
+    assert store.get(7) == PAGES[7]
+    assert not store.exists(4)
+    store.close()
+
+
+def test_partially_written_index_entry_is_ignored(tmp_path):
+    directory = str(tmp_path / "shards")
+    store = archive.ShardStore(directory)
+    fill(store)
+    store.close()
+
+    # interrupted while the entry of another page was written
+    with open(os.path.join(directory, "index.dat"), "ab") as f:
+        f.write(b"\x01\x02\x03")
+
+    store = archive.ShardStore(directory)
+    assert sorted(store.ids()) == sorted(PAGES)
+    assert store.get(1) == PAGES[1].replace("\r\n", "\n").replace("\r", "\n")
+    store.close()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import bs4
+import pytest
+
+from features import reviews
+
+BOXES = {
+    "paragraphs": "<p>Erster <b>Absatz</b></p><p>  Zweiter\n Absatz </p><p></p>",
+    "headings": "<h2>Thema</h2><p>Text</p><h2> Zur <em>Person</em> </h2><p>Rezensentin</p>",
+    "nested paragraphs": "<p>Außen <p>innen</p> weiter</p><div><p>im div</p></div>",
+    "links": '<p><a href="https://example.org/a">A</a> <a href="http://portal.d-nb.de/opac.htm?query=1">DNB</a>'
+             '<a name="anker">ohne</a><a href="/rezensionen/rezensionen.php?id=7">R</a>'
+             '<a href="https://example.org/b"><b>B</b></a></p>',
+    "ignored strings": "<p>Text<script>var x = 1;</script><style>p {}</style> weiter</p><!-- Kommentar -->",
+    "entities": "<p>&amp; &uuml;ber&nbsp;&#8222;Praxis&#8220;</p>",
+}
+
+PREFIXES = ["https://", "http://", "/rezensionen/rezensionen.php"]
+
+
+def contentbox(body):
+    soup = bs4.BeautifulSoup(f'<html><body><div class="contentbox">{body}</div></body></html>', "html.parser")
+    return soup.find("div", attrs={"class": "contentbox"})
+
+
+@pytest.mark.parametrize("body", list(BOXES))
+def test_index_matches_the_tree_scans(body):
+    box = contentbox(BOXES[body])
+    index = reviews.build_content_index(box)
+
+    assert index.text() == box.text
+    assert index.stripped_strings() == list(box.stripped_strings)
+    assert [index.text(span) for span in index.paragraphs] == [p.text for p in box.find_all("p")]
+    assert ([index.stripped_strings(span) for span in index.paragraphs]
+            == [list(p.stripped_strings) for p in box.find_all("p")])
+    assert [index.text(span) for span in index.headings] == [h.text for h in box.find_all("h2")]
+
+    for prefix in PREFIXES:
+        expected = [a.get("href") for a in box.find_all("a", href=True) if a.get("href").startswith(prefix)]
+        assert index.links(prefix) == expected
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+import dataset
+from db import Review
+
+pytestmark = pytest.mark.skipif(not dataset.PARQUET_AVAILABLE, reason="requires pyarrow")
+
+
+@pytest.fixture
+def parquet_path(tmp_path):
+    path = str(tmp_path / "rows.parquet")
+    writer = dataset.ParquetRowWriter(path, [Review.ID, Review.WORD_COUNT], row_group_size=7)
+    for review_id in range(100):
+        writer.add((review_id,) + (None,) * (len(Review.FIELDS) - 1))
+    writer.close()
+    return path
+
+
+@pytest.mark.parametrize("positions", [[], [0], [99, 3, 50, 3, 0], list(np.random.RandomState(0).permutation(100))])
+def test_read_rows_keeps_the_given_order(parquet_path, positions):
+    df = dataset.read_rows(parquet_path, positions)
+    assert list(df[Review.ID]) == list(positions)
+
+
+def test_take_rows_of_files_fills_missing_columns(parquet_path):
+    schema = dataset.review_schema([Review.ID, Review.TEXT])
+    table = dataset.take_rows_of_files([parquet_path, parquet_path], [1, 0, 1], [5, 60, 6], schema)
+
+    assert table.schema == schema
+    assert table.column(Review.ID).to_pylist() == [5, 60, 6]
+    assert table.column(Review.TEXT).to_pylist() == [None] * 3
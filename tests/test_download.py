@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+import archive
+from db import CrawlManifest
+from download import download
+
+
+class Page(object):
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+        self.headers = {}
+
+
+def test_error_responses_are_not_stored(tmp_path):
+    (tmp_path / "html").mkdir()
+    store = archive.open_store(archive.FORMAT_HTML, str(tmp_path / "html"))
+    manifest = CrawlManifest(str(tmp_path / "manifest.sqlite"))
+    pages = []
+
+    download.store_article(1, Page(500, "<html><title>Internal Server Error</title></html>"), store, manifest,
+                           on_page=lambda i, content: pages.append(i))
+    download.store_article(2, Page(200, "<html><title>Rezension</title></html>"), store, manifest,
+                           on_page=lambda i, content: pages.append(i))
+
+    assert not store.exists(1)
+    assert manifest.get(1).state == CrawlManifest.STATE_FAILED
+    assert manifest.get(1).http_status == 500
+
+    assert store.exists(2)
+    assert manifest.get(2).state == CrawlManifest.STATE_DONE
+    assert pages == [2]
+    manifest.close()
+
+
+def test_interrupt_stops_concurrent_crawl(tmp_path, monkeypatch):
+    manifest = CrawlManifest(str(tmp_path / "manifest.sqlite"))
+    started = []
+
+    def scrape_article(i, stop=None, **kwargs):
+        if stop.is_set():
+            return False
+        started.append(i)
+        if len(started) == 5:
+            raise KeyboardInterrupt()
+        time.sleep(0.01)
+        return True
+
+    monkeypatch.setattr(download, "scrape_article", scrape_article)
+
+    with pytest.raises(KeyboardInterrupt):
+        download.scrape_loop(list(range(1000)), None, manifest, 0.1, workers=4, rate=1000)
+
+    interrupted_at = time.time()
+
+    assert len(started) <= 5 + download.WINDOW_PER_WORKER * 4
+    # the crawl has not been finished, so it is resumed instead of starting a new one
+    assert manifest.begin_crawl() < interrupted_at
+    manifest.close()
+
+
+class Clock(object):
+    """
+    Replaces time.monotonic and time.sleep, sleeping advances the clock
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += max(seconds, 0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(download.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(download.time, "sleep", clock.sleep)
+    return clock
+
+
+def test_token_bucket_keeps_the_politeness_budget_of_the_sequential_crawler(clock):
+    # the sequential crawler slept 0.5 + rand * 0.5 s between requests, 0.75 s on average
+    bucket = download.TokenBucket(download.get_rate(0.5))
+    start = clock.now
+    for _ in range(11):
+        bucket.acquire()
+
+    assert clock.now - start == pytest.approx(10 * 0.75)
+
+
+def test_rate_limiter_has_one_bucket_per_host(clock):
+    limiter = download.RateLimiter(rate=1.0)
+    start = clock.now
+    limiter.acquire("https://www.example.org/rezensionen/1.php")
+    limiter.acquire("https://other.example.org/rezensionen/1.php")
+    assert clock.now == start
+
+    limiter.acquire("https://www.example.org/rezensionen/2.php")
+    assert clock.now - start == pytest.approx(1.0)
+
+
+def test_token_bucket_is_shared_between_threads():
+    bucket = download.TokenBucket(rate=200.0)
+    start = time.monotonic()
+
+    threads = [threading.Thread(target=lambda: [bucket.acquire() for _ in range(10)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # the first token is available right away
+    assert time.monotonic() - start >= 39 / 200.0
+
+
+class Session(object):
+    """
+    Answers with the given pages, exceptions are raised
+    """
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.n_requests = 0
+
+    def get(self, url, headers=None):
+        self.n_requests += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class Sessions(object):
+    def __init__(self, session):
+        self.session = session
+
+    def get(self):
+        return self.session
+
+
+def request(responses, retry=None, breaker=None):
+    session = Session(responses)
+    stats = download.CrawlStats()
+    page = download.request_with_retry("https://www.example.org/1.php", Sessions(session), download.RateLimiter(None),
+                                       retry or download.RetryPolicy(max_attempts=3),
+                                       breaker or download.CircuitBreaker(), stats=stats)
+    return page, session, stats
+
+
+def test_transient_failures_are_retried(clock):
+    page, session, stats = request([Page(503, ""), download.requests.ConnectionError("reset"), Page(200, "ok")])
+
+    assert page.text == "ok"
+    assert session.n_requests == 3
+    assert stats.n_retries == 2
+
+
+def test_other_responses_are_returned_like_before(clock):
+    # the sequential crawler returned every response, e.g. 404 for ids without article
+    page, session, _ = request([Page(404, "not found")])
+    assert page.status_code == 404 and session.n_requests == 1
+
+
+def test_retries_give_up_after_the_last_attempt(clock):
+    with pytest.raises(download.ScrapeError) as e:
+        request([Page(500, "")] * 3)
+    assert e.value.http_status == 500
+
+
+def test_retry_after_is_respected(clock):
+    retry = download.RetryPolicy(base_delay=0.001, max_delay=60.0)
+    page = Page(429, "")
+    page.headers["Retry-After"] = "30"
+
+    assert retry.get_delay(0, page) == 30
+    assert retry.get_delay(0, Page(503, "")) <= 0.001
+
+
+def test_circuit_breaker_pauses_after_consecutive_failures(clock):
+    breaker = download.CircuitBreaker(threshold=3, cooldown=60.0)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    start = clock.now
+    breaker.wait()
+    assert clock.now == start
+
+    breaker.record_failure()
+    breaker.wait()
+    assert clock.now - start == pytest.approx(60.0)
+
+    # half open: the next failure pauses again right away
+    breaker.record_failure()
+    breaker.wait()
+    assert clock.now - start == pytest.approx(120.0)
+
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.wait()
+    assert clock.now - start == pytest.approx(120.0)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import random
+
+import pytest
+
+from features.gazetteer import Gazetteer
+
+
+def baseline_find(cities, description):
+    """
+    The search of guess_city before the gazetteer: one substring search per city and pattern
+    """
+    found_cities = []
+    for city in cities:
+        if " " + city + " " in description:
+            found_cities.append(city)
+            continue
+        for pattern in [" " + city + ".", " " + city + ",", " " + city + ";", " " + city + "/", "/" + city]:
+            if pattern in description:
+                found_cities.append(city)
+        if description.endswith(" " + city):
+            found_cities.append(city)
+    return found_cities
+
+
+CITIES = ["Köln", "Bonn", "Bad Honnef", "Halle", "Halle (Saale)", "Hal", "Köln", "Frankfurt am Main", "Frankfurt"]
+
+
+@pytest.mark.parametrize("description", [
+    "Professorin an der Hochschule in Köln",
+    "Lehrbeauftragter in Köln, Bonn und Bad Honnef.",
+    "Sozialarbeiterin in Halle (Saale); zuvor in Frankfurt am Main/Frankfurt",
+    "Dozent in Köln/Bonn, Halle. Frankfurt",
+    "Berater in Kölner Einrichtungen /Kölnisch",
+    "Köln am Anfang zählt nicht",
+    "Frankfurt am Mainz, Hal/Hall",
+    "",
+])
+def test_gazetteer_finds_the_same_cities(description):
+    assert Gazetteer(CITIES).find(description) == baseline_find(CITIES, description)
+
+
+def test_gazetteer_finds_the_same_cities_in_random_descriptions():
+    rng = random.Random(0)
+    cities = ["ab", "a", "abc", "b a", "ba", "ab"]
+
+    for _ in range(2000):
+        description = "".join(rng.choice("ab /.,;:") for _ in range(rng.randint(0, 12)))
+        assert Gazetteer(cities).find(description) == baseline_find(cities, description), description
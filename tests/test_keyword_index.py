@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import random
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import keyword_index
+from keyword_index import KeywordIndex, KeywordIndexBuilder
+
+KEYWORDS = {4: ["Schule", "Jugend", "Schule"], 1: ["Armut"], 9: [], 2: None, 7: ["Jugend", "Alter", "Armut"],
+            3: ["Schule", "Armut"]}
+
+
+def baseline_co_occurrences(documents, keywords):
+    """
+    The pair loop of gephi/keywords.create_co_occurrence_matrix before the keyword index
+    """
+    occurrences = {key: {key: 0 for key in keywords} for key in keywords}
+    for lis in documents:
+        for i in range(len(lis)):
+            for item in lis[:i] + lis[i + 1:]:
+                occurrences[lis[i]][item] += 1
+    return occurrences
+
+
+def baseline_shared_keywords(keywords, self_loops=False):
+    """
+    utils.dict_create_co_occurence_matrix before the keyword index
+    """
+    n = len(keywords)
+    occurrences = np.zeros((n, n), dtype=np.int64)
+    for r in range(n):
+        for c in range(n):
+            if not self_loops and c == r:
+                continue
+            occurrences[r, c] = sum(1 for key in keywords[r] if key in keywords[c])
+    return occurrences
+
+
+@pytest.fixture
+def index():
+    return KeywordIndex.build(list(KEYWORDS), list(KEYWORDS.values()))
+
+
+def test_index_round_trip(tmp_path, index):
+    path = str(tmp_path / "reviews-keywords.npz")
+    index.save(path)
+    loaded = KeywordIndex.load(path)
+
+    assert list(loaded.review_ids) == sorted(KEYWORDS)
+    for review_id, keywords in KEYWORDS.items():
+        assert loaded.keywords(review_id) == (keywords or [])
+    assert loaded.code("Fehlt") is None
+    with pytest.raises(KeyError):
+        loaded.positions([5])
+
+
+def test_counts_match_counter(index):
+    selected = [4, 7, 4, 3]
+    expected = Counter(keyword for review_id in selected for keyword in KEYWORDS[review_id])
+
+    counts = index.counts(selected)
+    assert {index.vocabulary[i]: int(c) for i, c in enumerate(counts) if c} == expected
+
+    all_counts = Counter(keyword for keywords in KEYWORDS.values() for keyword in keywords or [])
+    assert {index.vocabulary[i]: int(c) for i, c in enumerate(index.counts()) if c} == all_counts
+
+    by_group = index.counts_by([4, 1, 7, 3], [1, 0, -1, 1]).toarray()
+    assert by_group.shape == (2, len(index.vocabulary))
+    assert list(by_group[0]) == list(index.counts([1]))
+    assert list(by_group[1]) == list(index.counts([4, 3]))
+
+
+def test_batches_give_the_same_index(index):
+    builder = KeywordIndexBuilder()
+    items = list(KEYWORDS.items())
+    for start in range(0, len(items), 4):
+        batch = items[start:start + 4]
+        builder.add([review_id for review_id, _ in batch], [keywords for _, keywords in batch])
+    built = builder.build()
+
+    for name in ["vocabulary", "review_ids", "offsets", "codes"]:
+        assert list(getattr(built, name)) == list(getattr(index, name))
+
+
+def test_co_occurrences_match_the_pair_loop():
+    rng = random.Random(0)
+    vocabulary = ["a", "b", "c", "d", "e"]
+    documents = [[rng.choice(vocabulary) for _ in range(rng.randint(0, 5))] for _ in range(50)]
+
+    index = KeywordIndex.build(range(len(documents)), documents)
+    occurrences = keyword_index.co_occurrences(index.matrix()).toarray()
+
+    expected = baseline_co_occurrences(documents, list(index.vocabulary))
+    for i, a in enumerate(index.vocabulary):
+        for j, b in enumerate(index.vocabulary):
+            assert occurrences[i, j] == expected[a][b], (a, b)
+
+
+@pytest.mark.parametrize("self_loops", [False, True])
+def test_shared_keywords_match_the_pair_loop(self_loops):
+    rng = random.Random(1)
+    # keywords of reviewers are distinct, see gephi/reviewers.create_nodelist
+    groups = [rng.sample("abcdefg", rng.randint(0, 5)) for _ in range(12)]
+
+    index = KeywordIndex.build(range(len(groups)), groups)
+    shared = keyword_index.shared_keywords(index.matrix(), self_loops=self_loops).toarray()
+
+    assert (shared == baseline_shared_keywords(groups, self_loops=self_loops)).all()
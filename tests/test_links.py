@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import config
+from features.links import LinkClassifier
+
+IGNORE_URLS = ["facebook.com", "https://www.xxx.de/impressum", "d-nb.de/opac.htm?query=978", "twitter", "/ads/"]
+
+LINKS = [
+    "http://portal.d-nb.de/opac.htm?query=9783123456789&method=simpleSearch",
+    "http://portal.d-nb.de/opac.htm?query=1234",
+    "https://portal.d-nb.de/opac.htm?query=9783123456789",
+    "https://www.facebook.com/socialnet",
+    "https://facebook.com.example.org/",
+    "https://www.xxx.de/impressum.php",
+    "https://www.xxx.de/stellenmarkt/index.php?auswahl=12",
+    "http://www.xxx.de/stellenmarkt/index.php?auswahl=12",
+    "/rezensionen/rezensionen.php?id=42",
+    "https://www.xxx.de/rezensionen/rezensionen.php?id=42",
+    "https://example.org/ads/banner",
+    "https://example.org/twitter-card",
+    "https://example.org/",
+    "",
+]
+
+
+def baseline_is_ignored(link, ignore):
+    for url in ignore:
+        if url in link:
+            return True
+    return False
+
+
+def baseline_known_class(link):
+    if link.startswith("http://portal.d-nb.de/opac.htm?query="):
+        return LinkClassifier.DNB
+    if link.startswith(config.URL_WEBSITE + "/stellenmarkt/index.php?auswahl="):
+        return LinkClassifier.CATEGORY
+    if link.startswith("/rezensionen/rezensionen.php"):
+        return LinkClassifier.REVIEWER
+    return None
+
+
+def test_same_as_substring_rules():
+    classifier = LinkClassifier(config.URL_WEBSITE, IGNORE_URLS)
+
+    for link in LINKS:
+        assert classifier.is_ignored(link) == baseline_is_ignored(link, IGNORE_URLS), link
+        assert classifier.known_class(link) == baseline_known_class(link), link
+
+
+def test_ignore_rules_do_not_hide_dnb_links():
+    classifier = LinkClassifier(config.URL_WEBSITE, IGNORE_URLS)
+    link = "http://portal.d-nb.de/opac.htm?query=9783123456789"
+
+    # as before, the isbn is taken from the link, but the link is not kept
+    assert classifier.known_class(link) == LinkClassifier.DNB
+    assert classifier.is_ignored(link)
+
+
+def test_empty_rule_ignores_all_links():
+    classifier = LinkClassifier(config.URL_WEBSITE, [""])
+    assert all(classifier.is_ignored(link) for link in LINKS)
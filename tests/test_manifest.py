@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+import threading
+
+import archive
+from db import CrawlManifest
+from download import download
+
+
+def test_redownload_does_not_finish_interrupted_crawl(tmp_path):
+    path = str(tmp_path / "manifest.sqlite")
+
+    manifest = CrawlManifest(path)
+    crawl_start = manifest.begin_crawl()
+    manifest.close()
+
+    # a redownload while the full crawl is interrupted
+    manifest = CrawlManifest(path)
+    redownload_start = manifest.begin_crawl(resume=False, kind=CrawlManifest.CRAWL_REDOWNLOAD)
+    manifest.finish_crawl()
+    manifest.close()
+    assert redownload_start >= crawl_start
+
+    manifest = CrawlManifest(path)
+    assert manifest.begin_crawl() == crawl_start
+    manifest.close()
+
+
+def test_crawls_of_old_manifests_are_full_crawls(tmp_path):
+    path = str(tmp_path / "manifest.sqlite")
+
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("CREATE TABLE crawls (id INTEGER PRIMARY KEY AUTOINCREMENT, started_at REAL NOT NULL, "
+                           "finished_at REAL)")
+        connection.execute("INSERT INTO crawls (started_at) VALUES (?)", (1.0,))
+    connection.close()
+
+    manifest = CrawlManifest(path)
+    assert manifest.begin_crawl() == 1.0
+    manifest.close()
+
+
+class Page(object):
+    def __init__(self, text):
+        self.status_code = 200
+        self.text = text
+        self.headers = {}
+
+
+class Site(object):
+    """
+    Session of a site where every article exists
+    """
+
+    def __init__(self):
+        self.requested = []
+
+    def get(self, url, headers=None):
+        identifier = int(url.rsplit("/", 1)[1].split(".")[0])
+        self.requested.append(identifier)
+        return Page(f"<html><title>Rezension {identifier}</title></html>")
+
+
+class Sessions(object):
+    def __init__(self, session):
+        self.session = session
+
+    def get(self):
+        return self.session
+
+    def recycle(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def crawl(tmp_path, ids, site, stop_after=None, update=True):
+    (tmp_path / "html").mkdir(exist_ok=True)
+    store = archive.DirectoryStore(str(tmp_path / "html"))
+    manifest = CrawlManifest(str(tmp_path / "manifest.sqlite"))
+    stop = threading.Event()
+    pages = []
+
+    def on_page(identifier, content):
+        pages.append(identifier)
+        if len(pages) == stop_after:
+            stop.set()
+
+    download.scrape_loop(ids, store, manifest, 0, update=update, sessions=Sessions(site), on_page=on_page, stop=stop,
+                         base_url="https://www.example.org/rezensionen")
+    manifest.close()
+
+
+def test_interrupted_crawl_is_resumed(tmp_path):
+    ids = list(range(1, 21))
+
+    site = Site()
+    crawl(tmp_path, ids, site, stop_after=8)
+    assert site.requested == ids[:8]
+
+    # the resumed crawl only fetches the rest
+    site = Site()
+    crawl(tmp_path, ids, site)
+    assert site.requested == ids[8:]
+
+    # the crawl was finished, the next one fetches all articles again
+    site = Site()
+    crawl(tmp_path, ids, site)
+    assert site.requested == ids
+
+
+def test_existing_articles_are_skipped_without_update(tmp_path):
+    # same as the crawler before the manifest, which skipped the existing files
+    ids = list(range(1, 11))
+    crawl(tmp_path, ids[:4], Site())
+
+    site = Site()
+    crawl(tmp_path, ids, site, update=False)
+    assert site.requested == ids[4:]
+    assert sorted(archive.DirectoryStore(str(tmp_path / "html")).ids()) == ids
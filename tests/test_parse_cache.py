@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+from db import ParseCache
+from features import reviews
+
+
+def test_rows_of_other_parsers_are_not_used(tmp_path):
+    rules = reviews.ExtractionRules.load()
+    path = str(tmp_path / "parse-cache.sqlite")
+
+    cache = ParseCache(path, reviews.extractor_version(rules, reviews.PARSER_BS4))
+    cache.put_many([(1, "fingerprint", (1,))])
+    assert cache.lookup({1: "fingerprint"}) == {1: (1,)}
+    cache.close()
+
+    cache = ParseCache(path, reviews.extractor_version(rules, reviews.PARSER_LXML))
+    assert cache.lookup({1: "fingerprint"}) == {}
+    cache.close()
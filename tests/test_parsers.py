@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from features import check_parser, reviews
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>Rezension 1 | www.xxx.de</title>
+<meta name="keywords" content="Schule;Jugendhilfe;_empfohlen">
+<meta name="description" content="Rezension eines Buches">
+</head><body>
+<div class="nav"><a href="/index.php">Start</a></div>
+<div class="contentbox">
+<p><strong>Anna Muster:</strong> Soziale Arbeit in der Schule. Votum Verlag (Berlin) 2010. 224 Seiten.
+ISBN 978-3-12345-678-9. 19,90 EUR.</p>
+<p>Rezension vom 01.02.2011, Abrufdatum 03.04.2012</p>
+<p>Besprochenes Werk kaufen</p>
+<h2>Thema</h2>
+{body}
+<h2>Zur Person</h2>
+<p>Rezensentin</p>
+<p>Prof. Dr. Erika Beispiel</p>
+<p>Hochschule in Köln, Lehrgebiet Soziale Arbeit</p>
+<p><a href="/rezensionen/rezensionen.php?id=77">Alle 5 Rezensionen von Erika Beispiel</a></p>
+<p><a href="http://portal.d-nb.de/opac.htm?query=9783123456789&amp;method=simpleSearch">DNB</a></p>
+<p><a href="https://example.org/literatur">Literatur</a></p>
+<p>Zitiervorschlag</p>
+<p>Ende</p>
+</div>
+<div class="contentbox"><p>Werbung</p></div>
+<div class="contentbox"><a href="https://www.xxx.de/stellenmarkt/index.php?auswahl=12">Kategorie</a></div>
+</body></html>"""
+
+BODIES = {
+    "valid": "<p>Das Buch behandelt die <em>Schulsozialarbeit</em>.</p>\n<p>Es ist gut lesbar.</p>",
+    "entities": "<p>Das Buch &amp; die Schulsozialarbeit &uuml;ber &#8222;Praxis&#8220;.</p>\n<p>Es&nbsp;ist gut.</p>",
+    "comment": "<p>Das Buch <!-- Anmerkung --> behandelt die Schulsozialarbeit.</p>\n<p>Es ist gut lesbar.</p>",
+    "unclosed p": "<p>Das Buch behandelt die Schulsozialarbeit.\n<p>Es ist gut lesbar.",
+    "div in p": "<p>Das Buch <div>behandelt</div> die Schulsozialarbeit.</p>\n<p>Es ist gut lesbar.</p>",
+    "unclosed inline": "<p>Das Buch <b>behandelt die Schulsozialarbeit.</p>\n<p>Es ist gut lesbar.</p>",
+    "stray end tag": "<p>Das Buch behandelt</span> die Schulsozialarbeit.</p>\n<p>Es ist gut lesbar.</p>",
+}
+
+
+def test_page_is_parsed():
+    review = reviews.process_document(1, PAGE.format(body=BODIES["valid"]))
+
+    assert review.parsed_success, review.parse_error
+    assert review.reviewer_id == 77
+    assert review.isbn == "9783123456789"
+    assert review.category == "12"
+
+
+@pytest.mark.parametrize("parser", [p for p in reviews.PARSERS if p != reviews.PARSER_BS4])
+@pytest.mark.parametrize("body", list(BODIES))
+def test_parsers_give_the_same_rows(parser, body):
+    page = PAGE.format(body=BODIES[body])
+
+    expected = reviews.process_document(1, page, parser=reviews.PARSER_BS4)
+    actual = reviews.process_document(1, page, parser=parser)
+    assert check_parser.compare_reviews(expected, actual) == []
+
+
+@pytest.mark.parametrize("body", list(BODIES))
+def test_restricted_parse_keeps_the_content_elements(body):
+    page = PAGE.format(body=BODIES[body])
+
+    full = reviews.parse_document(page, reviews.PARSER_BS4)
+    restricted = reviews.parse_document(page, reviews.PARSER_BS4_RESTRICTED)
+
+    assert restricted.find("title").text == full.find("title").text
+    assert [str(m) for m in restricted.find_all("meta")] == [str(m) for m in full.find_all("meta")]
+
+    boxes = full.find_all("div", attrs={"class": "contentbox"})
+    assert [str(b) for b in restricted.find_all("div", attrs={"class": "contentbox"})] == [str(b) for b in boxes]
+    # navigation is skipped
+    assert restricted.find("div", attrs={"class": "nav"}) is None
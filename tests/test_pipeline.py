@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from features import pipeline
+
+
+class FailingWriter(object):
+    def add(self, review):
+        raise ValueError("disk full")
+
+
+def test_parser_failure_stops_downloaders(monkeypatch):
+    offered = []
+
+    def scrape_loop(r, store, manifest, sleep, on_page=None, stop=None, **kwargs):
+        # like download.scrape_loop, errors of single articles do not abort the crawl
+        for i in r:
+            if stop.is_set():
+                return
+            offered.append(i)
+            try:
+                on_page(i, "<html><head><title>Seite nicht gefunden</title></head></html>")
+            except RuntimeError:
+                pass
+
+    monkeypatch.setattr(pipeline.download, "scrape_loop", scrape_loop)
+    monkeypatch.setattr(pipeline, "PUT_TIMEOUT", 0.05)
+
+    with pytest.raises(ValueError, match="disk full"):
+        pipeline.run_pipeline(range(1000), None, None, FailingWriter(), 0, n_processes=1, queue_size=2)
+
+    assert len(offered) < 1000
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pandas
+import pytest
+
+import dataset
+import keyword_index
+import utils
+from db import Review
+from features import reviews
+
+
+def failed_review(review_id):
+    review = Review(review_id)
+    review.parsed_success = False
+    review.parse_error_type = "MyException"
+    review.parse_error = "Count not find reviewer id"
+    return review
+
+
+def parsed_review(review_id):
+    review = Review(review_id)
+    review.date = pandas.Timestamp("2010-01-01")
+    review.keywords = ["Schule"]
+    review.text = "Text"
+    review.reviewer_id = 1
+    review.reviewer_marker = reviews.MARKER_FEMALE
+    review.reviewer_gender = reviews.MARKER_GENDERS[reviews.MARKER_FEMALE]
+    return review
+
+
+def test_close_without_rows_in_memory(tmp_path):
+    writer = reviews.ReviewWriter(str(tmp_path / "reviews.csv"), str(tmp_path / "reviews.pkl"),
+                                  failures_path=str(tmp_path / "failures.csv"))
+    writer.add(failed_review(1))
+    writer.close()
+
+    assert len(pandas.read_pickle(tmp_path / "reviews.pkl")) == 0
+    assert list(reviews.load_parse_failures(str(tmp_path / "failures.csv"))[Review.ID]) == [1]
+
+
+@pytest.mark.skipif(not dataset.PARQUET_AVAILABLE, reason="requires pyarrow")
+def test_close_without_rows_streamed(tmp_path):
+    parquet_path = str(tmp_path / "reviews.parquet")
+    writer = reviews.ReviewWriter(str(tmp_path / "reviews.csv"), None, failures_path=str(tmp_path / "failures.csv"),
+                                  parquet_path=parquet_path)
+    writer.add(failed_review(1))
+    writer.close()
+
+    assert len(utils.load_reviews(path=parquet_path)) == 0
+    assert list(reviews.load_parse_failures(str(tmp_path / "failures.csv"))[Review.ID]) == [1]
+    assert not os.path.exists(parquet_path + ".parts")
+
+
+@pytest.mark.skipif(not dataset.PARQUET_AVAILABLE, reason="requires pyarrow")
+def test_close_without_new_rows_keeps_merged_reviews(tmp_path):
+    parquet_path = str(tmp_path / "reviews.parquet")
+    writer = reviews.ReviewWriter(str(tmp_path / "reviews.csv"), None, parquet_path=parquet_path)
+    writer.add(parsed_review(1))
+    writer.close()
+
+    writer = reviews.ReviewWriter(str(tmp_path / "reviews.csv"), None, merge=True, parquet_path=parquet_path)
+    writer.close()
+
+    df = utils.load_reviews(path=parquet_path)
+    assert list(df[Review.ID]) == [1]
+    assert df.at[1, Review.TEXT] == "Text"
+
+
+def test_existing_csv_is_kept_until_close(tmp_path):
+    csv_path = str(tmp_path / "reviews.csv")
+    pickle_path = str(tmp_path / "reviews.pkl")
+    writer = reviews.ReviewWriter(csv_path, pickle_path)
+    writer.add(parsed_review(1))
+    writer.close()
+
+    writer = reviews.ReviewWriter(csv_path, pickle_path, merge=True, append_every=1)
+    writer.add(parsed_review(2))
+
+    # the writer is not closed yet, e.g. because the pipeline failed
+    assert list(pandas.read_csv(csv_path, sep=";")[Review.ID]) == [1]
+
+    writer.close()
+    assert sorted(pandas.read_csv(csv_path, sep=";")[Review.ID]) == [1, 2]
+    assert not os.path.exists(csv_path + ".tmp")
+
+
+def varied_review(review_id, day, reviewer_id, marker, keywords, word_count=120):
+    review = parsed_review(review_id)
+    review.date = pandas.Timestamp("2010-01-01") + pandas.Timedelta(days=day)
+    review.keywords = keywords
+    review.text = None if review_id % 5 == 0 else f"Text {review_id}"
+    review.word_count = word_count
+    review.reviewer_id = reviewer_id
+    review.reviewer_marker = marker
+    review.reviewer_gender = reviews.MARKER_GENDERS.get(marker, reviews.GENDER_ELSE)
+    return review
+
+
+# ties in the dates, reviewers whose gender is only known from a review in another chunk, missing word counts
+VARIED = [varied_review(1, 3, 10, reviews.MARKER_UNKNOWN, ["Schule", "Jugend"]),
+          varied_review(2, 1, 11, reviews.MARKER_MALE, ["Schule"], word_count=None),
+          varied_review(3, 3, 12, reviews.MARKER_UNKNOWN, None),
+          varied_review(4, 0, 12, reviews.MARKER_UNKNOWN, ["Alter", "Schule", "Alter"]),
+          varied_review(5, 7, 10, reviews.MARKER_FEMALE, []),
+          varied_review(6, 3, 11, reviews.MARKER_UNKNOWN, ["Jugend"]),
+          varied_review(7, 2, 13, reviews.MARKER_FEMALE, ["Armut"]),
+          varied_review(8, 3, 13, reviews.MARKER_UNKNOWN, ["Schule"])]
+
+
+def write_in_memory(tmp_path, batches):
+    csv_path, pickle_path = str(tmp_path / "memory.csv"), str(tmp_path / "memory.pkl")
+    for i, batch in enumerate(batches):
+        writer = reviews.ReviewWriter(csv_path, pickle_path, merge=i > 0)
+        for review in batch:
+            writer.add(review)
+        writer.close()
+    return csv_path, pickle_path
+
+
+def write_streamed(tmp_path, batches):
+    csv_path, parquet_path = str(tmp_path / "streamed.csv"), str(tmp_path / "streamed.parquet")
+    for i, batch in enumerate(batches):
+        writer = reviews.ReviewWriter(csv_path, None, merge=i > 0, parquet_path=parquet_path)
+        for review in batch:
+            writer.add(review)
+        writer.close()
+    return csv_path, parquet_path
+
+
+@pytest.mark.skipif(not dataset.PARQUET_AVAILABLE, reason="requires pyarrow")
+@pytest.mark.parametrize("batches", [[VARIED], [VARIED[:5], VARIED[3:]]], ids=["new", "merged"])
+def test_streamed_close_writes_the_same_dataset_in_chunks(tmp_path, monkeypatch, batches):
+    monkeypatch.setattr(reviews, "CLOSE_CHUNK_SIZE", 3)
+
+    memory_csv, pickle_path = write_in_memory(tmp_path, batches)
+    streamed_csv, parquet_path = write_streamed(tmp_path, batches)
+
+    with open(memory_csv, encoding="utf-8") as f, open(streamed_csv, encoding="utf-8") as g:
+        assert f.read() == g.read()
+
+    expected = pandas.read_pickle(pickle_path)
+    actual = utils.load_reviews(path=parquet_path)
+    assert list(actual[Review.ID]) == list(expected[Review.ID])
+    assert list(actual[Review.REVIEWER_GENDER]) == list(expected[Review.REVIEWER_GENDER])
+    # resolved from review 5, which is written in a later chunk
+    assert actual.at[1, Review.REVIEWER_GENDER] == reviews.GENDER_FEMALE
+    assert list(actual[Review.TEXT]) == list(expected[Review.TEXT])
+
+    expected_index = keyword_index.KeywordIndex.load(keyword_index.path_for(pickle_path))
+    actual_index = keyword_index.KeywordIndex.load(keyword_index.path_for(parquet_path))
+    for name in ["vocabulary", "review_ids", "offsets", "codes"]:
+        assert list(getattr(actual_index, name)) == list(getattr(expected_index, name))
+
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        ["memory.csv", "memory.pkl", "memory-keywords.npz", "streamed.csv", "streamed.parquet",
+         "streamed-keywords.npz", "streamed-text.bin", "streamed-text.bin.idx.npy"])
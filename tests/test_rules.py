@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from features import check_parser, reviews
+from test_parsers import BODIES, PAGE
+
+
+def test_rules_are_loaded_once_per_process(monkeypatch):
+    loaded = []
+    load = reviews.ExtractionRules.load
+
+    def counting_load():
+        loaded.append(1)
+        return load()
+
+    monkeypatch.setattr(reviews, "_rules", None)
+    monkeypatch.setattr(reviews.ExtractionRules, "load", staticmethod(counting_load))
+
+    for review_id, body in enumerate(BODIES.values()):
+        reviews.process_document(review_id, PAGE.format(body=body))
+
+    assert len(loaded) == 1
+
+
+def test_shared_rules_give_the_same_rows_as_fresh_rules():
+    shared = reviews.get_rules()
+
+    for review_id, body in enumerate(BODIES.values()):
+        page = PAGE.format(body=body)
+        fresh = reviews.process_document(review_id, page, rules=reviews.ExtractionRules.load())
+        assert check_parser.compare_reviews(fresh, reviews.process_document(review_id, page, rules=shared)) == []
+
+
+def test_fingerprint_depends_on_the_resources():
+    rules = reviews.ExtractionRules(["Dr."], ["example.org"], ["Köln"])
+
+    assert rules.fingerprint() == reviews.ExtractionRules(["Dr."], ["example.org"], ["Köln"]).fingerprint()
+    assert rules.fingerprint() != reviews.ExtractionRules(["Dr."], ["example.org"], ["Bonn"]).fingerprint()
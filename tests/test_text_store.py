@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import text_store
+
+
+def test_texts_are_read_back(tmp_path):
+    path = str(tmp_path / "reviews-text.bin")
+    texts = {5: "Zweite Rezension", 1: "Erste Rezension über Köln", 3: None, 8: "", 2: "„Praxis“ 🙂"}
+    text_store.write(path, list(texts), list(texts.values()))
+
+    store = text_store.TextStore(path)
+    try:
+        assert list(store.ids()) == [1, 2, 5, 8]
+        for review_id, text in texts.items():
+            assert store.get(review_id) == text
+        assert bytes(store.get_bytes(2)) == texts[2].encode("utf-8")
+        assert 3 not in store and store.get(4, "fehlt") == "fehlt"
+    finally:
+        store.close()
+
+
+def test_batches_give_the_same_store(tmp_path):
+    ids = [7, 3, 9, 1, 4]
+    texts = [f"Text {review_id}" for review_id in ids]
+    text_store.write(str(tmp_path / "whole.bin"), ids, texts)
+
+    writer = text_store.TextStoreWriter(str(tmp_path / "batches.bin"))
+    writer.add(ids[:2], texts[:2])
+    writer.add(ids[2:], texts[2:])
+    writer.close()
+
+    whole = text_store.TextStore(str(tmp_path / "whole.bin"))
+    batches = text_store.TextStore(str(tmp_path / "batches.bin"))
+    try:
+        assert list(batches.ids()) == list(whole.ids())
+        assert [batches.get(i) for i in ids] == [whole.get(i) for i in ids] == texts
+    finally:
+        whole.close()
+        batches.close()
+
+
+def test_empty_store(tmp_path):
+    path = str(tmp_path / "reviews-text.bin")
+    text_store.write(path, [], [])
+
+    store = text_store.TextStore(path)
+    assert len(store) == 0 and store.get(1) is None
+    store.close()